@@ -0,0 +1,104 @@
+'''
+Tasks/sec of a worker with a single prefork child, for an I/O-bound task
+written blocking and then as `async def`
+
+The blocking task holds the child for its whole latency, the process runs
+one call at a time. The async task is awaited on the event loop of the
+worker (see `project.celery_utils.AsyncTask`), the child stays free and up
+to ASYNC_TASK_CONCURRENCY calls wait on their I/O together
+
+Runs a real worker on the in memory broker of IN_PROCESS_MODE, each task
+makes `--calls` I/O calls of `--latency` seconds, one after the other or
+awaited together
+
+$ python benchmarks/bench_async_tasks.py --latency 0.05 --calls 1 --tasks 400
+'''
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--calls', type=int, default=1)
+    parser.add_argument('--tasks', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=1)
+    options = parser.parse_args()
+
+    os.environ['FASTAPI_CONFIG'] = 'testing'
+    os.environ['IN_PROCESS_MODE'] = '1'
+
+    from celery.signals import task_postrun
+    from celery.utils.nodenames import anon_nodename
+    from celery.worker import state
+
+    from project import create_app
+    from project.celery_utils import custom_celery_task
+    from project.config import settings
+    from project.users.tasks import task_postrun_handler
+
+    # status broadcasts are not what is measured
+    task_postrun.disconnect(task_postrun_handler)
+    celery_app = create_app().celery_app
+
+    # defined before the pool forks, so its children know them
+    @custom_celery_task(name='bench_blocking_io')
+    def blocking_io():
+        for _ in range(options.calls):
+            time.sleep(options.latency)
+
+    @custom_celery_task(name='bench_async_io')
+    async def async_io():
+        await asyncio.gather(*(
+            asyncio.sleep(options.latency) for _ in range(options.calls)
+        ))
+
+    def run(task):
+        for _ in range(options.tasks):
+            task.apply_async(queue='default')
+
+        ready = threading.Event()
+        worker = celery_app.WorkController(
+            app=celery_app,
+            hostname=anon_nodename(),
+            pool='prefork',
+            concurrency=options.concurrency,
+            queues=[queue.name for queue in settings.CELERY_TASK_QUEUES],
+            without_heartbeat=True,
+            without_mingle=True,
+            without_gossip=True,
+            ready_callback=lambda *args: ready.set()
+        )
+        thread = threading.Thread(target=worker.start, daemon=True)
+        thread.start()
+        ready.wait(30)
+        started = time.perf_counter()
+        # results stored by a prefork child stay in its memory, the calls
+        # are counted done once the worker no longer holds any
+        while state.total_count[task.name] < options.tasks or \
+                state.reserved_requests:
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - started
+        state.should_terminate = 0
+        thread.join(30)
+        state.should_terminate = None
+        return options.tasks / elapsed
+
+    blocking_rate = run(blocking_io)
+    async_rate = run(async_io)
+
+    print(f'simulated I/O latency:  {options.latency * 1000:.0f} ms '
+          f'x {options.calls} calls per task')
+    print(f'prefork pool:           {options.concurrency} processes')
+    print(f'blocking tasks:         {blocking_rate:.1f} tasks/sec')
+    print(f'async tasks:            {async_rate:.1f} tasks/sec')
+
+
+if __name__ == '__main__':
+    main()
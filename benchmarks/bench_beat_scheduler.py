@@ -0,0 +1,87 @@
+'''
+Tick cost of DatabaseScheduler against a naive scan of every schedule
+
+$ python benchmarks/bench_beat_scheduler.py --schedules 100000
+'''
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schedules', type=int, default=100_000)
+    parser.add_argument('--ticks', type=int, default=200)
+    # run times are whole multiples of this, so many schedules share one,
+    # as they do when created together (more than a batch at the default)
+    parser.add_argument('--resolution', type=float, default=60.0)
+    options = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    from celery import Celery
+    from project.database import Base, engine, db_context
+    from project.beat.models import PeriodicTask
+    from project.beat.schedulers import DatabaseScheduler
+
+    Base.metadata.create_all(bind=engine)
+
+    now = datetime.utcnow()
+    rows = [{
+        'name': f'tenant-{i}',
+        'task': 'task_schedule_work',
+        'args': [],
+        'kwargs': {},
+        'interval': 3600.0,
+        'enabled': True,
+        'next_run_at': now + timedelta(seconds=(
+            random.uniform(-5, 3600) // options.resolution) * options.resolution),
+        'version': time.time_ns()
+    } for i in range(options.schedules)]
+    with engine.begin() as connection:
+        connection.execute(PeriodicTask.__table__.insert(), rows)
+
+    app = Celery(set_as_current=False)
+    app.conf.beat_schedule = {}
+    sent = []
+
+    scheduler = DatabaseScheduler(app=app)
+    scheduler.producer = None
+    scheduler.send_task = lambda *args, **kwargs: sent.append(args[0])
+
+    started = time.perf_counter()
+    scheduler.tick()
+    first_tick = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(options.ticks):
+        scheduler.tick()
+    steady_tick = (time.perf_counter() - started) / options.ticks
+
+    # what a scheduler without the index and heap does on every tick
+    started = time.perf_counter()
+    with db_context() as session:
+        due = [
+            row for row in session.query(PeriodicTask)
+            if row.enabled and row.next_run_at <= datetime.utcnow()
+        ]
+    full_scan_tick = time.perf_counter() - started
+
+    print(f'schedules:              {options.schedules}')
+    print(f'entries in window:      {len(scheduler._entries)}')
+    print(f'tasks sent:             {len(sent)}')
+    print(f'due at full scan:       {len(due)}  (left unsent, should be 0)')
+    print(f'first tick (window):    {first_tick * 1000:.2f} ms')
+    print(f'steady tick:            {steady_tick * 1000:.2f} ms')
+    print(f'full scan tick:         {full_scan_tick * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+'''
+Page latency of keyset pagination against OFFSET, from page 1 to 10,000
+
+$ python benchmarks/bench_keyset_pagination.py --rows 1000000
+'''
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def timed(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--limit', type=int, default=50)
+    options = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    from project.database import Base, engine, db_context, keyset_paginate
+    from project.users.models import User
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for start in range(0, options.rows, 100_000):
+            connection.execute(User.__table__.insert(), [
+                {'username': f'user{i}', 'email': f'user{i}@example.com'}
+                for i in range(start, min(start + 100_000, options.rows))
+            ])
+
+    pages = [p for p in (1, 10, 100, 1_000, 10_000)
+             if (p - 1) * options.limit < options.rows]
+
+    print(f'rows: {options.rows}, page size: {options.limit}')
+    print(f'{"page":>8} {"keyset ms":>10} {"offset ms":>10}')
+    with db_context() as session:
+        query = session.query(User)
+        for page in pages:
+            # ids are dense here, so the cursor for page N is known upfront
+            cursor = (page - 1) * options.limit or None
+            keyset = timed(
+                lambda: keyset_paginate(query, User.id, cursor, options.limit))
+            offset = timed(
+                lambda: query.order_by(User.id)
+                .offset((page - 1) * options.limit)
+                .limit(options.limit).all())
+            print(f'{page:>8} {keyset:>10.2f} {offset:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+'''
+Throughput of one worker on short, long and mixed queues with the prefetch
+multiplier fixed at 1 (the global setting so far), fixed at
+PREFETCH_MAX_MULTIPLIER, and tuned by project.prefetch
+
+Runs the in process worker (memory broker, thread pool) with every fetched
+message delayed by --rtt, the broker round trip a prefetched message no
+longer waits for. `held` is the most messages the worker had reserved
+without running them, what it keeps from other workers and what a crash
+has redelivered
+
+The worker fetches one message per round trip, as with the Redis broker,
+prefetch pays off when a pool slot would otherwise sit idle for that round
+trip between two tasks
+
+$ python benchmarks/bench_prefetch.py --fakeredis
+'''
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rtt', type=float, default=0.002)
+    parser.add_argument('--short', type=float, default=0.005)
+    parser.add_argument('--long', type=float, default=0.05)
+    parser.add_argument('--short-tasks', type=int, default=1000)
+    parser.add_argument('--long-tasks', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=2)
+    # no Redis server at hand, keep the runtime averages in fakeredis
+    parser.add_argument('--fakeredis', action='store_true')
+    options = parser.parse_args()
+
+    os.environ['FASTAPI_CONFIG'] = 'testing'
+    os.environ['IN_PROCESS_MODE'] = '1'
+
+    from celery import shared_task
+    from celery.signals import task_postrun
+    from celery.worker import state
+    from kombu.transport import memory
+
+    from project import create_app, prefetch, redis_utils
+    from project.config import settings
+    from project.in_process import InProcessWorker
+    from project.users.tasks import task_postrun_handler
+
+    if options.fakeredis:
+        import fakeredis
+        redis_utils._clients[settings.REDIS_URL] = fakeredis.FakeRedis()
+    # status broadcasts are not what is measured
+    task_postrun.disconnect(task_postrun_handler)
+
+    celery_app = create_app().celery_app
+    settings.PREFETCH_TUNE_INTERVAL = 0.1
+    prefetch.recorder.flush_interval = 0.05
+
+    get = memory.Channel._get
+
+    def get_after_round_trip(self, queue, timeout=None):
+        message = get(self, queue, timeout)
+        time.sleep(options.rtt)
+        return message
+
+    memory.Channel._get = get_after_round_trip
+
+    finished = threading.Semaphore(0)
+
+    @shared_task(name='bench_prefetch_short')
+    def short_task():
+        time.sleep(options.short)
+        finished.release()
+
+    @shared_task(name='bench_prefetch_long')
+    def long_task():
+        time.sleep(options.long)
+        finished.release()
+
+    def run(tasks, multiplier, tuned):
+        redis_utils.get_redis_client().delete(prefetch.RUNTIME_KEY)
+        prefetch.recorder._reset()
+        settings.PREFETCH_TUNING_ENABLED = tuned
+        # the namespaced key is the one the app reads
+        settings.CELERY_WORKER_PREFETCH_MULTIPLIER = multiplier
+        celery_app.conf.CELERY_WORKER_PREFETCH_MULTIPLIER = multiplier
+        for task in tasks:
+            task.apply_async(queue='default')
+
+        held, sampling = [0], [True]
+
+        def sample():
+            while sampling[0]:
+                held[0] = max(held[0], len(state.reserved_requests) -
+                              len(state.active_requests))
+                time.sleep(0.001)
+
+        worker = InProcessWorker(celery_app, options.concurrency)
+        started = time.perf_counter()
+        worker.start()
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        for _ in tasks:
+            finished.acquire()
+        elapsed = time.perf_counter() - started
+        sampling[0] = False
+        sampler.join()
+        worker.stop()
+        return len(tasks) / elapsed, held[0]
+
+    every = max(1, options.short_tasks // options.long_tasks)
+    workloads = {
+        'short': [short_task] * options.short_tasks,
+        'long': [long_task] * options.long_tasks,
+        'mixed': [long_task if i % every == 0 else short_task
+                  for i in range(options.short_tasks)],
+    }
+    modes = {
+        'x1': (1, False),
+        f'x{settings.PREFETCH_MAX_MULTIPLIER}':
+            (settings.PREFETCH_MAX_MULTIPLIER, False),
+        'tuned': (1, True),
+    }
+
+    print(f'broker round trip {options.rtt * 1000:.1f} ms, '
+          f'{options.concurrency} threads, short {options.short * 1000:.1f} '
+          f'ms, long {options.long * 1000:.0f} ms')
+    for workload, tasks in workloads.items():
+        for mode, (multiplier, tuned) in modes.items():
+            rate, held = run(tasks, multiplier, tuned)
+            print(f'{workload:<6} {mode:<6} {rate:8.1f} tasks/sec   '
+                  f'held {held}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+'''
+Rows per second of the bulk user import, one worker process running the
+chunk tasks back to back against SQLite
+
+$ python benchmarks/bench_user_import.py --rows 1000000 --chunk-size 10000
+'''
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    options = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{directory}/bench.sqlite3'
+
+    from project.database import Base, engine, db_context
+    from project.users.imports import import_chunk, plan_chunks
+    from project.users.models import User, UserImport
+
+    Base.metadata.create_all(bind=engine)
+
+    csv_path = os.path.join(directory, 'users.csv')
+    with open(csv_path, 'w') as file_object:
+        file_object.write('username,email\n')
+        for i in range(options.rows):
+            file_object.write(f'user{i},user{i}@example.com\n')
+
+    started = time.perf_counter()
+    columns, chunks = plan_chunks(csv_path, options.chunk_size)
+    planned = time.perf_counter() - started
+
+    with db_context() as session:
+        user_import = UserImport(
+            filename='users.csv', path=csv_path, columns=columns,
+            chunk_size=options.chunk_size, total_chunks=len(chunks))
+        session.add(user_import)
+        session.commit()
+
+        started = time.perf_counter()
+        for chunk, (start, end) in enumerate(chunks):
+            import_chunk(session, user_import, chunk, start, end)
+        imported = time.perf_counter() - started
+
+        count = session.query(User).count()
+
+    print(f'rows: {options.rows}, chunk size: {options.chunk_size}, '
+          f'chunks: {len(chunks)}')
+    print(f'plan: {planned:.2f}s')
+    print(f'import: {imported:.2f}s, {count / imported:,.0f} rows/sec')
+
+
+if __name__ == '__main__':
+    main()
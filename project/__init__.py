@@ -4,12 +4,22 @@ from broadcaster import Broadcast
 from project.config import settings
 
 
-broadcast = Broadcast(settings.WS_MESSAGE_QUEUE)
+if settings.IN_PROCESS_MODE:
+    from project.in_process import InProcessBroadcast
+    broadcast = InProcessBroadcast()
+else:
+    broadcast = Broadcast(settings.WS_MESSAGE_QUEUE)
+# task status channels live on the Redis shard of their task id
+shard_broadcasts = {url: Broadcast(url) for url in settings.REDIS_SHARD_URLS}
 
 
 def create_app() -> FastAPI:
     app = FastAPI()
 
+    # reads stay on the primary for a client that has just written
+    from project.database import ReadYourWritesMiddleware
+    app.add_middleware(ReadYourWritesMiddleware)
+
     from project.logging import configure_logging
     configure_logging()
 
@@ -26,16 +36,33 @@ def create_app() -> FastAPI:
     from project.ws import ws_router
     app.include_router(ws_router)
 
+    from project.task_events import task_events_router
+    app.include_router(task_events_router)
+
+    from project.beat import models  # noqa
+
     from project.ws.views import register_socketio_app
     register_socketio_app(app)
 
+    if settings.IN_PROCESS_MODE:
+        from project.in_process import InProcessWorker
+        app.in_process_worker = InProcessWorker(app.celery_app)
+
     @app.on_event('startup')
     async def startup_event():
         await broadcast.connect()
+        for shard_broadcast in shard_broadcasts.values():
+            await shard_broadcast.connect()
+        if settings.IN_PROCESS_MODE:
+            app.in_process_worker.start()
 
     @app.on_event('shutdown')
     async def shutdown_event():
         await broadcast.disconnect()
+        for shard_broadcast in shard_broadcasts.values():
+            await shard_broadcast.disconnect()
+        if settings.IN_PROCESS_MODE:
+            app.in_process_worker.stop()
 
     @app.get('/')
     async def root():
@@ -0,0 +1,116 @@
+import time
+import logging
+import threading
+from collections import defaultdict
+
+from celery import current_app as current_celery_app
+from fastapi import HTTPException
+from kombu.exceptions import ChannelError
+
+from project.config import settings, route_task
+from project.redis_utils import get_redis_client
+from project.sharding import queue_broker_url
+
+
+logger = logging.getLogger(__name__)
+
+SHED_KEY = 'backpressure:shed'
+
+
+class QueueDepthMonitor:
+    '''
+    Broker queue depths, re-sampled at most once per `interval` seconds by
+    whichever request finds the sample stale, others read the cached values
+
+    Sampling errors fail open, the route keeps accepting work
+    '''
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._depths = {}
+        self._sampled_at = 0.0
+        self._lock = threading.Lock()
+
+    def depth(self, queue):
+        if time.monotonic() - self._sampled_at >= self.interval:
+            self.sample()
+        return self._depths.get(queue, 0)
+
+    def sample(self):
+        if not self._lock.acquire(blocking=False):
+            return  # another thread is sampling
+        try:
+            self._depths = self._read_depths()
+        except Exception:
+            # stale depths would keep shedding for as long as the broker is
+            # unreachable
+            self._depths = {}
+            logger.exception('Could not sample broker queue depths')
+        finally:
+            self._sampled_at = time.monotonic()
+            self._lock.release()
+
+    def _read_depths(self):
+        by_broker = defaultdict(list)
+        for queue in settings.BACKPRESSURE_QUEUE_THRESHOLDS:
+            by_broker[queue_broker_url(queue)].append(queue)
+
+        depths = {}
+        for url, queues in by_broker.items():
+            with current_celery_app.connection_for_read(url) as connection:
+                channel = connection.default_channel
+                for queue in queues:
+                    try:
+                        depths[queue] = channel.queue_declare(
+                            queue, passive=True).message_count
+                    except ChannelError:
+                        depths[queue] = 0  # never declared, nothing waiting
+        return depths
+
+
+monitor = QueueDepthMonitor(settings.BACKPRESSURE_SAMPLE_INTERVAL)
+
+
+def record_shed(queue):
+    try:
+        get_redis_client().hincrby(SHED_KEY, queue, 1)
+    except Exception:
+        logger.exception('Could not record shed request for %s', queue)
+
+
+def get_shed_counts():
+    return {
+        queue.decode(): int(count)
+        for queue, count in get_redis_client().hgetall(SHED_KEY).items()
+    }
+
+
+def admit(*tasks):
+    '''
+    Route dependency answering 503 with Retry-After while a queue the
+    route enqueues to is deeper than its threshold
+
+    @users_router.post('/form/', dependencies=[Depends(admit(sample_task))])
+    '''
+    queues = {
+        route_task(task.name, (), {}, {})['queue'] for task in tasks
+    }
+
+    def admission_control():
+        if not settings.BACKPRESSURE_ENABLED:
+            return
+        for queue in queues:
+            threshold = settings.BACKPRESSURE_QUEUE_THRESHOLDS.get(queue)
+            if threshold is None or monitor.depth(queue) <= threshold:
+                continue
+
+            record_shed(queue)
+            logger.warning('Shedding request, queue %s is over %s',
+                           queue, threshold)
+            raise HTTPException(
+                status_code=settings.BACKPRESSURE_STATUS_CODE,
+                detail=f'Queue {queue} is overloaded, try again later',
+                headers={'Retry-After': str(settings.BACKPRESSURE_RETRY_AFTER)}
+            )
+
+    return admission_control
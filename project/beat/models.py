@@ -0,0 +1,37 @@
+import time
+from sqlalchemy import (
+    JSON, BigInteger, Boolean, Column, DateTime, Float, Index, Integer,
+    String, event
+)
+
+from project.database import Base
+
+
+class PeriodicTask(Base):
+    __tablename__ = 'beat_schedules'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(200), unique=True, nullable=False)
+    task = Column(String(200), nullable=False)
+    args = Column(JSON, nullable=False, default=list)
+    kwargs = Column(JSON, nullable=False, default=dict)
+    queue = Column(String(128), nullable=True)
+
+    interval = Column(Float, nullable=False)  # seconds
+    enabled = Column(Boolean, nullable=False, default=True)
+
+    next_run_at = Column(DateTime, nullable=False)  # UTC
+    last_run_at = Column(DateTime, nullable=True)
+
+    # bumped on every ORM write, lets beat pick up changes incrementally
+    version = Column(BigInteger, nullable=False, index=True, default=0)
+
+    __table_args__ = (
+        Index('ix_beat_schedules_enabled_next_run_at', 'enabled', 'next_run_at'),
+    )
+
+
+@event.listens_for(PeriodicTask, 'before_insert')
+@event.listens_for(PeriodicTask, 'before_update')
+def bump_version(mapper, connection, target):
+    target.version = time.time_ns()
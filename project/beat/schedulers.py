@@ -0,0 +1,216 @@
+import time
+import heapq
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from celery.beat import Scheduler
+from sqlalchemy import bindparam, func
+
+from project.config import settings
+from project.database import db_context
+from project.beat.models import PeriodicTask
+
+
+logger = logging.getLogger(__name__)
+
+Entry = namedtuple(
+    'Entry', 'id name task args kwargs queue interval version')
+
+
+def to_timestamp(value: datetime) -> float:
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+
+def to_datetime(timestamp: float) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(seconds=timestamp)
+
+
+class DatabaseScheduler(Scheduler):
+    '''
+    Beat scheduler backed by the `beat_schedules` table
+
+    Only entries due within the lookahead window are read (through the
+    `enabled, next_run_at` index) into a local min-heap, and edits are
+    picked up through the `version` column, so a tick never scans
+    every schedule.
+
+    $ celery -A main.celery beat -S project.beat.schedulers:DatabaseScheduler
+    '''
+
+    def __init__(self, *args, **kwargs):
+        self.lookahead = settings.BEAT_SCHEDULER_LOOKAHEAD
+        self.batch_size = settings.BEAT_SCHEDULER_BATCH_SIZE
+        self.sync_interval = settings.BEAT_SCHEDULER_SYNC_INTERVAL
+        self._entries = {}
+        self._horizon = 0.0
+        # entries up to this (run at, id) are in the heap, see _load_window
+        self._horizon_key = (0.0, 0)
+        self._version = 0
+        super().__init__(*args, **kwargs)
+        self._heap = []
+
+    def setup_schedule(self):
+        # seed the static `CELERY_BEAT_SCHEDULE` entries once
+        beat_schedule = self.app.conf.beat_schedule or {}
+        with db_context() as session:
+            existing = {
+                name for name, in session.query(PeriodicTask.name).filter(
+                    PeriodicTask.name.in_(list(beat_schedule)))
+            }
+            for name, entry in beat_schedule.items():
+                if name in existing:
+                    continue
+                interval = entry['schedule']
+                if isinstance(interval, timedelta):
+                    interval = interval.total_seconds()
+                if not isinstance(interval, (int, float)):
+                    logger.warning('Skipping non-interval schedule %s', name)
+                    continue
+                session.add(PeriodicTask(
+                    name=name,
+                    task=entry['task'],
+                    args=list(entry.get('args', ())),
+                    kwargs=dict(entry.get('kwargs', {})),
+                    queue=entry.get('options', {}).get('queue'),
+                    interval=interval,
+                    next_run_at=datetime.utcnow()
+                ))
+            session.commit()
+
+    def tick(self, *args, **kwargs):
+        now = time.time()
+        if now >= self._horizon:
+            self._load_window(now)
+        else:
+            self._sync_changes()
+
+        updates = []
+        while self._heap and self._heap[0][0] <= now and \
+                len(updates) < self.batch_size:
+            run_at, entry_id, version = heapq.heappop(self._heap)
+            entry = self._entries.get(entry_id)
+            if entry is None or entry.version != version:
+                continue  # stale heap item, the entry changed or left
+
+            self._apply(entry)
+
+            next_run_at = run_at + entry.interval
+            if next_run_at <= now:
+                next_run_at = now + entry.interval
+            updates.append({
+                '_id': entry.id,
+                '_version': entry.version,
+                'next_run_at': to_datetime(next_run_at),
+                'last_run_at': to_datetime(now)
+            })
+            self._schedule(entry, next_run_at)
+
+        if updates:
+            self._save(updates)
+        if len(updates) >= self.batch_size:
+            return 0
+
+        next_event = self._heap[0][0] if self._heap else self._horizon
+        return min(max(next_event - time.time(), 0.0),
+                   self.sync_interval, self.max_interval)
+
+    def _apply(self, entry):
+        options = {'queue': entry.queue} if entry.queue else {}
+        try:
+            self.send_task(
+                entry.task, entry.args, entry.kwargs,
+                producer=self.producer, **options)
+        except Exception:
+            logger.exception('Could not apply scheduled task %s', entry.name)
+
+    def _schedule(self, entry, run_at):
+        self._entries[entry.id] = entry
+        if (run_at, entry.id) < self._horizon_key:
+            heapq.heappush(self._heap, (run_at, entry.id, entry.version))
+        else:
+            # reloaded once the window moves past it
+            self._entries.pop(entry.id)
+
+    def _load_window(self, now):
+        horizon = now + self.lookahead
+        with db_context() as session:
+            self._version = max(
+                self._version,
+                session.query(func.max(PeriodicTask.version)).scalar() or 0
+            )
+            rows = session.query(PeriodicTask).filter(
+                PeriodicTask.enabled.is_(True),
+                PeriodicTask.next_run_at < to_datetime(horizon)
+            ).order_by(
+                PeriodicTask.next_run_at, PeriodicTask.id
+            ).limit(self.batch_size).all()
+
+            # ids are positive, (horizon, 0) excludes everything at horizon
+            horizon_key = (horizon, 0)
+            if len(rows) == self.batch_size:
+                # the window ends at the last row loaded, ties on its
+                # timestamp are split by id so a full batch of them still
+                # runs and the next load starts after it
+                horizon = to_timestamp(rows[-1].next_run_at)
+                horizon_key = (horizon, rows[-1].id + 1)
+
+            self._heap = []
+            self._entries = {}
+            self._horizon = horizon
+            self._horizon_key = horizon_key
+            for row in rows:
+                self._schedule(self._to_entry(row), to_timestamp(row.next_run_at))
+
+        logger.debug('beat: loaded %s entries due before %s',
+                     len(self._entries), horizon)
+
+    def _sync_changes(self):
+        with db_context() as session:
+            # a write that commits after a newer version was seen (or comes
+            # from a host with a skewed clock) is reconciled by the next
+            # window reload, at most `lookahead` seconds later
+            rows = session.query(PeriodicTask).filter(
+                PeriodicTask.version > self._version
+            ).order_by(PeriodicTask.version).limit(self.batch_size).all()
+
+            for row in rows:
+                self._version = max(self._version, row.version)
+                known = self._entries.get(row.id)
+                if known and known.version == row.version:
+                    continue
+                self._entries.pop(row.id, None)
+                if row.enabled:
+                    self._schedule(
+                        self._to_entry(row), to_timestamp(row.next_run_at))
+
+    def _save(self, updates):
+        table = PeriodicTask.__table__
+        statement = table.update().where(
+            table.c.id == bindparam('_id'),
+            # an edit made since we loaded the entry wins
+            table.c.version == bindparam('_version')
+        ).values(
+            next_run_at=bindparam('next_run_at'),
+            last_run_at=bindparam('last_run_at')
+        )
+        with db_context() as session:
+            session.execute(statement, updates)
+            session.commit()
+
+    @staticmethod
+    def _to_entry(row):
+        return Entry(
+            id=row.id,
+            name=row.name,
+            task=row.task,
+            args=row.args or [],
+            kwargs=row.kwargs or {},
+            queue=row.queue,
+            interval=row.interval,
+            version=row.version
+        )
+
+    @property
+    def info(self):
+        return f'    . db -> {settings.DATABASE_URL}'
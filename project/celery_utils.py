@@ -1,15 +1,58 @@
+import os
+import time
+import asyncio
+import inspect
+import contextvars
+import logging
 import functools
+import threading
 
+from billiard.einfo import ExceptionInfo
+from celery.app.task import Context
+from celery.app.trace import TraceInfo
+from celery.canvas import signature
 from celery.result import AsyncResult
-from celery.utils.time import get_exponential_backoff_interval
-from celery import current_app as current_celery_app, shared_task
+from kombu.asynchronous.timer import to_timestamp
+from kombu.utils.json import dumps, loads
+from celery.utils import uuid
+from celery.worker.request import Request
+from celery.worker.state import task_reserved
+from celery.worker.strategy import hybrid_to_proto2
+from celery.exceptions import Ignore, Retry
+from celery.signals import (
+    before_task_publish, task_postrun, task_prerun, task_success
+)
+from celery.utils.time import get_exponential_backoff_interval, timezone
+from celery import current_app as current_celery_app, shared_task, states
 
-from project.config import settings
+from project import backpressure
+from project.config import route_task, settings
+from project.database import (
+    end_write_scope, keyset_paginate, last_write_time, read_db_context,
+    start_write_scope
+)
+from project.deadline import (
+    DEADLINE_HEADER, count_expired, deadline_scope, is_expired
+)
+from project.delayed import DelayedDeliveryTask
+from project.memoize import MISSING, TaskMemoizer, make_cache_key
+from project.rate_limit import throttle
+from project.redis_utils import get_redis_client
+
+
+logger = logging.getLogger(__name__)
 
 
 def create_celery():
     celery_app = current_celery_app
     celery_app.config_from_object(settings, namespace='CELERY')
+    # publishes queues listed in QUEUE_REDIS_NODES to their own broker
+    celery_app.amqp_cls = 'project.sharding:ShardedAMQP'
+
+    from project import dead_letter, exports, worker_memory  # noqa
+    from project.prefetch import PrefetchTuner
+    celery_app.steps['consumer'].add(PrefetchTuner)
+    from project.task_events import recorder  # noqa
 
     return celery_app
 
@@ -26,6 +69,315 @@ def get_task_info(task_id):
     return response
 
 
+@before_task_publish.connect
+def attach_last_write(headers=None, **kwargs):
+    # lets the worker keep reads on the primary for read-your-writes
+    last_write = last_write_time()
+    if headers is not None and \
+            time.time() - last_write < settings.DATABASE_READ_YOUR_WRITES_WINDOW:
+        headers['db_last_write'] = last_write
+
+
+@task_prerun.connect
+def restore_last_write(task=None, **kwargs):
+    start_write_scope(getattr(task.request, 'db_last_write', None))
+
+
+@task_postrun.connect
+def clear_last_write(**kwargs):
+    end_write_scope()
+
+
+class EventLoopThread:
+    '''
+    One event loop per process, running in a background thread
+
+    The worker awaits the calls of `async def` tasks on it, up to
+    `concurrency` at once per process whatever the pool, see `AsyncTask`.
+    Code running outside the loop waits on a coroutine with `run`
+    '''
+
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # the loop thread does not survive a fork, start a new one lazily
+        self._loop = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = None
+                threading.Thread(
+                    target=self._loop.run_forever,
+                    name='celery-event-loop',
+                    daemon=True
+                ).start()
+            return self._loop
+
+    def submit(self, coro):
+        '''
+        Schedule `coro` on the loop, returns a `concurrent.futures.Future`
+        '''
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        return self.submit(self._limited(coro)).result(timeout)
+
+    async def _limited(self, coro):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            return await coro
+
+
+event_loop_thread = EventLoopThread(settings.ASYNC_TASK_CONCURRENCY)
+
+
+class DeadlineTask(DelayedDeliveryTask):
+    '''
+    A call still queued past its `deadline` header is skipped without
+    running, otherwise the deadline is the current one while it runs (and
+    so reaches the tasks it sends), see project.deadline
+
+    `deadline_budget` gives calls sent without a deadline one that many
+    seconds from when they are sent
+    '''
+
+    deadline_budget = None
+
+    def __call__(self, *args, **kwargs):
+        with deadline_scope(self.check_deadline(self.request)):
+            return super().__call__(*args, **kwargs)
+
+    def check_deadline(self, request):
+        '''
+        The deadline of the call, raises Ignore when it has passed
+        '''
+        # custom headers are request attributes, except in eager mode
+        deadline = request.get(DEADLINE_HEADER) or \
+            (request.headers or {}).get(DEADLINE_HEADER)
+        if is_expired(deadline):
+            logger.info('Skipping %s[%s], its deadline passed %.1fs ago',
+                        self.name, request.id, time.time() - deadline)
+            count_expired(self.name)
+            # a final state, as celery stores for a call past its `expires`,
+            # or whoever waits on the result waits forever
+            if request.id and not request.is_eager:
+                self.backend.mark_as_revoked(
+                    request.id, 'deadline expired', request=request)
+            raise Ignore()
+        return deadline
+
+
+class AsyncTask(DeadlineTask):
+    '''
+    Task of an `async def` function. The worker awaits its calls on the
+    event loop of the process instead of handing them to the pool, so a
+    call waiting on I/O holds no pool thread or process, see
+    `async_strategy`
+
+    Called directly, eagerly or from the pool, the caller blocks on the
+    coroutine until it is done
+    '''
+
+    Strategy = 'project.celery_utils:async_strategy'
+
+    @property
+    def async_request(self):
+        '''
+        The request of the call awaited by the running coroutine
+        '''
+        return _async_request.get()
+
+    async def run_async(self, *args, **kwargs):
+        raise NotImplementedError  # given by `custom_celery_task`
+
+
+# request of the call each coroutine on the event loop is running
+_async_request = contextvars.ContextVar('async_request', default=None)
+
+
+async def in_request(task, request, func, /, *args, **kwargs):
+    '''
+    Run `func` in a thread, with `request` as the current request of `task`
+
+    The request of a task is per thread, concurrent coroutines on the loop
+    thread cannot share it
+    '''
+    def call():
+        task.request_stack.push(request)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            task.request_stack.pop()
+    return await asyncio.to_thread(call)
+
+
+def handle_error(task, request, exc, state):
+    # the tracer handlers read the exception being handled
+    try:
+        raise exc
+    except BaseException:
+        return TraceInfo(state, exc).handle_error_state(
+            task, request, call_errbacks=state == states.FAILURE)
+
+
+def store_success(task, request, retval):
+    # callbacks are sent before the result is stored, as the tracer does
+    root_id = request.root_id or request.id
+    for callback in request.callbacks or ():
+        signature(callback, app=task.app).apply_async(
+            (retval,), parent_id=request.id, root_id=root_id)
+    if request.chain:
+        chain = list(request.chain)
+        signature(chain.pop(), app=task.app).apply_async(
+            (retval,), chain=chain, parent_id=request.id, root_id=root_id)
+    task.backend.mark_as_done(
+        request.id, retval, request,
+        not (task.ignore_result or request.ignore_result))
+    task.on_success(retval, request.id, request.args, request.kwargs)
+    task_success.send(sender=task, result=retval)
+
+
+async def trace_async(task, request):
+    '''
+    What the celery tracer does for a call in the pool, for a call of an
+    `AsyncTask` on the event loop. Signals, result store and retries run in
+    threads, the loop only ever waits on the coroutines
+
+    Returns what the pool returns to the worker, (failed, result or
+    ExceptionInfo, runtime)
+    '''
+    started = time.monotonic()
+    state, retval, outcome = states.SUCCESS, None, None
+    await in_request(task, request, task_prerun.send, sender=task,
+                     task_id=request.id, task=task, args=request.args,
+                     kwargs=request.kwargs)
+    try:
+        deadline = await in_request(
+            task, request, task.check_deadline, request)
+        # reads of the coroutine stay on the primary after a recent write
+        start_write_scope(request.get('db_last_write'))
+        _async_request.set(request)
+        with deadline_scope(deadline):
+            retval = await event_loop_thread._limited(
+                task.run_async(*request.args, **request.kwargs))
+    except Ignore as exc:
+        state, retval = states.IGNORED, exc
+        outcome = ExceptionInfo(internal=True)
+        logger.info('Task %s[%s] ignored', task.name, request.id)
+    except Retry as exc:
+        state, retval = states.RETRY, exc
+        outcome = await in_request(task, request, handle_error, task,
+                                   request, exc, states.RETRY)
+    except Exception as exc:
+        state, retval = states.FAILURE, exc
+        outcome = await in_request(task, request, handle_error, task,
+                                   request, exc, states.FAILURE)
+    else:
+        try:
+            await in_request(task, request, store_success, task, request,
+                             retval)
+        except Exception as exc:
+            state, retval = states.FAILURE, exc
+            outcome = await in_request(task, request, handle_error, task,
+                                       request, exc, states.FAILURE)
+        else:
+            logger.info('Task %s[%s] succeeded in %ss: %r', task.name,
+                        request.id, time.monotonic() - started, retval)
+    finally:
+        await in_request(task, request, task_postrun.send, sender=task,
+                         task_id=request.id, task=task, args=request.args,
+                         kwargs=request.kwargs, retval=retval, state=state)
+
+    runtime = time.monotonic() - started
+    if outcome is not None:
+        return True, outcome, runtime
+    return False, retval, runtime
+
+
+# calls awaited on the loop hold no pool slot, so up to this many of them
+# prefetch past the limit of the pool
+async_prefetch = threading.Semaphore(settings.ASYNC_TASK_CONCURRENCY)
+
+
+def message_to_request(task, app, consumer, message, body, ack, reject):
+    if body is None and 'args' not in message.payload:
+        body, headers, decoded, utc = (
+            message.body, message.headers, False, app.uses_utc_timezone(),
+        )
+    else:
+        body, headers, decoded, utc = hybrid_to_proto2(message, message.payload)
+
+    return Request(
+        message, on_ack=ack, on_reject=reject, app=app,
+        hostname=consumer.hostname, task=task,
+        connection_errors=consumer.connection_errors, body=body,
+        headers=headers, decoded=decoded, utc=utc,
+    )
+
+
+def async_strategy(task, app, consumer, **kwargs):
+    revoked_tasks = consumer.controller.state.revoked
+
+    def start(request, prefetched):
+        _, _, embed = request._payload
+        context = Context(request.request_dict, called_directly=False,
+                          is_eager=False, **(embed or {}))
+        # acks now unless acks_late, and counts the call as active
+        request.on_accepted(os.getpid(), time.monotonic())
+        future = event_loop_thread.submit(trace_async(task, context))
+        future.add_done_callback(
+            functools.partial(finish, request, prefetched))
+
+    def finish(request, prefetched, future):
+        if prefetched:
+            async_prefetch.release()
+            consumer.qos.decrement_eventually()
+        try:
+            outcome = future.result()
+        except Exception:
+            logger.exception('Async task %s[%s] could not be traced',
+                             task.name, request.id)
+            return request.on_failure(ExceptionInfo())
+        # acks when acks_late, the ack itself is sent by the consumer
+        request.on_success(outcome)
+
+    def task_message_handler(message, body, ack, reject, callbacks, **kw):
+        request = message_to_request(
+            task, app, consumer, message, body, ack, reject)
+        if (request.expires or request.id in revoked_tasks) and \
+                request.revoked():
+            return
+        task_reserved(request)
+
+        if request.eta:
+            # waits in the timer as any ETA call, with prefetch to spare
+            if request.utc:
+                eta = to_timestamp(timezone.to_system(request.eta))
+            else:
+                eta = to_timestamp(request.eta, app.timezone)
+            consumer.qos.increment_eventually()
+            consumer.timer.call_at(eta, start, (request, False), priority=6)
+            consumer.timer.call_at(eta, consumer.qos.decrement_eventually,
+                                   priority=6)
+            return
+
+        prefetched = async_prefetch.acquire(blocking=False)
+        if prefetched:
+            consumer.qos.increment_eventually()
+        start(request, prefetched)
+
+    return task_message_handler
+
+
 class custom_celery_task:
 
     EXCEPTION_BLOCK_LIST = (
@@ -33,22 +385,92 @@ class custom_celery_task:
         TypeError,
         ValueError,
         IndexError,
-        UnicodeDecodeError
+        UnicodeDecodeError,
+        ArithmeticError  # the same arguments fail the same way again
     )
 
     def __init__(self, *args, **kwargs):
+        self.memoize = kwargs.pop('memoize', False)
+        self.memoizer = TaskMemoizer(
+            ttl=kwargs.pop('memoize_ttl', None),
+            max_entries=kwargs.pop('memoize_max_entries', None)
+        )
+        # destination host the task calls out to, see project.rate_limit
+        self.rate_limit_host = kwargs.pop('rate_limit_host', None)
+        # seconds a call has to start before it is skipped, unless the
+        # sender gave it a deadline
+        if 'deadline' in kwargs:
+            kwargs['deadline_budget'] = kwargs.pop('deadline')
         self.task_args = args
         self.task_kwargs = kwargs
 
     def __call__(self, func):
+        task_kwargs = dict(self.task_kwargs)
+        if inspect.iscoroutinefunction(func):
+            def call(*args, **kwargs):
+                return event_loop_thread.run(func(*args, **kwargs))
+
+            # awaited on the event loop by the worker
+            task_kwargs.setdefault('base', AsyncTask)
+            task_kwargs['run_async'] = self._async_wrapper(func)
+        else:
+            call = func
+        # retries are parked in Redis instead of worker memory, and calls
+        # past their deadline are skipped
+        task_kwargs.setdefault('base', DeadlineTask)
+
         @functools.wraps(func)
         def wrapper_func(*args, **kwargs):
-            # ... custom code goes here ...
-            return func(*args, **kwargs)
+            if self.rate_limit_host:
+                # outside the try, a reschedule is not a failure to back off
+                throttle(task_func, self.rate_limit_host)
+            try:
+                if self.memoize:
+                    key = make_cache_key(task_func.name, func, args, kwargs)
+                    return self.memoizer.get_or_compute(key, call, *args, **kwargs)
+                return call(*args, **kwargs)
+            except self.EXCEPTION_BLOCK_LIST:
+                # do not retry for those exceptions
+                raise
+            except Exception as e:
+                # here we add Exponential Backoff just like Celery
+                countdown = self._get_retry_countdown(task_func)
+                raise task_func.retry(exc=e, countdown=countdown)
 
-        task_func = shared_task(*self.task_args, **self.task_kwargs)(wrapper_func)
+        task_func = shared_task(*self.task_args, **task_kwargs)(wrapper_func)
         return task_func
 
+    def _async_wrapper(self, func):
+        # `wrapper_func` for the worker event loop, what reads the request
+        # of the call runs in a thread where it is the current one
+        async def run_async(task, *args, **kwargs):
+            request = task.async_request
+            if self.rate_limit_host:
+                await in_request(task, request, throttle, task,
+                                 self.rate_limit_host)
+            key = None
+            try:
+                if self.memoize:
+                    # no single flight, concurrent calls may all compute
+                    key = make_cache_key(task.name, func, args, kwargs)
+                    result = await asyncio.to_thread(self.memoizer.get, key)
+                    if result is not MISSING:
+                        return result
+                result = await func(*args, **kwargs)
+            except self.EXCEPTION_BLOCK_LIST:
+                raise
+            except Exception as e:
+                await in_request(task, request, self._retry, task, e)
+            if key is not None:
+                await asyncio.to_thread(self.memoizer.set, key, result)
+            return result
+
+        return run_async
+
+    def _retry(self, task_func, exc):
+        countdown = self._get_retry_countdown(task_func)
+        raise task_func.retry(exc=exc, countdown=countdown)
+
     def _get_retry_countdown(self, task_func):
         retry_backoff = int(
             self.task_kwargs.get('retry_backoff', True)
@@ -70,3 +492,367 @@ class custom_celery_task:
         )
 
         return countdown
+
+
+class BatchRequest:
+    '''
+    Picklable view of one buffered call, handed to a batch handler
+    '''
+
+    def __init__(self, id, name, args, kwargs, delivery_info=None, retries=0,
+                 db_last_write=None):
+        self.id = id
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self.delivery_info = delivery_info or {}
+        self.retries = retries
+        self.db_last_write = db_last_write
+
+    @classmethod
+    def from_request(cls, request):
+        return cls(request.id, request.name, request.args, request.kwargs,
+                   request.delivery_info,
+                   request.request_dict.get('retries') or 0,
+                   request.request_dict.get('db_last_write'))
+
+
+class BatchTask(DelayedDeliveryTask):
+    '''
+    Calls are buffered by the worker and handed to `run` as a list of
+    `BatchRequest` once `flush_every` calls are waiting or `flush_interval`
+    seconds have passed, each call keeps its own result
+
+    `run` returns either a list of results in request order, or a dict of
+    results keyed by request id
+    '''
+
+    Strategy = 'project.celery_utils:batch_strategy'
+
+    flush_every = 100
+    flush_interval = 1.0
+
+    def __call__(self, *args, **kwargs):
+        # called directly or in eager mode, run as a batch of one
+        request = BatchRequest(
+            self.request.id or uuid(), self.name, args, kwargs)
+        [result] = self.store_batch_results([request], self.run([request]),
+                                            store=False)
+        return result
+
+    def store_batch_results(self, requests, results, store=True):
+        if isinstance(results, dict):
+            results = [results.get(request.id) for request in requests]
+        else:
+            results = list(results or [None] * len(requests))
+        if store and not self.ignore_result:
+            for request, result in zip(requests, results):
+                self.backend.mark_as_done(request.id, result)
+        return results
+
+
+def send_batch_signal(signal, task, request, **kwargs):
+    # handlers read the call from `task.request`, as for any other task
+    task.push_request(
+        id=request.id, args=request.args, kwargs=request.kwargs,
+        delivery_info=request.delivery_info, retries=request.retries,
+        db_last_write=request.db_last_write, called_directly=False)
+    try:
+        signal.send(sender=task, task_id=request.id, task=task,
+                    args=request.args, kwargs=request.kwargs, **kwargs)
+    finally:
+        task.pop_request()
+
+
+def apply_batch(task_name, requests):
+    # runs in the pool, one session/query for the whole batch is up to `run`
+    task = current_celery_app.tasks[task_name]
+    for request in requests:
+        send_batch_signal(task_prerun, task, request)
+    # the batch reads after the newest write any of its calls was sent after
+    start_write_scope(max(
+        (request.db_last_write or 0.0 for request in requests), default=None))
+
+    try:
+        results = task.run(requests)
+    except Exception as exc:
+        logger.exception('Batch of %s %s failed', len(requests), task_name)
+        for request in requests:
+            task.backend.mark_as_failure(request.id, exc)
+        outcomes = [(None, states.FAILURE)] * len(requests)
+    else:
+        results = task.store_batch_results(requests, results)
+        outcomes = [(result, states.SUCCESS) for result in results]
+
+    for request, (result, state) in zip(requests, outcomes):
+        send_batch_signal(task_postrun, task, request,
+                          retval=result, state=state)
+
+
+def batch_strategy(task, app, consumer, **kwargs):
+    hostname = consumer.hostname
+    connection_errors = consumer.connection_errors
+    revoked_tasks = consumer.controller.state.revoked
+    pending = []
+
+    def flush():
+        if not pending:
+            return
+        batch = pending[:]
+        del pending[:]
+
+        def on_done(*args, **kwargs):
+            for request in batch:
+                request.acknowledge()
+                consumer.qos.decrement_eventually()
+
+        consumer.pool.apply_async(
+            apply_batch,
+            args=(task.name, [BatchRequest.from_request(r) for r in batch]),
+            callback=on_done,
+            error_callback=on_done
+        )
+
+    def task_message_handler(message, body, ack, reject, callbacks, **kw):
+        if body is None and 'args' not in message.payload:
+            body, headers, decoded, utc = (
+                message.body, message.headers, False, app.uses_utc_timezone(),
+            )
+        else:
+            body, headers, decoded, utc = hybrid_to_proto2(message, message.payload)
+
+        request = Request(
+            message, on_ack=ack, on_reject=reject, app=app, hostname=hostname,
+            task=task, connection_errors=connection_errors, body=body,
+            headers=headers, decoded=decoded, utc=utc,
+        )
+        if (request.expires or request.id in revoked_tasks) and request.revoked():
+            return
+
+        # let the broker deliver past the prefetch limit while we buffer
+        consumer.qos.increment_eventually()
+        pending.append(request)
+        if len(pending) >= task.flush_every:
+            flush()
+
+    consumer.timer.call_repeatedly(task.flush_interval, flush)
+    return task_message_handler
+
+
+class batch_celery_task:
+
+    def __init__(self, *args, flush_every=None, flush_interval=None, **kwargs):
+        kwargs.setdefault('base', BatchTask)
+        kwargs['flush_every'] = flush_every or settings.TASK_BATCH_FLUSH_EVERY
+        kwargs['flush_interval'] = \
+            flush_interval or settings.TASK_BATCH_FLUSH_INTERVAL
+        self.task_args = args
+        self.task_kwargs = kwargs
+
+    def __call__(self, func):
+        return shared_task(*self.task_args, **self.task_kwargs)(func)
+
+
+BACKFILL_KEY = 'backfill:{}'  # checkpoint of a backfill
+BACKFILL_PENDING_KEY = 'backfill:{}:pending'  # ids of its tasks in flight
+
+backfills = {}
+
+
+def finished_tasks(task_ids):
+    '''
+    States of the tasks of `task_ids` that are done, read in one round trip
+    '''
+    backend = current_celery_app.backend
+    keys = [backend.get_key_for_task(task_id) for task_id in task_ids]
+    values = backend.mget(keys)
+    if hasattr(values, 'get'):  # the cache backend answers with a dict
+        values = [values.get(key) for key in keys]
+
+    finished = {}
+    for task_id, value in zip(task_ids, values):
+        if value:
+            state = backend.decode_result(value)['status']
+            if state in states.READY_STATES:
+                finished[task_id] = state
+    return finished
+
+
+class Backfill:
+    '''
+    Calls `task` with the key of every row of `query(session)`, walking the
+    rows by `key` (unique and indexed) in batches of `batch_size`, with at
+    most `concurrency` calls in flight
+
+    Progress is checkpointed in Redis after every step, a backfill started
+    again carries on after the last key sent. Keys sent right before a crash
+    may be sent again and rows may be done since they were read, `task` must
+    do nothing for a row that is already done
+    '''
+
+    def __init__(self, name, query, key, task, batch_size=None,
+                 concurrency=None):
+        self.name = name
+        self.query = query
+        self.key = key
+        self.task = task
+        self.batch_size = batch_size or settings.BACKFILL_BATCH_SIZE
+        self.concurrency = concurrency or settings.BACKFILL_CONCURRENCY
+        self.checkpoint_key = BACKFILL_KEY.format(name)
+        self.pending_key = BACKFILL_PENDING_KEY.format(name)
+        self.queue = route_task(task.name, (), {}, {})['queue']
+
+    def status(self):
+        client = get_redis_client()
+        checkpoint = {
+            field.decode(): loads(value)
+            for field, value in client.hgetall(self.checkpoint_key).items()
+        }
+        checkpoint.pop('step_id', None)
+        checkpoint['in_flight'] = client.scard(self.pending_key)
+        return {'name': self.name, 'status': 'new', **checkpoint}
+
+    def save(self, client, **fields):
+        client.hset(self.checkpoint_key, mapping={
+            field: dumps(value) for field, value in fields.items()
+        })
+
+    def start(self, restart=False):
+        '''
+        Start the backfill, or resume it where it stopped. A backfill that
+        is already running hands over to the new run
+        '''
+        client = get_redis_client()
+        if restart:
+            client.delete(self.checkpoint_key, self.pending_key)
+        self.save(client, status='running', started_at=time.time())
+        self.schedule_step(client)
+        return self.status()
+
+    def schedule_step(self, client, countdown=None):
+        # only the step recorded last runs, a step delivered twice or sent
+        # by an earlier start ends its chain
+        step_id = uuid()
+        self.save(client, step_id=step_id)
+        backfill_step.apply_async((self.name,), task_id=step_id,
+                                  countdown=countdown)
+
+    def pause(self):
+        # the calls in flight are still counted when it resumes
+        self.save(get_redis_client(), status='paused')
+        return self.status()
+
+    def overloaded(self):
+        depth = backpressure.monitor.depth(self.queue)
+        if depth > settings.BACKFILL_MAX_QUEUE_DEPTH:
+            return f'queue {self.queue} holds {depth} tasks'
+        return None
+
+    def step(self, client):
+        '''
+        Count the calls that finished and send new ones up to `concurrency`,
+        returns the seconds to wait for the next step, None once all rows
+        are done
+        '''
+        pending = [task_id.decode()
+                   for task_id in client.smembers(self.pending_key)]
+        finished = finished_tasks(pending)
+        if finished:
+            failed = sum(state != states.SUCCESS
+                         for state in finished.values())
+            with client.pipeline() as pipe:
+                pipe.srem(self.pending_key, *finished)
+                pipe.hincrby(self.checkpoint_key, 'succeeded',
+                             len(finished) - failed)
+                pipe.hincrby(self.checkpoint_key, 'failed', failed)
+                pipe.execute()
+        in_flight = len(pending) - len(finished)
+
+        cursor, exhausted = [
+            loads(value) if value is not None else None
+            for value in client.hmget(self.checkpoint_key,
+                                      'cursor', 'exhausted')
+        ]
+        if exhausted:
+            if not in_flight:
+                self.save(client, status='done', finished_at=time.time())
+                return None
+            return settings.BACKFILL_POLL_INTERVAL
+
+        throttled = self.overloaded()
+        if throttled:
+            self.save(client, throttled=throttled, updated_at=time.time())
+            return settings.BACKFILL_THROTTLE_INTERVAL
+
+        query_seconds = 0.0
+        while in_flight < self.concurrency and not exhausted:
+            started = time.monotonic()
+            with read_db_context() as session:
+                rows, next_cursor = keyset_paginate(
+                    self.query(session), self.key, cursor,
+                    min(self.batch_size, self.concurrency - in_flight))
+            query_seconds = max(query_seconds, time.monotonic() - started)
+
+            keys = [getattr(row, self.key.key) for row in rows]
+            task_ids = [self.task.delay(key).id for key in keys]
+            exhausted = next_cursor is None
+            if keys:
+                cursor = keys[-1]
+            # sent before they are recorded, a crash in between sends them
+            # again rather than waiting on calls that were never sent
+            with client.pipeline() as pipe:
+                if task_ids:
+                    pipe.sadd(self.pending_key, *task_ids)
+                    pipe.hincrby(self.checkpoint_key, 'sent', len(task_ids))
+                pipe.hset(self.checkpoint_key, mapping={
+                    'cursor': dumps(cursor), 'exhausted': dumps(exhausted)})
+                pipe.execute()
+            in_flight += len(task_ids)
+
+        # a slow batch query means a loaded database, give it a break
+        throttled = None
+        if query_seconds > settings.BACKFILL_MAX_QUERY_SECONDS:
+            throttled = f'batch query took {query_seconds:.1f}s'
+        self.save(client, throttled=throttled, updated_at=time.time())
+        if throttled:
+            return settings.BACKFILL_THROTTLE_INTERVAL
+        return settings.BACKFILL_POLL_INTERVAL
+
+
+class register_backfill:
+    '''
+    Registers the decorated query as a backfill, see `Backfill`
+
+    @register_backfill('avatar_thumbnails', Member.id, backfill_thumbnail)
+    def members_without_thumbnail(session):
+        return session.query(Member.id).filter(...)
+    '''
+
+    def __init__(self, name, key, task, batch_size=None, concurrency=None):
+        self.name = name
+        self.backfill_args = (key, task, batch_size, concurrency)
+
+    def __call__(self, query):
+        backfills[self.name] = Backfill(self.name, query, *self.backfill_args)
+        return query
+
+
+@shared_task(name='backfill_step', bind=True)
+def backfill_step(self, name):
+    backfill = backfills[name]
+    client = get_redis_client()
+    status, step_id = [
+        loads(value) if value is not None else None
+        for value in client.hmget(backfill.checkpoint_key, 'status', 'step_id')
+    ]
+    if status != 'running' or step_id != self.request.id:
+        return  # paused, or superseded by a newer step
+
+    try:
+        countdown = backfill.step(client)
+    except Exception:
+        # the checkpoint is intact, try again after a break
+        logger.exception('Backfill %s step failed', name)
+        countdown = settings.BACKFILL_THROTTLE_INTERVAL
+    if countdown is not None:
+        backfill.schedule_step(client, countdown)
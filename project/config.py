@@ -16,21 +16,177 @@ class BaseConfig:
 
     UPLOADS_DEFAULT_DEST: str = str(BASE_DIR / 'upload')
 
+    # resized avatar variants served by `/tdd/members/{id}/avatar`
+    AVATAR_CACHE_DIR: str = str(BASE_DIR / 'upload' / 'avatar_cache')
+    AVATAR_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    AVATAR_ALLOWED_SIZES: tuple = (32, 64, 100, 200, 400, 800)
+
+    # bulk user imports, uploaded CSVs are kept here while they import
+    USER_IMPORT_DIR: str = str(BASE_DIR / 'upload' / 'imports')
+    USER_IMPORT_CHUNK_SIZE: int = 10000  # rows per task
+
+    # table exports, rows fetched and written per server-side cursor batch,
+    # background exports are written here
+    EXPORT_DIR: str = str(BASE_DIR / 'upload' / 'exports')
+    EXPORT_BATCH_SIZE: int = 5000
+
     DATABASE_URL: str = os.environ.get(
         'DATABASE_URL', f'sqlite:///{BASE_DIR}/db.sqlite3')
     DATABASE_CONNECT_DICT: dict = {}
 
+    # comma separated read replicas, reads go to the primary when empty
+    DATABASE_REPLICA_URLS: list = [
+        url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+        if url
+    ]
+    # how long a failed replica is skipped before it is tried again
+    DATABASE_REPLICA_RETRY_INTERVAL: int = 30
+    # reads stay on the primary for this long after a commit
+    DATABASE_READ_YOUR_WRITES_WINDOW: float = 5.0
+
+    # single node mode without Redis, tasks go through an in memory queue
+    # to IN_PROCESS_CONCURRENCY worker threads of the web process, results
+    # and status updates stay in this process, see project.in_process.
+    # Features keeping their state in Redis are turned off below
+    IN_PROCESS_MODE: bool = os.environ.get('IN_PROCESS_MODE') == '1'
+    IN_PROCESS_CONCURRENCY: int = 4
+
     WS_MESSAGE_QUEUE: str = os.environ.get(
         'WS_MESSAGE_QUEUE', 'redis://127.0.0.1:6379/0')
 
-    CELERY_BROKER_URL: str = os.environ.get(
-        'CELERY_BROKER_URL', 'redis://127.0.0.1:6379/0')
+    # task status websockets, see project.ws.connections
+    WS_SEND_QUEUE_SIZE: int = 16
+    WS_PING_INTERVAL: float = 20.0
+    WS_IDLE_TIMEOUT: float = 60.0
+    WS_SEND_TIMEOUT: float = 10.0
+
+    CELERY_BROKER_URL: str = 'memory://' if IN_PROCESS_MODE else \
+        os.environ.get('CELERY_BROKER_URL', 'redis://127.0.0.1:6379/0')
+    CELERY_BROKER_TRANSPORT: str = \
+        'project.in_process:InProcessTransport' if IN_PROCESS_MODE else None
 
     RESULT_BACKEND: str = os.environ.get(
         'RESULT_BACKEND', 'redis://127.0.0.1:6379/0')
 
+    REDIS_URL: str = os.environ.get(
+        'REDIS_URL', 'redis://127.0.0.1:6379/0')
+
+    # comma separated Redis endpoints, task results and status channels are
+    # spread over them by consistent hashing on the task id, see
+    # project.sharding. QUEUE_REDIS_NODES moves a queue to its own broker
+    REDIS_SHARD_URLS: list = [
+        url for url in os.environ.get('REDIS_SHARD_URLS', '').split(',')
+        if url
+    ]
+    QUEUE_REDIS_NODES: dict = {}
+
+    CELERY_RESULT_BACKEND: str = \
+        'cache+memory://' if IN_PROCESS_MODE else \
+        'project.sharding:ShardedRedisBackend' if REDIS_SHARD_URLS else None
+
+    # result memoization for `custom_celery_task(memoize=True)`
+    TASK_MEMOIZE_TTL: int = 3600
+    TASK_MEMOIZE_MAX_ENTRIES: int = 10000
+    TASK_MEMOIZE_LOCK_TIMEOUT: int = 60
+
+    # username -> id lookups of `user_subscription`, a miss is cached for at
+    # most USERNAME_CACHE_NEGATIVE_TTL seconds (the insert race window)
+    USERNAME_CACHE_TTL: float = 300
+    USERNAME_CACHE_NEGATIVE_TTL: float = 1.0
+    USERNAME_CACHE_MAX_ENTRIES: int = 100000
+    USERNAME_CACHE_REDIS: bool = not IN_PROCESS_MODE  # shared by workers
+
+    # enqueuing routes answer 503 while their queue is over its threshold
+    BACKPRESSURE_ENABLED: bool = True
+    BACKPRESSURE_SAMPLE_INTERVAL: float = 1.0
+    BACKPRESSURE_STATUS_CODE: int = 503
+    BACKPRESSURE_RETRY_AFTER: int = 30
+    BACKPRESSURE_QUEUE_THRESHOLDS: dict = {
+        'high_priority': 10000,
+        'default': 100000,
+        'low_priority': 500000
+    }
+
+    # countdown/ETA tasks further out than the threshold (seconds) are
+    # parked in Redis and released by `release_delayed_tasks`
+    DELAYED_DELIVERY_ENABLED: bool = not IN_PROCESS_MODE
+    DELAYED_DELIVERY_THRESHOLD: float = 1.0
+    DELAYED_DELIVERY_BATCH_SIZE: int = 500
+    DELAYED_DELIVERY_LEASE: int = 60
+
+    # backfills read BACKFILL_BATCH_SIZE keys per query and keep at most
+    # BACKFILL_CONCURRENCY tasks in flight, they wait BACKFILL_THROTTLE_INTERVAL
+    # while the queue of their task is over BACKFILL_MAX_QUEUE_DEPTH or after
+    # a batch query slower than BACKFILL_MAX_QUERY_SECONDS
+    BACKFILL_BATCH_SIZE: int = 500
+    BACKFILL_CONCURRENCY: int = 1000
+    BACKFILL_MAX_QUEUE_DEPTH: int = 10000
+    BACKFILL_MAX_QUERY_SECONDS: float = 1.0
+    BACKFILL_POLL_INTERVAL: float = 1.0
+    BACKFILL_THROTTLE_INTERVAL: float = 30.0
+
+    # tasks failing for good are kept in Redis for inspection and replay,
+    # replays are released at DEAD_LETTER_REPLAY_RATE tasks per second
+    DEAD_LETTER_ENABLED: bool = not IN_PROCESS_MODE
+    DEAD_LETTER_MAX_ENTRIES: int = 100000
+    DEAD_LETTER_REPLAY_RATE: float = 10.0
+
+    # token buckets shared by every worker, keyed by destination host,
+    # `rate` tokens per second up to `burst`, unlisted hosts are unlimited
+    OUTBOUND_RATE_LIMITS: dict = {} if IN_PROCESS_MODE else {
+        'httpbin.org': {'rate': 5.0, 'burst': 10}
+    }
+
+    # coroutines running at once on a worker process event loop, for
+    # `custom_celery_task` decorated `async def` functions, and how many of
+    # their calls a worker prefetches past its pool
+    ASYNC_TASK_CONCURRENCY: int = 100
+
+    # defaults for `batch_celery_task`
+    TASK_BATCH_FLUSH_EVERY: int = 100
+    TASK_BATCH_FLUSH_INTERVAL: float = 1.0
+
+    # a task still queued past its `deadline` header is skipped, what is
+    # left of it bounds outbound timeouts, see project.deadline
+    USERS_FORM_DEADLINE: float = 30  # clients of /users/form/ give up then
+    TASK_DEADLINE_MIN_TIMEOUT: float = 0.1
+    OUTBOUND_HTTP_TIMEOUT: float = 30
+
+    # task lifecycle index, see project.task_events
+    TASK_EVENTS_ENABLED: bool = True
+    TASK_EVENTS_FLUSH_EVERY: int = 500
+    TASK_EVENTS_FLUSH_INTERVAL: float = 1.0
+    TASK_EVENTS_LATENCY_SAMPLE: int = 10000  # latest finished tasks
+    # records without an event for that long are deleted every hour
+    TASK_EVENTS_RETENTION_DAYS: int = 7
+    TASK_EVENTS_PURGE_BATCH_SIZE: int = 10000
+
+    # per task RSS accounting, see project.worker_memory
+    WORKER_MEMORY_LOG_THRESHOLD: int = 50 * 1024 * 1024  # bytes
+    WORKER_MEMORY_REPORT_EVERY: int = 100  # tasks
+    WORKER_MEMORY_REPORT_TASKS: int = 5  # tasks logged per report
+    WORKER_MEMORY_TOP_ALLOCATORS: int = 5
+    WORKER_TRACEMALLOC_SAMPLE_RATE: float = float(
+        os.environ.get('WORKER_TRACEMALLOC_SAMPLE_RATE', 0))
+    WORKER_TRACEMALLOC_FRAMES: int = 1
+
+    # recycle prefork children before slow leaks add up
+    CELERY_WORKER_MAX_MEMORY_PER_CHILD: int = 300 * 1024  # KiB
+    CELERY_WORKER_MAX_TASKS_PER_CHILD: int = 1000
+
     CELERY_WORKER_PREFETCH_MULTIPLIER: int = 1
 
+    # workers move their prefetch multiplier between the bounds to keep
+    # PREFETCH_BUFFER_SECONDS of work reserved per process, from moving
+    # average task runtimes per queue kept in Redis, see project.prefetch
+    PREFETCH_TUNING_ENABLED: bool = not IN_PROCESS_MODE
+    PREFETCH_MIN_MULTIPLIER: int = 1
+    PREFETCH_MAX_MULTIPLIER: int = 64
+    PREFETCH_BUFFER_SECONDS: float = 0.05
+    PREFETCH_RUNTIME_ALPHA: float = 0.05  # weight of each task in the average
+    PREFETCH_FLUSH_INTERVAL: float = 1.0
+    PREFETCH_TUNE_INTERVAL: float = 5.0
+
     CELERY_TASK_ACKS_LATE: bool = True
 
     CELERY_BEAT_SCHEDULE: dict = {
@@ -38,9 +194,22 @@ class BaseConfig:
             'task': 'task_schedule_work',
             'schedule': 200.0  # every 200 seconds
             # this supports crontab, timedeleta and solar formats
+        },
+        'release-delayed-tasks': {
+            'task': 'high_priority:release_delayed_tasks',
+            'schedule': 1.0
+        },
+        'purge-task-records': {
+            'task': 'low_priority:purge_task_records',
+            'schedule': 3600.0
         }
     }
 
+    # project.beat.schedulers.DatabaseScheduler
+    BEAT_SCHEDULER_LOOKAHEAD: int = 60
+    BEAT_SCHEDULER_BATCH_SIZE: int = 1000
+    BEAT_SCHEDULER_SYNC_INTERVAL: int = 5
+
     CELERY_TASK_DEFAULT_QUEUE: str = 'default'
 
     CELERY_TASK_CREATE_MISSING_QUEUES: bool = False
@@ -58,6 +227,22 @@ class BaseConfig:
     # }
     CELERY_TASK_ROUTES: tuple = (route_task, )
 
+    # a worker consuming several queues polls them in weighted fair order,
+    # each queue goes first in its share of polls and at least once every
+    # QUEUE_STARVATION_BOUND polls, see project.queue_cycle
+    QUEUE_WEIGHTS: dict = {
+        'high_priority': 6,
+        'default': 3,
+        'low_priority': 1
+    }
+    QUEUE_STARVATION_BOUND: int = 20
+
+    CELERY_BROKER_TRANSPORT_OPTIONS: dict = {
+        'queue_order_strategy': 'project.queue_cycle:weighted_fair_cycle',
+        # the in memory broker is polled, keep a task from waiting for it
+        **({'polling_interval': 0.01} if IN_PROCESS_MODE else {})
+    }
+
 
 class DevelopmentConfig(BaseConfig):
     pass
@@ -70,6 +255,10 @@ class ProductionConfig(BaseConfig):
 class TestingConfig(BaseConfig):
     DATABASE_URL: str = 'sqlite:///./test.db'
     DATABASE_CONNECT_DICT: dict = {'check_same_thread': False}
+    DATABASE_REPLICA_URLS: list = []
+    BACKPRESSURE_ENABLED: bool = False
+    TASK_EVENTS_ENABLED: bool = False
+    USERNAME_CACHE_REDIS: bool = False
 
 
 @lru_cache()
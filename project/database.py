@@ -1,9 +1,19 @@
+import os
+import math
+import time
+import itertools
+import threading
+import contextvars
 from contextlib import contextmanager
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
 
 from project.config import settings
+from project.deadline import remaining
 
 
 # https://fastapi.tiangolo.com/tutorial/sql-databases/#create-the-sqlalchemy-engine
@@ -14,6 +24,134 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+class ReplicaSet:
+    '''
+    Round-robin over the read replicas, a replica that fails to connect is
+    skipped for `retry_interval` seconds
+    '''
+
+    def __init__(self, urls, connect_args=None, retry_interval=30):
+        self.engines = [
+            create_engine(url, connect_args=connect_args or {},
+                          pool_pre_ping=True)
+            for url in urls
+        ]
+        self.retry_interval = retry_interval
+        self._down_until = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def choose(self):
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(len(self.engines)):
+                replica = self.engines[next(self._counter) % len(self.engines)]
+                if self._down_until.get(replica, 0) <= now:
+                    return replica
+        return None
+
+    def mark_down(self, replica):
+        with self._lock:
+            self._down_until[replica] = time.monotonic() + self.retry_interval
+
+
+replicas = ReplicaSet(
+    settings.DATABASE_REPLICA_URLS,
+    connect_args=settings.DATABASE_CONNECT_DICT,
+    retry_interval=settings.DATABASE_REPLICA_RETRY_INTERVAL
+)
+
+
+def _dispose_inherited_connections():
+    # async tasks open connections in the worker process itself, a forked
+    # pool child starts its own pools instead of sharing those sockets
+    engine.dispose(close=False)
+    for replica in replicas.engines:
+        replica.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_dispose_inherited_connections)
+
+# time of the last commit seen by the current request (and the requests of
+# its client before it, see `ReadYourWritesMiddleware`) or task (and
+# the one that enqueued it, see `project.celery_utils`). A mutable holder,
+# so commits made in threadpool copies of the context reach the request
+_write_scope = contextvars.ContextVar('write_scope', default=None)
+
+
+def start_write_scope(last_write=None):
+    scope = {'last_write': last_write or 0.0}
+    _write_scope.set(scope)
+    return scope
+
+
+def end_write_scope():
+    _write_scope.set(None)
+
+
+@event.listens_for(SessionLocal, 'after_commit')
+def record_write(session):
+    scope = _write_scope.get()
+    if scope is not None and not session.info.get('replica'):
+        scope['last_write'] = time.time()
+
+
+@event.listens_for(SessionLocal, 'after_begin')
+def limit_statement_time(session, transaction, connection):
+    # statements of a task with a deadline give up when it passes
+    left = remaining()
+    if left is not None and connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql(
+            f'SET LOCAL statement_timeout = {max(1, int(left * 1000))}')
+
+
+def last_write_time():
+    scope = _write_scope.get()
+    return scope['last_write'] if scope is not None else 0.0
+
+
+class ReadYourWritesMiddleware:
+    '''
+    Gives every request its own write scope, a request that commits sends
+    the time back in a cookie so the next requests of that client read from
+    the primary too while the replicas may lag
+    '''
+
+    cookie = 'db_last_write'
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        try:
+            # a client can only pin its own reads to the primary
+            last_write = min(
+                float(HTTPConnection(scope).cookies[self.cookie]), time.time())
+        except (KeyError, ValueError):
+            last_write = 0.0
+        write_scope = start_write_scope(last_write)
+
+        async def send_with_cookie(message):
+            if message['type'] == 'http.response.start' and \
+                    write_scope['last_write'] > last_write:
+                max_age = math.ceil(settings.DATABASE_READ_YOUR_WRITES_WINDOW)
+                MutableHeaders(scope=message).append(
+                    'set-cookie',
+                    f'{self.cookie}={write_scope["last_write"]}; '
+                    f'Max-Age={max_age}; Path=/; HttpOnly; SameSite=lax')
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+def recently_written():
+    return time.time() - last_write_time() < \
+        settings.DATABASE_READ_YOUR_WRITES_WINDOW
+
+
 def get_db_session():
     session = SessionLocal()
     try:
@@ -22,4 +160,52 @@ def get_db_session():
         session.close()
 
 
+def get_read_db_session():
+    '''
+    Session for read-only work, served by a replica unless the current
+    request or task (or what came before it, see `_write_scope`) has just
+    committed
+    '''
+    session = None
+    while session is None and not recently_written():
+        replica = replicas.choose()
+        if replica is None:
+            break
+        session = SessionLocal(bind=replica, info={'replica': True})
+        try:
+            session.connection()
+        except OperationalError:
+            session.close()
+            session = None
+            replicas.mark_down(replica)
+
+    session = session or SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
 db_context = contextmanager(get_db_session)
+read_db_context = contextmanager(get_read_db_session)
+
+
+def prefix_filter(column, prefix):
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return column.like(f'{escaped}%', escape='\\')
+
+
+def keyset_paginate(query, key_column, after=None, limit=50):
+    '''
+    Page through `query` by `key_column` instead of OFFSET, so every page
+    costs one index seek no matter how deep it is
+
+    Returns the page and the cursor for the next one (None on the last page)
+    '''
+    if after is not None:
+        query = query.filter(key_column > after)
+    items = query.order_by(key_column).limit(limit + 1).all()
+    if len(items) > limit:
+        items = items[:limit]
+        return items, getattr(items[-1], key_column.key)
+    return items, None
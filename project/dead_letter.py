@@ -0,0 +1,181 @@
+import time
+import logging
+import traceback
+
+from celery.signals import task_failure
+from kombu.utils.json import dumps, loads
+
+from project.config import settings
+from project.delayed import park_task
+from project.redis_utils import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_KEY = 'deadletter:tasks'  # task id -> entry
+DEAD_LETTER_INDEX = 'deadletter:index'  # task id by failure time
+DEAD_LETTER_NAME_INDEX = 'deadletter:index:{}'
+
+
+def _indexes(name):
+    return DEAD_LETTER_INDEX, DEAD_LETTER_NAME_INDEX.format(name)
+
+
+def record_dead_letter(task_id, name, args, kwargs, headers, exception,
+                       tb=None, failed_at=None):
+    entry = {
+        'id': task_id,
+        'task': name,
+        'args': list(args or ()),
+        'kwargs': dict(kwargs or {}),
+        'headers': headers,
+        'exception': f'{type(exception).__name__}: {exception}',
+        'traceback': tb,
+        'failed_at': failed_at or time.time(),
+    }
+    client = get_redis_client()
+    with client.pipeline() as pipe:
+        pipe.hset(DEAD_LETTER_KEY, task_id, dumps(entry))
+        for index in _indexes(name):
+            pipe.zadd(index, {task_id: entry['failed_at']})
+        pipe.execute()
+    _trim(client)
+
+
+def _trim(client):
+    excess = client.zcard(DEAD_LETTER_INDEX) - settings.DEAD_LETTER_MAX_ENTRIES
+    if excess > 0:
+        oldest = [task_id for task_id, _ in
+                  client.zpopmin(DEAD_LETTER_INDEX, excess)]
+        _remove(client, oldest)
+
+
+def _remove(client, task_ids):
+    if not task_ids:
+        return
+    entries = client.hmget(DEAD_LETTER_KEY, task_ids)
+    with client.pipeline() as pipe:
+        for task_id, entry in zip(task_ids, entries):
+            if entry is not None:
+                for index in _indexes(loads(entry)['task']):
+                    pipe.zrem(index, task_id)
+        pipe.hdel(DEAD_LETTER_KEY, *task_ids)
+        pipe.execute()
+
+
+def _page_after(client, index, cursor, count):
+    score, _, task_id = cursor.partition(':')
+    score = float(score)
+    with client.pipeline() as pipe:
+        pipe.zscore(index, task_id)
+        pipe.zrank(index, task_id)
+        current_score, rank = pipe.execute()
+    if current_score == score:
+        return client.zrange(index, rank + 1, rank + count, withscores=True)
+
+    # the cursor entry was replayed or trimmed since, skip what sorts before
+    # it among the entries failed at the same time (ordered by id)
+    task_id = task_id.encode()
+    page, offset = [], 0
+    while len(page) < count:
+        chunk = client.zrangebyscore(index, score, '+inf', start=offset,
+                                     num=count, withscores=True)
+        if not chunk:
+            break
+        offset += len(chunk)
+        page.extend(
+            (member, member_score) for member, member_score in chunk
+            if member_score > score or member > task_id
+        )
+    return page[:count]
+
+
+def list_dead_letters(name=None, after=None, limit=50):
+    '''
+    Oldest first, optionally of one task name, with the cursor to pass as
+    `after` for the next page (None on the last page)
+
+    The cursor is the failure time and id of the last entry, entries failed
+    at the same time are ordered by id and none is skipped across pages
+    '''
+    client = get_redis_client()
+    index = DEAD_LETTER_NAME_INDEX.format(name) if name else DEAD_LETTER_INDEX
+    if after is None:
+        page = client.zrange(index, 0, limit, withscores=True)
+    else:
+        page = _page_after(client, index, after, limit + 1)
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        task_id, score = page[-1]
+        next_cursor = f'{score!r}:{task_id.decode()}'
+
+    entries = client.hmget(DEAD_LETTER_KEY, [task_id for task_id, _ in page]) \
+        if page else []
+    return [loads(entry) for entry in entries if entry], next_cursor
+
+
+def replay_dead_letters(name=None, task_ids=None, limit=1000, rate=None):
+    '''
+    Send dead letters back to their queue, `rate` per second at most, and
+    drop them from the store. Returns how many were replayed
+
+    Replays are parked with delayed delivery, one every 1 / rate seconds,
+    so a bulk replay trickles into the queues instead of flooding them
+    '''
+    client = get_redis_client()
+    rate = rate or settings.DEAD_LETTER_REPLAY_RATE
+    if task_ids is None:
+        index = DEAD_LETTER_NAME_INDEX.format(name) if name \
+            else DEAD_LETTER_INDEX
+        task_ids = client.zrange(index, 0, limit - 1)
+    else:
+        task_ids = task_ids[:limit]
+    if not task_ids:
+        return 0
+
+    now = time.time()
+    replayed = []
+    for task_id, entry in zip(task_ids, client.hmget(DEAD_LETTER_KEY, task_ids)):
+        if entry is None:
+            continue
+        entry = loads(entry)
+        if name and entry['task'] != name:
+            continue
+        options = {'retries': 0}
+        if entry['headers'].get('queue'):
+            options['queue'] = entry['headers']['queue']
+        park_task(entry['task'], entry['args'], entry['kwargs'], entry['id'],
+                  now + len(replayed) / rate, options)
+        replayed.append(task_id)
+
+    _remove(client, replayed)
+    logger.info('Replaying %s dead letters over %.1fs',
+                len(replayed), len(replayed) / rate)
+    return len(replayed)
+
+
+@task_failure.connect
+def dead_letter_failed_task(sender=None, task_id=None, exception=None,
+                            args=None, kwargs=None, einfo=None, **kw):
+    # final failures only, a retry is not a failure
+    request = sender.request
+    if not settings.DEAD_LETTER_ENABLED or request.is_eager:
+        return
+
+    delivery_info = request.delivery_info or {}
+    headers = {
+        'retries': request.retries,
+        'root_id': request.root_id,
+        'parent_id': request.parent_id,
+        'queue': delivery_info.get('routing_key'),
+    }
+    tb = str(einfo) if einfo else ''.join(
+        traceback.format_exception(type(exception), exception,
+                                   exception.__traceback__))
+    try:
+        record_dead_letter(task_id, sender.name, args, kwargs, headers,
+                           exception, tb)
+    except Exception:
+        logger.exception('Could not dead letter %s[%s]', sender.name, task_id)
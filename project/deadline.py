@@ -0,0 +1,102 @@
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+
+from celery import current_app as current_celery_app
+from celery.signals import before_task_publish
+
+from project.config import settings
+from project.redis_utils import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_HEADER = 'deadline'  # absolute, seconds since the epoch
+EXPIRED_KEY = 'deadline:expired'  # task name -> calls skipped as expired
+
+# deadline of the task this worker thread is running, or of the coroutine
+# for a task awaited on the event loop of the process
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+def deadline_in(seconds):
+    '''
+    Headers giving a task `seconds` from now to finish, for `apply_async`
+    '''
+    return {DEADLINE_HEADER: time.time() + seconds}
+
+
+def current_deadline():
+    return _deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline):
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(default=None):
+    '''
+    Seconds left before the current deadline, `default` outside of one
+    '''
+    deadline = current_deadline()
+    if deadline is None:
+        return default
+    return max(0.0, deadline - time.time())
+
+
+def budget(timeout):
+    '''
+    `timeout` for an outbound call, cut to what is left of the deadline
+    '''
+    left = remaining()
+    if left is None:
+        return timeout
+    return max(settings.TASK_DEADLINE_MIN_TIMEOUT, min(timeout, left))
+
+
+def propagate_deadline(headers, task_name=None):
+    '''
+    Give a message the deadline of the task sending it, or else the default
+    budget of its task, unless it was given one explicitly
+    '''
+    if headers.get(DEADLINE_HEADER) is not None:
+        return headers
+    deadline = current_deadline()
+    if deadline is None and task_name:
+        task = current_celery_app.tasks.get(task_name)
+        seconds = getattr(task, 'deadline_budget', None)
+        if seconds:
+            deadline = time.time() + seconds
+    if deadline is not None:
+        headers[DEADLINE_HEADER] = deadline
+    return headers
+
+
+@before_task_publish.connect
+def attach_deadline(sender=None, headers=None, **kwargs):
+    if headers is not None:
+        propagate_deadline(headers, sender)
+
+
+def is_expired(deadline, now=None):
+    return deadline is not None and deadline <= (now or time.time())
+
+
+def count_expired(task_name):
+    try:
+        get_redis_client().hincrby(EXPIRED_KEY, task_name, 1)
+    except Exception:
+        logger.exception('Could not count expired %s', task_name)
+
+
+def get_expired_counts():
+    return {
+        name.decode(): int(count)
+        for name, count in get_redis_client().hgetall(EXPIRED_KEY).items()
+    }
@@ -0,0 +1,149 @@
+import time
+import logging
+from datetime import datetime, timezone
+
+from celery import Task, shared_task
+from celery.utils import uuid
+from kombu.utils.json import dumps, loads
+
+from project.config import settings
+from project.deadline import propagate_deadline
+from project.redis_utils import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+DELAYED_KEY = 'delayed:tasks'
+RELEASING_KEY = 'delayed:releasing'
+
+# claim due tasks into a lease set, so a mover that dies half way through a
+# batch does not lose them, they go back to `delayed:tasks` once the lease ends
+CLAIM_DUE_SCRIPT = '''
+local due = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, member in ipairs(due) do
+    redis.call('zrem', KEYS[1], member)
+    redis.call('zadd', KEYS[2], ARGV[1], member)
+end
+return due
+'''
+
+RECOVER_EXPIRED_SCRIPT = '''
+local expired = redis.call('zrangebyscore', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, member in ipairs(expired) do
+    redis.call('zrem', KEYS[2], member)
+    redis.call('zadd', KEYS[1], 0, member)
+end
+return #expired
+'''
+
+
+def get_due_timestamp(countdown=None, eta=None):
+    if eta is not None:
+        if isinstance(eta, str):
+            eta = datetime.fromisoformat(eta)
+        if eta.tzinfo is None:
+            eta = eta.replace(tzinfo=timezone.utc)
+        return eta.timestamp()
+    if countdown is not None:
+        return time.time() + countdown
+    return None
+
+
+def park_task(name, args, kwargs, task_id, due, options):
+    payload = dumps({
+        'id': task_id,
+        'task': name,
+        'args': args,
+        'kwargs': kwargs,
+        'options': options
+    })
+    get_redis_client().zadd(DELAYED_KEY, {payload: due})
+
+
+def release_due_tasks(app, batch_size=None, now=None):
+    '''
+    Send every parked task that is due to its real queue, returns the count
+    '''
+    client = get_redis_client()
+    batch_size = batch_size or settings.DELAYED_DELIVERY_BATCH_SIZE
+    now = now or time.time()
+
+    client.register_script(RECOVER_EXPIRED_SCRIPT)(
+        keys=[DELAYED_KEY, RELEASING_KEY],
+        args=[now - settings.DELAYED_DELIVERY_LEASE, batch_size])
+
+    claim_due = client.register_script(CLAIM_DUE_SCRIPT)
+    released = 0
+    while True:
+        due = claim_due(keys=[DELAYED_KEY, RELEASING_KEY], args=[now, batch_size])
+        if not due:
+            break
+
+        with app.producer_or_acquire() as producer:
+            for member in due:
+                payload = loads(member)
+                app.send_task(
+                    payload['task'],
+                    payload['args'],
+                    payload['kwargs'],
+                    task_id=payload['id'],
+                    producer=producer,
+                    **payload['options']
+                )
+        client.zrem(RELEASING_KEY, *due)
+        released += len(due)
+
+        if len(due) < batch_size:
+            break
+
+    return released
+
+
+class DelayedDeliveryTask(Task):
+    '''
+    Park countdown/ETA calls (and so retries) in a Redis sorted set instead
+    of prefetching them into worker memory, `release_delayed_tasks` sends
+    them to their queue once due
+    '''
+
+    def apply_async(self, args=None, kwargs=None, task_id=None, producer=None,
+                    link=None, link_error=None, shadow=None, **options):
+        due = get_due_timestamp(options.get('countdown'), options.get('eta'))
+        app = self._get_app()
+
+        if due is None or \
+                app.conf.task_always_eager or \
+                not settings.DELAYED_DELIVERY_ENABLED or \
+                due - time.time() < settings.DELAYED_DELIVERY_THRESHOLD:
+            return super().apply_async(
+                args, kwargs, task_id=task_id, producer=producer, link=link,
+                link_error=link_error, shadow=shadow, **options)
+
+        task_id = task_id or uuid()
+        options.pop('countdown', None)
+        options.pop('eta', None)
+        options = dict(
+            {k: v for k, v in self._get_exec_options().items() if v is not None},
+            **options
+        )
+        options.setdefault('ignore_result', self.ignore_result)
+        if link:
+            options['link'] = link
+        if link_error:
+            options['link_error'] = link_error
+        if shadow:
+            options['shadow'] = shadow
+        # released by another task, so the deadline has to travel with it
+        options['headers'] = propagate_deadline(
+            dict(options.get('headers') or {}), self.name)
+
+        park_task(self.name, args, kwargs, task_id, due, options)
+        return self.AsyncResult(task_id)
+
+
+@shared_task(name='high_priority:release_delayed_tasks', bind=True, ignore_result=True)
+def release_delayed_tasks(self):
+    released = release_due_tasks(self.app)
+    if released:
+        logger.info('Released %s delayed tasks', released)
+    return released
@@ -0,0 +1,125 @@
+import io
+import os
+import csv
+import json
+import uuid
+
+from celery import shared_task
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from kombu.utils.imports import symbol_by_name
+
+from project.config import settings
+from project.database import read_db_context
+
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# exported tables, the model and the columns written in that order
+EXPORTS = {
+    'users': ('project.users.models:User', ('id', 'username', 'email')),
+    'members': ('project.tdd.models:Member',
+                ('id', 'username', 'email', 'avatar', 'avatar_thumbnail')),
+}
+
+
+def export_columns(table):
+    model, columns = EXPORTS[table]
+    model = symbol_by_name(model)
+    return [getattr(model, column) for column in columns]
+
+
+def stream_rows(session, columns, batch_size):
+    '''
+    Plain row tuples of `columns` in primary key order, fetched through a
+    server-side cursor `batch_size` rows at a time
+
+    No ORM objects are built and nothing is kept in the identity map, so
+    memory is bounded by one batch whatever the size of the table
+    '''
+    return session.query(*columns).order_by(
+        columns[0]
+    ).yield_per(batch_size)
+
+
+def encode_rows(rows, names, format, batch_size):
+    '''
+    The rows as NDJSON or CSV text (header first), one string per batch
+    '''
+    buffer = io.StringIO()
+    if format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        write = writer.writerow
+    else:
+        def write(row):
+            buffer.write(json.dumps(dict(zip(names, row))))
+            buffer.write('\n')
+
+    count = 0
+    for row in rows:
+        write(row)
+        count += 1
+        if count == batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_table_chunks(table, format, batch_size=None):
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    columns = export_columns(table)
+    # the session lives as long as the iteration, not the request
+    with read_db_context() as session:
+        rows = stream_rows(session, columns, batch_size)
+        yield from encode_rows(
+            rows, [column.key for column in columns], format, batch_size)
+
+
+def check_format(format):
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail='Unsupported format')
+
+
+def export_response(table, format):
+    '''
+    The whole table streamed as a download
+    '''
+    check_format(format)
+    return StreamingResponse(
+        export_table_chunks(table, format),
+        media_type=FORMATS[format],
+        headers={
+            'Content-Disposition': f'attachment; filename="{table}.{format}"'
+        }
+    )
+
+
+def queue_export(table, format):
+    '''
+    Write the export to EXPORT_DIR in the background, returns the task id
+    and the name the file will have
+    '''
+    check_format(format)
+    filename = f'{table}-{uuid.uuid4().hex}.{format}'
+    task = export_table.delay(table, format, filename)
+    return {'task_id': task.task_id, 'filename': filename}
+
+
+@shared_task(name='low_priority:export_table')
+def export_table(table, format, filename):
+    os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+    path = os.path.join(settings.EXPORT_DIR, filename)
+    # written aside and renamed, a file in EXPORT_DIR is always complete
+    partial_path = f'{path}.partial'
+    with open(partial_path, 'w', newline='') as file_object:
+        for chunk in export_table_chunks(table, format):
+            file_object.write(chunk)
+    os.replace(partial_path, path)
+    return filename
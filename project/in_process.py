@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from broadcaster import Event
+from broadcaster._base import Subscriber
+from celery.result import _set_task_join_will_block
+from celery.utils.nodenames import anon_nodename
+from celery.worker import state
+from kombu.transport import memory
+
+from project.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class InProcessBroadcast:
+    '''
+    Pub/sub of IN_PROCESS_MODE, with the interface of `broadcaster.Broadcast`
+
+    Publishing is thread safe, a worker thread reaches the subscribers on the
+    event loop of the web app
+    '''
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)  # channel -> {(loop, queue)}
+        self._lock = threading.Lock()
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        event = Event(channel=channel, message=message)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                pass  # the loop of a subscriber that never left is closed
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        queue = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            yield Subscriber(queue)
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+class InProcessTransport(memory.Transport):
+    '''
+    The memory transport, handing control back to the worker loop after an
+    empty poll instead of after two seconds
+
+    With a thread pool the acks of finished tasks are sent from that loop,
+    and until they are sent the prefetch limit keeps new tasks from being
+    fetched
+    '''
+
+    def drain_events(self, connection, timeout=None):
+        # raises socket.timeout when nothing came, the loop carries on
+        return super().drain_events(
+            connection, timeout=min(timeout or self.polling_interval,
+                                    self.polling_interval))
+
+
+class InProcessWorker:
+    '''
+    Celery worker running in a thread of this process, consuming the
+    in memory broker of IN_PROCESS_MODE with a pool of `concurrency` threads
+
+    A thread pool because the broker and the result store only exist in
+    this process, prefork children could not share them
+    '''
+
+    def __init__(self, app, concurrency=None):
+        self.app = app
+        self.concurrency = concurrency or settings.IN_PROCESS_CONCURRENCY
+        self._worker = None
+        self._thread = None
+
+    def start(self, timeout=10):
+        ready = threading.Event()
+        self._worker = self.app.WorkController(
+            app=self.app,
+            hostname=anon_nodename(),
+            pool='threads',
+            concurrency=self.concurrency,
+            queues=[queue.name for queue in settings.CELERY_TASK_QUEUES],
+            without_heartbeat=True,
+            without_mingle=True,
+            without_gossip=True,
+            ready_callback=lambda *args: ready.set()
+        )
+        self._thread = threading.Thread(
+            target=self._worker.start, name='celery-in-process', daemon=True)
+        self._thread.start()
+        if not ready.wait(timeout):
+            raise RuntimeError('In process worker did not start')
+        # the pool marks the process as a worker, where waiting on a result
+        # is refused, the web app sharing it still may
+        _set_task_join_will_block(False)
+        logger.info('In process worker started, %s threads', self.concurrency)
+
+    def stop(self, timeout=10):
+        if self._worker is None:
+            return
+        # warm shutdown, tasks already running are finished
+        state.should_terminate = 0
+        self._thread.join(timeout)
+        state.should_terminate = None
+        self._worker = self._thread = None
@@ -0,0 +1,120 @@
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from project.redis_utils import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class LookupCache:
+    '''
+    Bounded TTL cache in front of a lookup, in process first and optionally
+    in Redis second so fills are shared by every worker
+
+    `None` records a lookup that found nothing, it is kept for at most
+    `negative_ttl` seconds so a row inserted meanwhile is seen soon
+    '''
+
+    def __init__(self, prefix, ttl, negative_ttl, max_entries, use_redis=False):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.negative_ttl = min(negative_ttl, ttl)
+        self.max_entries = max_entries
+        self.use_redis = use_redis
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires at, value)
+        self._lock = threading.Lock()
+
+    def _redis_key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def _ttl_for(self, value):
+        return self.ttl if value is not None else self.negative_ttl
+
+    def _store_local(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self._ttl_for(value), value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        '''
+        Cached value (None for a cached miss), or MISSING
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+
+        if self.use_redis:
+            try:
+                raw = get_redis_client().get(self._redis_key(key))
+            except Exception:
+                logger.exception('Could not read %s from Redis', key)
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self._store_local(key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return MISSING
+
+    def set(self, key, value):
+        self._store_local(key, value)
+        if self.use_redis:
+            try:
+                get_redis_client().set(
+                    self._redis_key(key), json.dumps(value),
+                    px=int(self._ttl_for(value) * 1000))
+            except Exception:
+                logger.exception('Could not write %s to Redis', key)
+
+    def delete(self, key):
+        '''
+        Forget a key whose value changed, in this process and in Redis
+
+        Other processes keep their in process copy for at most `ttl`
+        '''
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.use_redis:
+            try:
+                get_redis_client().delete(self._redis_key(key))
+            except Exception:
+                logger.exception('Could not delete %s from Redis', key)
+
+    def get_or_load(self, key, load):
+        value = self.get(key)
+        if value is MISSING:
+            value = load()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else None,
+            'size': len(self._entries),
+        }
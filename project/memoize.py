@@ -0,0 +1,112 @@
+import time
+import uuid
+import hashlib
+import inspect
+import logging
+
+from kombu.utils.json import dumps, loads
+
+from project.config import settings
+from project.redis_utils import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+# compare-and-delete, so a leader never releases a lock it no longer owns
+RELEASE_LOCK_SCRIPT = '''
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+'''
+
+MISSING = object()
+
+
+def make_cache_key(task_name, func, args, kwargs):
+    '''
+    Key on the bound arguments, so `divide(1, 2)` and `divide(x=1, y=2)`
+    share the same entry
+    '''
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        normalized = bound.arguments
+    except TypeError:
+        normalized = {'args': args, 'kwargs': kwargs}
+
+    digest = hashlib.sha256(
+        dumps(normalized, sort_keys=True).encode()
+    ).hexdigest()
+    return f'memo:{task_name}:{digest}'
+
+
+class TaskMemoizer:
+
+    INDEX_KEY = 'memo:index'
+
+    def __init__(self, ttl=None, max_entries=None, lock_timeout=None,
+                 poll_interval=0.05, client=None):
+        self.ttl = ttl or settings.TASK_MEMOIZE_TTL
+        self.max_entries = max_entries or settings.TASK_MEMOIZE_MAX_ENTRIES
+        self.lock_timeout = lock_timeout or settings.TASK_MEMOIZE_LOCK_TIMEOUT
+        self.poll_interval = poll_interval
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or get_redis_client()
+
+    def get(self, key):
+        raw = self.client.get(key)
+        if raw is None:
+            return MISSING
+        return loads(raw)['result']
+
+    def set(self, key, result):
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.set(key, dumps({'result': result}), ex=self.ttl)
+        pipe.zadd(self.INDEX_KEY, {key: now})
+        pipe.zremrangebyscore(self.INDEX_KEY, '-inf', now - self.ttl)
+        pipe.zcard(self.INDEX_KEY)
+        size = pipe.execute()[-1]
+
+        overflow = size - self.max_entries
+        if overflow > 0:
+            evicted = [k for k, _ in self.client.zpopmin(self.INDEX_KEY, overflow)]
+            if evicted:
+                self.client.delete(*evicted)
+
+    def get_or_compute(self, key, func, *args, **kwargs):
+        result = self.get(key)
+        if result is not MISSING:
+            return result
+
+        lock_key = f'{key}:lock'
+        token = uuid.uuid4().hex
+        if self.client.set(lock_key, token, nx=True, ex=self.lock_timeout):
+            try:
+                # the previous leader may have finished in the meantime
+                result = self.get(key)
+                if result is MISSING:
+                    result = func(*args, **kwargs)
+                    self.set(key, result)
+                return result
+            finally:
+                self.client.register_script(RELEASE_LOCK_SCRIPT)(
+                    keys=[lock_key], args=[token])
+
+        # another worker is computing the same call, wait for its result
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            result = self.get(key)
+            if result is not MISSING:
+                return result
+            if not self.client.exists(lock_key):
+                # the leader failed without storing a result
+                break
+
+        logger.info('Memoized call %s was not resolved by the leader', key)
+        return func(*args, **kwargs)
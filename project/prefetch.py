@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+
+from celery import bootsteps
+from celery.signals import task_postrun, task_prerun
+
+from project.config import settings
+from project.redis_utils import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+RUNTIME_KEY = 'prefetch:runtime'  # queue -> moving average runtime, seconds
+WORKERS_KEY = 'prefetch:workers'  # worker hostname -> current prefetch
+
+# the average moves by `alpha` per task, a batch of n tasks with mean m
+# moves it as n tasks of runtime m would
+UPDATE_AVERAGE_SCRIPT = '''
+local old = tonumber(redis.call('hget', KEYS[1], ARGV[1]))
+local mean = tonumber(ARGV[2]) / tonumber(ARGV[3])
+local new = mean
+if old then
+    local weight = 1 - math.pow(1 - tonumber(ARGV[4]), tonumber(ARGV[3]))
+    new = old + weight * (mean - old)
+end
+redis.call('hset', KEYS[1], ARGV[1], tostring(new))
+return tostring(new)
+'''
+
+
+class RuntimeRecorder:
+    '''
+    Task runtimes summed per queue in the process running the tasks, and
+    folded into the moving averages in Redis every `flush_interval` seconds
+    by the task finishing after it, so short tasks cost no round trip each
+    '''
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._totals = defaultdict(lambda: [0.0, 0])  # queue -> [sum, count]
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, queue, runtime):
+        with self._lock:
+            totals = self._totals[queue]
+            totals[0] += runtime
+            totals[1] += 1
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            totals, self._totals = self._totals, defaultdict(lambda: [0.0, 0])
+            self._flushed_at = time.monotonic()
+        try:
+            client = get_redis_client()
+            for queue, (total, count) in totals.items():
+                client.eval(UPDATE_AVERAGE_SCRIPT, 1, RUNTIME_KEY, queue,
+                            total, count, settings.PREFETCH_RUNTIME_ALPHA)
+        except Exception:
+            logger.exception('Could not record task runtimes')
+
+
+recorder = RuntimeRecorder(settings.PREFETCH_FLUSH_INTERVAL)
+_started = {}
+
+
+@task_prerun.connect
+def start_runtime(task_id=None, **kwargs):
+    if settings.PREFETCH_TUNING_ENABLED:
+        _started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def finish_runtime(task_id=None, task=None, **kwargs):
+    started = _started.pop(task_id, None)
+    queue = (task.request.delivery_info or {}).get('routing_key')
+    if started is not None and queue:
+        recorder.record(queue, time.perf_counter() - started)
+
+
+def get_queue_runtimes(queues=None):
+    runtimes = {
+        queue.decode(): float(runtime)
+        for queue, runtime in get_redis_client().hgetall(RUNTIME_KEY).items()
+    }
+    if queues is not None:
+        runtimes = {q: r for q, r in runtimes.items() if q in queues}
+    return runtimes
+
+
+def get_worker_prefetch():
+    return {
+        hostname.decode(): json.loads(value)
+        for hostname, value in get_redis_client().hgetall(WORKERS_KEY).items()
+    }
+
+
+def prefetch_multiplier(runtimes):
+    '''
+    Messages reserved per pool process, enough for each to have
+    PREFETCH_BUFFER_SECONDS of work waiting, going by the slowest queue the
+    worker consumes so long tasks are never hoarded by one worker
+
+    Queues without a measured runtime yet keep the configured multiplier
+    '''
+    if not runtimes:
+        return settings.CELERY_WORKER_PREFETCH_MULTIPLIER
+    runtime = max(max(runtimes.values()), 1e-6)
+    return max(settings.PREFETCH_MIN_MULTIPLIER, min(
+        settings.PREFETCH_MAX_MULTIPLIER,
+        int(settings.PREFETCH_BUFFER_SECONDS / runtime)
+    ))
+
+
+class PrefetchTuner(bootsteps.StartStopStep):
+    '''
+    Consumer step moving the prefetch count of the worker with the runtimes
+    of its queues, every PREFETCH_TUNE_INTERVAL seconds
+
+    With late acks a prefetched message stays unacked until its task ends,
+    a lost worker has every message it reserved redelivered, at most
+    PREFETCH_MAX_MULTIPLIER per process
+    '''
+
+    requires = ('celery.worker.consumer.tasks:Tasks',)
+
+    def __init__(self, c, **kwargs):
+        self.enabled = settings.PREFETCH_TUNING_ENABLED
+        self.timer_ref = None
+
+    def start(self, c):
+        self.timer_ref = c.timer.call_repeatedly(
+            settings.PREFETCH_TUNE_INTERVAL, self.tune, (c,), priority=10)
+
+    def stop(self, c):
+        if self.timer_ref:
+            self.timer_ref.cancel()
+            self.timer_ref = None
+
+    def tune(self, c):
+        if not c.initial_prefetch_count or c.qos is None:
+            return  # prefetch disabled, or not consuming right now
+        queues = [queue.name for queue in c.task_consumer.queues]
+        try:
+            multiplier = prefetch_multiplier(get_queue_runtimes(queues))
+        except Exception:
+            logger.exception('Could not read queue runtimes')
+            return
+
+        if multiplier != c.prefetch_multiplier:
+            # as celery does when the pool grows, the loop applies the new
+            # value and prefetch added for ETA tasks is kept
+            prefetch = c.pool.num_processes * multiplier
+            delta = prefetch - c.initial_prefetch_count
+            if delta > 0:
+                c.qos.increment_eventually(delta)
+            elif delta < 0:
+                c.qos.decrement_eventually(-delta)
+            c.prefetch_multiplier = multiplier
+            c.initial_prefetch_count = prefetch
+            logger.info('Prefetch of %s set to %s (x%s)',
+                        ', '.join(queues), prefetch, multiplier)
+
+        try:
+            get_redis_client().hset(WORKERS_KEY, c.hostname, json.dumps({
+                'prefetch': c.initial_prefetch_count,
+                'multiplier': c.prefetch_multiplier,
+                'queues': queues,
+                'updated_at': time.time()
+            }))
+        except Exception:
+            logger.exception('Could not publish prefetch count')
@@ -0,0 +1,90 @@
+import logging
+from urllib.parse import urlparse
+
+from celery.exceptions import Retry
+
+from project.config import settings
+from project.redis_utils import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY = 'ratelimit:{}'
+
+# refills the bucket for the time elapsed since the last call, then takes
+# the tokens or returns how many seconds until enough of them are back,
+# Redis server time keeps workers with skewed clocks in agreement
+TOKEN_BUCKET_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('time')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('pexpire', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+'''
+
+
+def get_host(url):
+    return urlparse(url).hostname or url
+
+
+def acquire(host, tokens=1):
+    '''
+    Seconds to wait before calling `host`, 0 when a token was taken
+
+    Hosts without an entry in OUTBOUND_RATE_LIMITS are not limited, and
+    Redis errors fail open
+    '''
+    limit = settings.OUTBOUND_RATE_LIMITS.get(host)
+    if limit is None:
+        return 0.0
+    try:
+        wait = get_redis_client().eval(
+            TOKEN_BUCKET_SCRIPT, 1, BUCKET_KEY.format(host),
+            limit['rate'], limit['burst'], tokens
+        )
+    except Exception:
+        logger.exception('Could not acquire rate limit token for %s', host)
+        return 0.0
+    return float(wait)
+
+
+def throttle(task, host):
+    '''
+    Take a token for `host` before an outbound call, or reschedule `task`
+    for when one is available
+
+    The reschedule keeps the retry count, running out of tokens does not
+    use up `max_retries`
+
+        @shared_task(bind=True)
+        def task_add_subscription(self, user_pk):
+            throttle(self, 'httpbin.org')
+    '''
+    wait = acquire(host)
+    if not wait:
+        return
+
+    if task.request.called_directly or task.request.is_eager:
+        raise Retry(f'Rate limited by {host}', when=wait)
+
+    signature = task.signature_from_request(countdown=wait)
+    signature.apply_async()
+    logger.info('Task %s[%s] rate limited by %s, rescheduled in %.2fs',
+                task.name, task.request.id, host, wait)
+    raise Retry(f'Rate limited by {host}', when=wait, sig=signature)
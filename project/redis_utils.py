@@ -0,0 +1,13 @@
+import redis
+
+from project.config import settings
+
+
+_clients = {}
+
+
+def get_redis_client(url: str = None) -> redis.Redis:
+    url = url or settings.REDIS_URL
+    if url not in _clients:
+        _clients[url] = redis.Redis.from_url(url)
+    return _clients[url]
@@ -0,0 +1,137 @@
+import bisect
+import hashlib
+from collections import defaultdict
+
+from celery.app.amqp import AMQP
+from celery.backends.base import KeyValueStoreBackend
+from celery.backends.redis import RedisBackend
+from kombu import pools
+from kombu.utils.encoding import bytes_to_str
+from kombu.utils.objects import cached_property
+
+from project.config import settings
+
+
+class HashRing:
+    '''
+    Consistent hashing of keys onto nodes, adding or removing a node only
+    moves the keys of its own slices of the ring
+    '''
+
+    def __init__(self, nodes, vnodes=160):
+        self.nodes = list(nodes)
+        ring = sorted(
+            (self._hash(f'{node}#{index}'), node)
+            for node in self.nodes for index in range(vnodes)
+        )
+        self._hashes = [point for point, _ in ring]
+        self._nodes = [node for _, node in ring]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def get_node(self, key):
+        if not self._nodes:
+            return None
+        index = bisect.bisect(self._hashes, self._hash(key))
+        return self._nodes[index % len(self._nodes)]
+
+
+ring = HashRing(settings.REDIS_SHARD_URLS)
+
+
+def shard_for(task_id):
+    '''
+    Redis endpoint holding the result and status channel of `task_id`,
+    None when sharding is off
+    '''
+    return ring.get_node(task_id)
+
+
+class ShardedRedisBackend(KeyValueStoreBackend):
+    '''
+    Result backend spreading result, group and chord keys over
+    REDIS_SHARD_URLS by the id they belong to, one RedisBackend per node
+
+    Results are fetched by polling, there is no single pub/sub connection
+    to wait on
+    '''
+
+    implements_incr = True
+
+    def __init__(self, app=None, url=None, urls=None, **kwargs):
+        super().__init__(app=app, url=url, **kwargs)
+        self.ring = HashRing(urls or settings.REDIS_SHARD_URLS)
+        self.nodes = {
+            node: RedisBackend(app=self.app, url=node, **kwargs)
+            for node in self.ring.nodes
+        }
+
+    def _shard_key(self, key):
+        key = self.key_t(key)
+        if key.startswith(self.chord_keyprefix):
+            return bytes_to_str(key[len(self.chord_keyprefix):])
+        return self._strip_prefix(key)
+
+    def node_for(self, key):
+        return self.nodes[self.ring.get_node(self._shard_key(key))]
+
+    def get(self, key):
+        return self.node_for(key).get(key)
+
+    def mget(self, keys):
+        by_node = defaultdict(list)
+        for index, key in enumerate(keys):
+            by_node[self.node_for(key)].append(index)
+
+        values = [None] * len(keys)
+        for node, indexes in by_node.items():
+            node_values = node.mget([keys[index] for index in indexes])
+            for index, value in zip(indexes, node_values):
+                values[index] = value
+        return values
+
+    def set(self, key, value):
+        return self.node_for(key).set(key, value)
+
+    def delete(self, key):
+        return self.node_for(key).delete(key)
+
+    def incr(self, key):
+        return self.node_for(key).incr(key)
+
+    def expire(self, key, value):
+        return self.node_for(key).expire(key, value)
+
+
+def queue_broker_url(queue):
+    '''
+    Broker node of `queue`, None for the default broker
+    '''
+    name = queue if isinstance(queue, str) else getattr(queue, 'name', None)
+    return settings.QUEUE_REDIS_NODES.get(
+        name or settings.CELERY_TASK_DEFAULT_QUEUE)
+
+
+class ShardedAMQP(AMQP):
+    '''
+    Publishes tasks of a queue listed in QUEUE_REDIS_NODES to that node
+    instead of the default broker, workers of the queue consume from it
+    with `--broker <node> -Q <queue>`
+    '''
+
+    @cached_property
+    def send_task_message(self):
+        send = self._create_task_sender()
+
+        def send_task_message(producer, name, message, queue=None, **kwargs):
+            url = queue_broker_url(queue)
+            if url is None:
+                return send(producer, name, message, queue=queue, **kwargs)
+
+            connection = self.app.connection_for_write(url)
+            with pools.producers[connection].acquire(block=True) as node_producer:
+                return send(node_producer, name, message, queue=queue, **kwargs)
+
+        return send_task_message
@@ -0,0 +1,6 @@
+from fastapi import APIRouter
+
+
+task_events_router = APIRouter(prefix='/tasks')
+
+from . import views, models, recorder, tasks  # noqa
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, DateTime, Index, Integer, String
+
+from project.database import Base
+
+
+class TaskRecord(Base):
+    '''
+    One row per task id, the latest lifecycle state and when it was
+    queued, last started and finished (UTC)
+    '''
+    __tablename__ = 'task_records'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task_id = Column(String(155), unique=True, nullable=False)
+    name = Column(String(200), nullable=True)
+    queue = Column(String(128), nullable=True)
+    state = Column(String(50), nullable=False)
+    retries = Column(Integer, nullable=False, default=0)
+
+    queued_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=False)  # time of the latest event
+
+    __table_args__ = (
+        # listing pages by id, filtered by state or name
+        Index('ix_task_records_state_id', 'state', 'id'),
+        Index('ix_task_records_name_id', 'name', 'id'),
+        Index('ix_task_records_queued_at', 'queued_at'),
+        # latency reads the latest finished tasks
+        Index('ix_task_records_finished_at', 'finished_at'),
+        Index('ix_task_records_name_finished_at', 'name', 'finished_at'),
+        # retention purge
+        Index('ix_task_records_updated_at', 'updated_at'),
+    )
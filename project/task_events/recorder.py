@@ -0,0 +1,178 @@
+import os
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from celery import states
+from celery.signals import (
+    before_task_publish, task_postrun, task_prerun, task_retry
+)
+from sqlalchemy import case, func
+
+from project.config import settings
+from project.database import engine
+from project.task_events.models import TaskRecord
+
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'QUEUED'
+
+FIELDS = ('name', 'queue', 'state', 'retries', 'queued_at', 'started_at',
+          'finished_at', 'updated_at')
+TIMESTAMPS = ('queued_at', 'started_at', 'finished_at', 'updated_at')
+
+
+def _latest(old, new):
+    if old is None or (new is not None and new > old):
+        return new
+    return old
+
+
+def merge(old, new):
+    '''
+    Combine two events for the same task, whatever order they arrive in,
+    the state of the latest event wins and every timestamp keeps its latest
+    value. Mirrors the upsert in `TaskEventRecorder.flush`
+    '''
+    merged = {
+        'name': new['name'] or old['name'],
+        'queue': new['queue'] or old['queue'],
+        'retries': max(old['retries'], new['retries']),
+        'state': new['state'] if new['updated_at'] >= old['updated_at']
+        else old['state'],
+    }
+    for field in TIMESTAMPS:
+        merged[field] = _latest(old[field], new[field])
+    return merged
+
+
+def _upsert_statement():
+    if engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    statement = insert(TaskRecord.__table__)
+    table, excluded = TaskRecord.__table__.c, statement.excluded
+
+    def latest(field):
+        return case(
+            (table[field].is_(None) | (excluded[field] > table[field]),
+             excluded[field]),
+            else_=table[field]
+        )
+
+    values = {field: latest(field) for field in TIMESTAMPS}
+    values.update(
+        name=func.coalesce(excluded.name, table.name),
+        queue=func.coalesce(excluded.queue, table.queue),
+        retries=case((excluded.retries > table.retries, excluded.retries),
+                     else_=table.retries),
+        state=case((excluded.updated_at >= table.updated_at, excluded.state),
+                   else_=table.state),
+    )
+    return statement.on_conflict_do_update(
+        index_elements=['task_id'], set_=values)
+
+
+class TaskEventRecorder:
+    '''
+    Buffers lifecycle events in memory, merged per task id, and writes them
+    with one upsert statement per batch from a background thread, every
+    `flush_interval` seconds or as soon as `flush_every` tasks are waiting
+
+    Events of one task come from the publisher and from the worker, so the
+    upsert tolerates them landing in any order
+    '''
+
+    def __init__(self, flush_every, flush_interval):
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.flush)
+
+    def _reset(self):
+        # the flush thread does not survive a fork, start a new one lazily
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def record(self, task_id, state, **fields):
+        event = dict.fromkeys(FIELDS)
+        event.update(fields, state=state, retries=fields.get('retries') or 0,
+                     updated_at=datetime.utcnow())
+        with self._lock:
+            old = self._pending.get(task_id)
+            self._pending[task_id] = merge(old, event) if old else event
+            if len(self._pending) >= self.flush_every:
+                self._wakeup.set()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='task-events', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        rows = [dict(event, task_id=task_id)
+                for task_id, event in pending.items()]
+        try:
+            with engine.begin() as connection:
+                connection.execute(_upsert_statement(), rows)
+        except Exception:
+            # dropped rather than kept, the index must not grow the worker
+            logger.exception('Could not write %s task events', len(rows))
+            return 0
+        return len(rows)
+
+
+recorder = TaskEventRecorder(
+    settings.TASK_EVENTS_FLUSH_EVERY, settings.TASK_EVENTS_FLUSH_INTERVAL)
+
+
+@before_task_publish.connect
+def record_queued(sender=None, headers=None, routing_key=None, **kwargs):
+    if not settings.TASK_EVENTS_ENABLED or not headers:
+        return
+    recorder.record(headers['id'], QUEUED, name=sender, queue=routing_key,
+                    retries=headers.get('retries'),
+                    queued_at=datetime.utcnow())
+
+
+@task_prerun.connect
+def record_started(task_id=None, task=None, **kwargs):
+    if not settings.TASK_EVENTS_ENABLED:
+        return
+    delivery_info = task.request.delivery_info or {}
+    recorder.record(task_id, states.STARTED, name=task.name,
+                    queue=delivery_info.get('routing_key'),
+                    retries=task.request.retries,
+                    started_at=datetime.utcnow())
+
+
+@task_retry.connect
+def record_retried(request=None, **kwargs):
+    if not settings.TASK_EVENTS_ENABLED:
+        return
+    recorder.record(request.id, states.RETRY, retries=request.retries + 1)
+
+
+@task_postrun.connect
+def record_finished(task_id=None, task=None, state=None, **kwargs):
+    if not settings.TASK_EVENTS_ENABLED or state not in states.READY_STATES:
+        return
+    recorder.record(task_id, state, name=task.name,
+                    finished_at=datetime.utcnow())
@@ -0,0 +1,51 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
+
+
+class TaskRecordOut(BaseModel):
+    task_id: str
+    name: Optional[str]
+    queue: Optional[str]
+    state: str
+    retries: int
+    queued_at: Optional[datetime]
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
+
+
+class TaskRecordPage(BaseModel):
+    results: List[TaskRecordOut]
+    next_cursor: Optional[int]
+
+
+class TaskLatency(BaseModel):
+    count: int
+    queue_wait: Dict[str, Optional[float]]  # seconds
+    run_time: Dict[str, Optional[float]]
+
+
+class DeadLetterOut(BaseModel):
+    id: str
+    task: str
+    args: List[Any]
+    kwargs: Dict[str, Any]
+    headers: Dict[str, Any]
+    exception: str
+    traceback: Optional[str]
+    failed_at: float
+
+
+class DeadLetterPage(BaseModel):
+    results: List[DeadLetterOut]
+    next_cursor: Optional[str]
+
+
+class ReplayBody(BaseModel):
+    name: Optional[str]
+    ids: Optional[List[str]]
+    limit: int = Field(1000, ge=1, le=100000)
+    rate: Optional[float] = Field(None, gt=0)  # tasks per second
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from celery import shared_task
+from celery.utils.log import get_task_logger
+
+from project.config import settings
+from project.database import db_context
+from project.task_events.models import TaskRecord
+
+
+logger = get_task_logger(__name__)
+
+
+@shared_task(name='low_priority:purge_task_records')
+def purge_task_records():
+    '''
+    Delete the records of tasks without an event for
+    TASK_EVENTS_RETENTION_DAYS, TASK_EVENTS_PURGE_BATCH_SIZE rows per
+    transaction so the table is never locked for long
+    '''
+    cutoff = datetime.utcnow() - timedelta(
+        days=settings.TASK_EVENTS_RETENTION_DAYS)
+    deleted = 0
+    with db_context() as session:
+        while True:
+            ids = [id for id, in session.query(TaskRecord.id).filter(
+                TaskRecord.updated_at < cutoff
+            ).limit(settings.TASK_EVENTS_PURGE_BATCH_SIZE)]
+            if not ids:
+                break
+            session.query(TaskRecord).filter(
+                TaskRecord.id.in_(ids)
+            ).delete(synchronize_session=False)
+            session.commit()
+            deleted += len(ids)
+
+    logger.info('Purged %s task records older than %s', deleted, cutoff)
+    return deleted
@@ -0,0 +1,172 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from project.task_events import task_events_router
+from project.task_events.models import TaskRecord
+from project.task_events.schemas import (
+    DeadLetterPage, ReplayBody, TaskLatency, TaskRecordPage
+)
+from project.backpressure import get_shed_counts
+from project.celery_utils import backfills
+from project.config import settings
+from project.database import get_read_db_session, keyset_paginate
+from project.deadline import get_expired_counts
+from project.dead_letter import list_dead_letters, replay_dead_letters
+from project.prefetch import get_queue_runtimes, get_worker_prefetch
+
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentiles(values):
+    '''
+    Nearest-rank percentiles of `values`, None for an empty sample
+    '''
+    values = sorted(values)
+    result = {}
+    for percentile in PERCENTILES:
+        if values:
+            rank = max(0, -(-percentile * len(values) // 100) - 1)
+            result[f'p{percentile}'] = values[rank]
+        else:
+            result[f'p{percentile}'] = None
+    return result
+
+
+def filter_tasks(query, name=None, since=None, until=None):
+    if name:
+        query = query.filter(TaskRecord.name == name)
+    if since:
+        query = query.filter(TaskRecord.queued_at >= since)
+    if until:
+        query = query.filter(TaskRecord.queued_at < until)
+    return query
+
+
+@task_events_router.get('/', response_model=TaskRecordPage)
+def list_tasks(
+    state: Optional[str] = None,
+    name: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    session: Session = Depends(get_read_db_session)
+):
+    query = filter_tasks(session.query(TaskRecord), name, since, until)
+    if state:
+        query = query.filter(TaskRecord.state == state.upper())
+
+    tasks, next_cursor = keyset_paginate(query, TaskRecord.id, cursor, limit)
+    return {'results': tasks, 'next_cursor': next_cursor}
+
+
+@task_events_router.get('/latency', response_model=TaskLatency)
+def task_latency(
+    name: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    session: Session = Depends(get_read_db_session)
+):
+    '''
+    Queue wait (queued to started) and run time (started to finished)
+    percentiles over the latest finished tasks
+    '''
+    query = filter_tasks(
+        session.query(TaskRecord.queued_at, TaskRecord.started_at,
+                      TaskRecord.finished_at),
+        name, since, until
+    ).filter(
+        TaskRecord.finished_at.isnot(None)
+    ).order_by(
+        TaskRecord.finished_at.desc()
+    ).limit(settings.TASK_EVENTS_LATENCY_SAMPLE)
+
+    queue_wait, run_time = [], []
+    rows = query.all()
+    for queued_at, started_at, finished_at in rows:
+        if started_at is None:
+            continue
+        if queued_at is not None and queued_at <= started_at:
+            queue_wait.append((started_at - queued_at).total_seconds())
+        if started_at <= finished_at:
+            run_time.append((finished_at - started_at).total_seconds())
+
+    return {
+        'count': len(rows),
+        'queue_wait': percentiles(queue_wait),
+        'run_time': percentiles(run_time),
+    }
+
+
+@task_events_router.get('/dead_letters/', response_model=DeadLetterPage)
+def dead_letters(
+    name: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    try:
+        entries, next_cursor = list_dead_letters(name, cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    return {'results': entries, 'next_cursor': next_cursor}
+
+
+@task_events_router.post('/dead_letters/replay')
+def replay(body: ReplayBody):
+    rate = body.rate or settings.DEAD_LETTER_REPLAY_RATE
+    replayed = replay_dead_letters(body.name, body.ids, body.limit, rate)
+    return {'replayed': replayed, 'seconds': replayed / rate}
+
+
+def get_backfill(name):
+    if name not in backfills:
+        raise HTTPException(status_code=404, detail='Unknown backfill')
+    return backfills[name]
+
+
+@task_events_router.get('/backfills/{name}')
+def backfill_status(name: str):
+    return get_backfill(name).status()
+
+
+@task_events_router.post('/backfills/{name}/start')
+def start_backfill(name: str, restart: bool = False):
+    '''
+    Start the backfill, or resume it from its checkpoint, from the first
+    row with `restart`
+    '''
+    return get_backfill(name).start(restart)
+
+
+@task_events_router.post('/backfills/{name}/pause')
+def pause_backfill(name: str):
+    return get_backfill(name).pause()
+
+
+@task_events_router.get('/expired')
+def expired_tasks():
+    '''
+    Calls skipped because their deadline passed before they started, by task
+    '''
+    return get_expired_counts()
+
+
+@task_events_router.get('/shed')
+def shed_requests():
+    '''
+    Requests answered 503 because the queue they enqueue to was overloaded,
+    by queue
+    '''
+    return get_shed_counts()
+
+
+@task_events_router.get('/prefetch')
+def prefetch():
+    '''
+    Moving average runtime of each queue, seconds, and the prefetch each
+    worker set from them
+    '''
+    return {'queues': get_queue_runtimes(), 'workers': get_worker_prefetch()}
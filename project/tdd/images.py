@@ -0,0 +1,154 @@
+import io
+import os
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from PIL import Image
+
+from project.config import settings
+
+
+FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+
+class DiskLRUCache:
+    '''
+    Size-bounded directory of generated files, least recently used first out
+
+    The index is rebuilt from file access times on start, so it survives
+    restarts and is shared (loosely) by every process using the directory
+    '''
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith('.tmp'):
+                continue
+            stat = os.stat(os.path.join(directory, name))
+            files.append((stat.st_atime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        '''
+        Contents of the cached file, None when it is not cached
+
+        Read here rather than handed out as a path, an eviction by another
+        request could remove the file before it is sent
+        '''
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file_object:
+                data = file_object.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # never generated, or evicted by another process
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+            return None
+
+        with self._lock:
+            self._size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+        return data
+
+    def put(self, key, data):
+        path = self.path(key)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as file_object:
+            file_object.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                evicted, size = self._entries.popitem(last=False)
+                self._size -= size
+                try:
+                    os.remove(self.path(evicted))
+                except FileNotFoundError:
+                    pass
+        return data
+
+
+def variant_key(source_path, size, image_format):
+    # the source mtime is part of the key, a re-upload gets new variants
+    mtime = os.stat(source_path).st_mtime_ns
+    digest = hashlib.sha256(
+        f'{source_path}:{mtime}:{size}:{image_format}'.encode()
+    ).hexdigest()
+    return f'{digest}.{image_format}'
+
+
+def resize_image(source_path, size, image_format):
+    pil_format, _ = FORMATS[image_format]
+    with Image.open(source_path) as image:
+        image.thumbnail((size, size))
+        if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, pil_format)
+    return output.getvalue()
+
+
+class AvatarVariants:
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, source_path, size, image_format, key=None):
+        '''
+        Bytes and key of the cached variant, concurrent requests for the
+        same missing variant wait on a single resize
+        '''
+        key = key or variant_key(source_path, size, image_format)
+        data = self.cache.get(key)
+        if data:
+            return data, key
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            return future.result(), key
+
+        try:
+            data = self.cache.put(
+                key, resize_image(source_path, size, image_format))
+            future.set_result(data)
+            return data, key
+        except Exception as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+avatar_variants = AvatarVariants(
+    DiskLRUCache(settings.AVATAR_CACHE_DIR, settings.AVATAR_CACHE_MAX_BYTES)
+)
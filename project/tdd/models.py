@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String
 
 from project.database import Base
 
@@ -12,3 +12,10 @@ class Member(Base):
 
     avatar = Column(String(256), nullable=False)
     avatar_thumbnail = Column(String(256), nullable=True)
+
+    __table_args__ = (
+        Index('ix_members_username_pattern', 'username', 'id',
+              postgresql_ops={'username': 'varchar_pattern_ops'}),
+        Index('ix_members_email_pattern', 'email', 'id',
+              postgresql_ops={'email': 'varchar_pattern_ops'}),
+    )
@@ -0,0 +1,18 @@
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class MemberOut(BaseModel):
+    id: int
+    username: str
+    email: str
+    avatar: str
+    avatar_thumbnail: Optional[str]
+
+    class Config:
+        orm_mode = True
+
+
+class MemberPage(BaseModel):
+    results: List[MemberOut]
+    next_cursor: Optional[int]
@@ -2,6 +2,7 @@ import os
 from PIL import Image
 from celery import shared_task
 
+from project.celery_utils import register_backfill
 from project.config import settings
 from project.database import db_context
 from project.tdd.models import Member
@@ -31,3 +32,22 @@ def generate_avatar_thumbnail(member_pk):
         member.avatar_thumbnail = thumbnail_path
         session.add(member)
         session.commit()
+
+
+@shared_task(name='low_priority:backfill_avatar_thumbnail')
+def backfill_avatar_thumbnail(member_pk):
+    # members given a thumbnail since the backfill read them are skipped
+    with db_context() as session:
+        thumbnail = session.query(Member.avatar_thumbnail).filter(
+            Member.id == member_pk
+        ).scalar()
+    if thumbnail is None:
+        generate_avatar_thumbnail(member_pk)
+
+
+@register_backfill('avatar_thumbnails', Member.id, backfill_avatar_thumbnail)
+def members_without_thumbnail(session):
+    '''
+    Members who uploaded their avatar before thumbnails were generated
+    '''
+    return session.query(Member.id).filter(Member.avatar_thumbnail.is_(None))
@@ -1,15 +1,26 @@
 import os
-from fastapi import File, UploadFile, Depends, Form
+from typing import Optional
+from fastapi import File, HTTPException, Request, UploadFile, Depends, Form, Query
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 
 from . import tdd_router
 from project.config import settings
-from project.database import get_db_session
+from project.backpressure import admit
+from project.exports import export_response, export_table, queue_export
+from project.database import (
+    get_db_session, get_read_db_session, keyset_paginate, prefix_filter
+)
+from project.tdd.images import FORMATS, avatar_variants, variant_key
 from project.tdd.models import Member
+from project.tdd.schemas import MemberPage
 from project.tdd.tasks import generate_avatar_thumbnail
 
 
-@tdd_router.post('/member_signup/')
+@tdd_router.post(
+    '/member_signup/',
+    dependencies=[Depends(admit(generate_avatar_thumbnail))]
+)
 def member_signup(
     username: str = Form(...),
     email: str = Form(...),
@@ -37,3 +48,69 @@ def member_signup(
 
     generate_avatar_thumbnail.delay(member_id)
     return {'message': 'Sign up successful'}
+
+
+@tdd_router.get('/members/', response_model=MemberPage)
+def list_members(
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    username: Optional[str] = None,
+    email: Optional[str] = None,
+    session: Session = Depends(get_read_db_session)
+):
+    query = session.query(Member)
+    if username:
+        query = query.filter(prefix_filter(Member.username, username))
+    if email:
+        query = query.filter(prefix_filter(Member.email, email))
+
+    members, next_cursor = keyset_paginate(query, Member.id, cursor, limit)
+    return {'results': members, 'next_cursor': next_cursor}
+
+
+@tdd_router.get('/members/export')
+def export_members(format: str = 'ndjson'):
+    return export_response('members', format)
+
+
+@tdd_router.post(
+    '/members/export',
+    dependencies=[Depends(admit(export_table))]
+)
+def queue_members_export(format: str = 'ndjson'):
+    return queue_export('members', format)
+
+
+@tdd_router.get('/members/{member_id}/avatar')
+def member_avatar(
+    member_id: int,
+    request: Request,
+    size: int = 100,
+    format: str = 'jpeg',
+    session: Session = Depends(get_read_db_session)
+):
+    if size not in settings.AVATAR_ALLOWED_SIZES or format not in FORMATS:
+        raise HTTPException(status_code=400, detail='Unsupported size or format')
+
+    member = session.query(Member).get(member_id)
+    if member is None:
+        raise HTTPException(status_code=404, detail='Member not found')
+
+    source_path = os.path.join(settings.UPLOADS_DEFAULT_DEST, member.avatar)
+    if not os.path.exists(source_path):
+        raise HTTPException(status_code=404, detail='Avatar not found')
+
+    # the key only needs the source mtime, a revalidation is answered
+    # without reading or generating the variant
+    key = variant_key(source_path, size, format)
+    headers = {
+        'ETag': f'"{key}"',
+        'Cache-Control': 'public, max-age=31536000'
+    }
+    if request.headers.get('if-none-match') == headers['ETag']:
+        return Response(status_code=304, headers=headers)
+
+    # sync route, so the resize runs in the threadpool and not on the loop
+    data, _ = avatar_variants.get_or_create(source_path, size, format, key)
+    _, media_type = FORMATS[format]
+    return Response(data, media_type=media_type, headers=headers)
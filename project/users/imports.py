@@ -0,0 +1,155 @@
+import io
+import csv
+
+from pydantic import ValidationError
+from sqlalchemy import func, insert, text
+
+from project.users.models import User, UserImportChunk
+from project.users.schemas import UserBody
+
+
+MAX_CHUNK_ERRORS = 10
+
+
+def plan_chunks(path, chunk_size):
+    '''
+    Header columns and the (start, end) byte offsets of every chunk of
+    `chunk_size` rows, found in one pass over the lines of the file
+
+    Rows are one per line, a quoted field spanning lines is not supported
+    '''
+    chunks = []
+    with open(path, 'rb') as file_object:
+        columns = _parse_header(file_object.readline())
+        start = offset = file_object.tell()
+        rows = 0
+        for line in file_object:
+            offset += len(line)
+            rows += 1
+            if rows == chunk_size:
+                chunks.append((start, offset))
+                start, rows = offset, 0
+        if rows:
+            chunks.append((start, offset))
+    return columns, chunks
+
+
+def _parse_header(line):
+    columns = next(csv.reader([line.decode('utf-8-sig')]), [])
+    return [column.strip() for column in columns]
+
+
+def read_header(path):
+    with open(path, 'rb') as file_object:
+        return _parse_header(file_object.readline())
+
+
+def read_chunk(path, start, end, columns):
+    with open(path, 'rb') as file_object:
+        file_object.seek(start)
+        data = file_object.read(end - start).decode('utf-8')
+    return list(csv.DictReader(io.StringIO(data), fieldnames=columns))
+
+
+def validate_rows(rows):
+    '''
+    Rows that pass `UserBody`, and a description of the ones that do not
+    '''
+    users, errors = [], []
+    for number, row in enumerate(rows):
+        try:
+            # extra values of a row land under the None key
+            users.append(UserBody(
+                **{column: value for column, value in row.items() if column}
+            ).dict())
+        except ValidationError as exc:
+            errors.append({'row': number, 'error': str(exc).replace('\n', ' ')})
+    return users, errors
+
+
+def bulk_insert_users(session, users):
+    '''
+    Insert `users` skipping usernames and emails that already exist,
+    returns how many were inserted
+    '''
+    if not users:
+        return 0
+
+    if session.bind.dialect.name == 'postgresql':
+        # COPY into a scratch table, then one INSERT .. SELECT
+        session.execute(text(
+            'CREATE TEMP TABLE user_import_rows '
+            '(username varchar(128), email varchar(128)) ON COMMIT DROP'
+        ))
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            (user['username'], user['email']) for user in users)
+        buffer.seek(0)
+        cursor = session.connection().connection.cursor()
+        cursor.copy_expert(
+            'COPY user_import_rows (username, email) FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+        result = session.execute(text(
+            'INSERT INTO users (username, email) '
+            'SELECT username, email FROM user_import_rows '
+            'ON CONFLICT DO NOTHING'
+        ))
+        return result.rowcount
+
+    result = session.execute(
+        insert(User.__table__).prefix_with('OR IGNORE'), users)
+    return result.rowcount
+
+
+def import_chunk(session, user_import, chunk, start, end):
+    '''
+    Import one chunk and checkpoint it in the same transaction, returns the
+    checkpoint (the existing one when the chunk was already imported)
+    '''
+    checkpoint = session.query(UserImportChunk).get((user_import.id, chunk))
+    if checkpoint is not None:
+        return checkpoint
+
+    rows = read_chunk(user_import.path, start, end, user_import.columns)
+    users, errors = validate_rows(rows)
+    inserted = bulk_insert_users(session, users)
+
+    checkpoint = UserImportChunk(
+        import_id=user_import.id,
+        chunk=chunk,
+        rows=len(rows),
+        inserted=inserted,
+        invalid=len(errors),
+        errors=errors[:MAX_CHUNK_ERRORS]
+    )
+    session.add(checkpoint)
+    session.commit()
+    return checkpoint
+
+
+def import_progress(session, user_import):
+    done, rows, inserted, invalid = session.query(
+        func.count(UserImportChunk.chunk),
+        func.coalesce(func.sum(UserImportChunk.rows), 0),
+        func.coalesce(func.sum(UserImportChunk.inserted), 0),
+        func.coalesce(func.sum(UserImportChunk.invalid), 0),
+    ).filter(UserImportChunk.import_id == user_import.id).one()
+
+    if user_import.total_chunks is None:
+        status = 'planning'
+    elif done >= user_import.total_chunks:
+        status = 'done'
+    else:
+        status = 'running'
+
+    return {
+        'import_id': user_import.id,
+        'status': status,
+        'total_chunks': user_import.total_chunks,
+        'done_chunks': done,
+        'rows': rows,
+        'inserted': inserted,
+        'skipped': rows - inserted - invalid,  # already existing users
+        'invalid': invalid,
+    }
@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String
+from datetime import datetime
+from sqlalchemy import (
+    JSON, Column, DateTime, ForeignKey, Index, Integer, String
+)
 
 from project.database import Base
 
@@ -10,6 +13,48 @@ class User(Base):
     username = Column(String(128), unique=True, nullable=False)
     email = Column(String(128), unique=True, nullable=False)
 
+    # `LIKE 'prefix%'` can only use an index built with pattern ops on
+    # Postgres, the unique indexes above follow the database collation.
+    # `id` second, so the `id > cursor` of a prefix listing is checked on
+    # the index and rows of earlier pages are never fetched from the heap
+    __table_args__ = (
+        Index('ix_users_username_pattern', 'username', 'id',
+              postgresql_ops={'username': 'varchar_pattern_ops'}),
+        Index('ix_users_email_pattern', 'email', 'id',
+              postgresql_ops={'email': 'varchar_pattern_ops'}),
+    )
+
     def __init__(self, username, email, *args, **kwargs):
         self.username = username
         self.email = email
+
+
+class UserImport(Base):
+    '''
+    A CSV of users uploaded for bulk import, imported in chunks of
+    `chunk_size` rows, `total_chunks` is known once the file is planned
+    '''
+    __tablename__ = 'user_imports'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    filename = Column(String(256), nullable=False)
+    path = Column(String(512), nullable=False)
+    columns = Column(JSON, nullable=True)  # header order
+    chunk_size = Column(Integer, nullable=False)
+    total_chunks = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class UserImportChunk(Base):
+    '''
+    Checkpoint of an imported chunk, committed with its users so a chunk
+    is imported once however often its task runs
+    '''
+    __tablename__ = 'user_import_chunks'
+
+    import_id = Column(Integer, ForeignKey('user_imports.id'), primary_key=True)
+    chunk = Column(Integer, primary_key=True)
+    rows = Column(Integer, nullable=False)
+    inserted = Column(Integer, nullable=False)
+    invalid = Column(Integer, nullable=False)
+    errors = Column(JSON, nullable=False, default=list)  # first few
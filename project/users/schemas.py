@@ -1,6 +1,21 @@
+from typing import List, Optional
 from pydantic import BaseModel, EmailStr
 
 
 class UserBody(BaseModel):
     username: str
     email: EmailStr
+
+
+class UserOut(BaseModel):
+    id: int
+    username: str
+    email: str
+
+    class Config:
+        orm_mode = True
+
+
+class UserPage(BaseModel):
+    results: List[UserOut]
+    next_cursor: Optional[int]
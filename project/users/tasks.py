@@ -1,34 +1,44 @@
 import time
 import random
 import requests
-from asgiref.sync import async_to_sync
 
-from celery import Task, shared_task
+from celery import group, shared_task
 from celery.signals import task_postrun
 from celery.utils.log import get_task_logger
+from sqlalchemy.exc import IntegrityError
 
-from project.database import db_context
-from project.celery_utils import custom_celery_task
+from project.config import settings
+from project.database import db_context, read_db_context
+from project.deadline import budget
+from project.rate_limit import get_host, throttle
+from project.celery_utils import (
+    DeadlineTask, batch_celery_task, custom_celery_task, event_loop_thread
+)
 
 
 logger = get_task_logger(__name__)
 
 
-class BaseTaskWithRetry(Task):
+class BaseTaskWithRetry(DeadlineTask):
     autoretry_for = (Exception, KeyError)
     retry_kwargs = {'max_retries': 5}
     retry_backoff = True
 
 
-@shared_task(bind=True)
+# left blocking for want of an async HTTP client in requirements.txt, as an
+# `async def` task it would not hold a pool slot while waiting on httpbin,
+# see benchmarks/bench_async_tasks.py
+@shared_task(bind=True, base=DeadlineTask)
 def task_add_subscription(self, user_pk):
-    with db_context() as session:
+    throttle(self, 'httpbin.org')
+    with read_db_context() as session:
         try:
             from project.users.models import User
 
             user = session.query(User).get(user_pk)
             requests.post('https://httpbin.org/delay/5',
-                          data={'email': user.email})
+                          data={'email': user.email},
+                          timeout=budget(settings.OUTBOUND_HTTP_TIMEOUT))
         except Exception as e:
             raise self.retry(exc=e)
 
@@ -53,7 +63,7 @@ def dynamic_example_three():
     logger.info('Example three')
 
 
-@shared_task
+@custom_celery_task(memoize=True)
 def divide(x: int, y: int) -> float:
     # from celery.contrib import rdb
     # rdb.set_trace()
@@ -61,33 +71,83 @@ def divide(x: int, y: int) -> float:
     return x / y
 
 
-@shared_task
-def task_send_welcome_email(user_pk):
+@batch_celery_task()
+def task_send_welcome_email(batch):
     from project.users.models import User
 
-    with db_context() as session:
-        user = session.query(User).get(user_pk)
-        logger.info('Sent email to %s %s', user.email, user.id)
+    user_pks = [request.args[0] for request in batch]
+    with read_db_context() as session:
+        users = session.query(User).filter(User.id.in_(user_pks))
+        for user in users:
+            logger.info('Sent email to %s %s', user.email, user.id)
 
 
-@shared_task()
-def sample_task(email: str) -> None:
-    from project.users.views import api_call
+@shared_task(bind=True, base=DeadlineTask)
+def sample_task(self, email: str) -> None:
+    from project.users.views import API_CALL_URL, api_call
+    throttle(self, get_host(API_CALL_URL))
     api_call(email)
 
 
 # @shared_task(bind=True, base=BaseTaskWithRetry)
-@custom_celery_task(max_retires=3)
+@custom_celery_task(max_retires=3, rate_limit_host='httpbin.org')
 def task_process_notification(self):
     if not random.choice((0, 1)):
         raise Exception()
-    requests.post('https://httpbin.org/delay/5')
+    requests.post('https://httpbin.org/delay/5',
+                  timeout=budget(settings.OUTBOUND_HTTP_TIMEOUT))
+
+
+@custom_celery_task(name='low_priority:plan_user_import', max_retries=3)
+def plan_user_import(import_id):
+    from project.users.imports import plan_chunks
+    from project.users.models import UserImport, UserImportChunk
+
+    with db_context() as session:
+        user_import = session.query(UserImport).get(import_id)
+        columns, chunks = plan_chunks(user_import.path, user_import.chunk_size)
+        user_import.columns = columns
+        user_import.total_chunks = len(chunks)
+        session.commit()
+
+        # checkpointed chunks are skipped, this resumes an interrupted import
+        done = {chunk for chunk, in session.query(UserImportChunk.chunk)
+                .filter_by(import_id=import_id)}
+
+    pending = [
+        import_user_chunk.s(import_id, chunk, start, end)
+        for chunk, (start, end) in enumerate(chunks) if chunk not in done
+    ]
+    if pending:
+        group(pending).apply_async()
+    logger.info('Import %s: %s of %s chunks queued',
+                import_id, len(pending), len(chunks))
+    return len(pending)
+
+
+@custom_celery_task(name='low_priority:import_user_chunk', max_retries=3)
+def import_user_chunk(import_id, chunk, start, end):
+    from project.users.imports import import_chunk
+    from project.users.models import UserImport, UserImportChunk
+
+    with db_context() as session:
+        user_import = session.query(UserImport).get(import_id)
+        try:
+            checkpoint = import_chunk(session, user_import, chunk, start, end)
+        except IntegrityError:
+            # a redelivered copy of this task committed the chunk first
+            session.rollback()
+            checkpoint = session.query(UserImportChunk).get((import_id, chunk))
+            if checkpoint is None:
+                raise
+        return {'rows': checkpoint.rows, 'inserted': checkpoint.inserted,
+                'invalid': checkpoint.invalid}
 
 
 @task_postrun.connect
 def task_postrun_handler(task_id, **kwargs):
     from project.ws.views import update_celery_task_status
-    async_to_sync(update_celery_task_status)(task_id)
+    event_loop_thread.run(update_celery_task_status(task_id))
 
     from project.ws.views import update_celery_task_status_socketio
     update_celery_task_status_socketio(task_id)
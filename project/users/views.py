@@ -1,18 +1,34 @@
+import os
+import uuid
 import string
 import random
+import shutil
 import logging
 import requests
-from fastapi import Request, Depends
+from typing import Optional
+from fastapi import File, HTTPException, Request, Depends, Query, UploadFile
 from fastapi.responses import JSONResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
 
 from project.users import users_router
-from project.users.models import User
-from project.users.schemas import UserBody
-from project.database import get_db_session
+from project.users.imports import import_progress, read_header
+from project.users.models import User, UserImport
+from project.users.schemas import UserBody, UserPage
+from project.backpressure import admit
+from project.database import (
+    SessionLocal, get_db_session, get_read_db_session, keyset_paginate,
+    prefix_filter, read_db_context
+)
 from project.celery_utils import get_task_info
+from project.config import settings
+from project.deadline import budget, deadline_in
+from project.exports import export_response, export_table, queue_export
+from project.lookup_cache import LookupCache
 from project.users.tasks import (
+    plan_user_import,
     sample_task,
     task_add_subscription,
     task_send_welcome_email,
@@ -23,11 +39,47 @@ from project.users.tasks import (
 logger = logging.getLogger(__name__)
 templates = Jinja2Templates('project/users/templates')
 
+username_cache = LookupCache(
+    'username',
+    ttl=settings.USERNAME_CACHE_TTL,
+    negative_ttl=settings.USERNAME_CACHE_NEGATIVE_TTL,
+    max_entries=settings.USERNAME_CACHE_MAX_ENTRIES,
+    use_redis=settings.USERNAME_CACHE_REDIS
+)
+
+
+def stale_usernames(session):
+    return session.info.setdefault('stale_usernames', set())
+
+
+@event.listens_for(User, 'after_update')
+def username_changed(mapper, connection, target):
+    # the old name no longer maps to the id, the new one may be a cached miss
+    history = inspect(target).attrs.username.history
+    if history.deleted:
+        stale_usernames(object_session(target)).update(
+            history.deleted + history.added)
+
+
+@event.listens_for(User, 'after_delete')
+def user_deleted(mapper, connection, target):
+    stale_usernames(object_session(target)).add(target.username)
+
+
+@event.listens_for(SessionLocal, 'after_commit')
+def invalidate_usernames(session):
+    # dropped after the commit, a reload before it would read the old row
+    for username in session.info.pop('stale_usernames', ()):
+        username_cache.delete(username)
+
+
+API_CALL_URL = 'https://httpbin.org/delay/5'
+
 
 def api_call(email: str):
     if random.choice((0, 1)):
         raise Exception('Random processing error')
-    requests.post('https://httpbin.org/delay/5')
+    requests.post(API_CALL_URL, timeout=budget(settings.OUTBOUND_HTTP_TIMEOUT))
 
 
 def random_username():
@@ -36,21 +88,55 @@ def random_username():
     return username
 
 
-@users_router.post('/user_subscription')
+@users_router.get('/', response_model=UserPage)
+def list_users(
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    username: Optional[str] = None,
+    email: Optional[str] = None,
+    session: Session = Depends(get_read_db_session)
+):
+    query = session.query(User)
+    if username:
+        query = query.filter(prefix_filter(User.username, username))
+    if email:
+        query = query.filter(prefix_filter(User.email, email))
+
+    users, next_cursor = keyset_paginate(query, User.id, cursor, limit)
+    return {'results': users, 'next_cursor': next_cursor}
+
+
+@users_router.post(
+    '/user_subscription',
+    dependencies=[Depends(admit(task_add_subscription))]
+)
 def user_subscription(
     user_body: UserBody,
     session: Session = Depends(get_db_session)
 ):
+    def load_user_id():
+        # opened on a miss only, a cache hit never checks out a replica
+        with read_db_context() as read_session:
+            return read_session.query(User.id).filter_by(
+                username=user_body.username).scalar()
+
+    user_id = username_cache.get_or_load(user_body.username, load_user_id)
     try:
-        user = session.query(User).filter_by(
-            username=user_body.username).first()
-        if user:
-            user_id = user.id
-        else:
+        if user_id is None:
             user = User(**user_body.dict())
             session.add(user)
             session.commit()
             user_id = user.id
+            username_cache.set(user_body.username, user_id)
+    except IntegrityError:
+        # the replica lagged behind an insert made on the primary, or the
+        # cached miss raced one
+        session.rollback()
+        user_id = session.query(User.id).filter_by(
+            username=user_body.username).scalar()
+        if user_id is None:
+            raise
+        username_cache.set(user_body.username, user_id)
     except Exception as e:
         session.rollback()
         raise
@@ -59,6 +145,94 @@ def user_subscription(
     return {'message': 'successfully sent task to Celery'}
 
 
+@users_router.post(
+    '/imports/',
+    dependencies=[Depends(admit(plan_user_import))]
+)
+def create_user_import(
+    upload_file: UploadFile = File(...),
+    session: Session = Depends(get_db_session)
+):
+    '''
+    Bulk import users from a CSV with `username` and `email` columns
+    '''
+    os.makedirs(settings.USER_IMPORT_DIR, exist_ok=True)
+    path = os.path.join(settings.USER_IMPORT_DIR, f'{uuid.uuid4().hex}.csv')
+    with open(path, 'wb') as file_object:
+        shutil.copyfileobj(upload_file.file, file_object, 1024 * 1024)
+
+    missing = {'username', 'email'} - set(read_header(path))
+    if missing:
+        os.remove(path)
+        raise HTTPException(
+            status_code=400,
+            detail=f'Missing columns: {", ".join(sorted(missing))}')
+
+    try:
+        user_import = UserImport(
+            filename=upload_file.filename,
+            path=path,
+            chunk_size=settings.USER_IMPORT_CHUNK_SIZE
+        )
+        session.add(user_import)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        raise
+
+    plan_user_import.delay(user_import.id)
+    return import_progress(session, user_import)
+
+
+def get_user_import(import_id, session):
+    user_import = session.query(UserImport).get(import_id)
+    if user_import is None:
+        raise HTTPException(status_code=404, detail='Import not found')
+    return user_import
+
+
+@users_router.get('/imports/{import_id}')
+def user_import_progress(
+    import_id: int,
+    session: Session = Depends(get_db_session)
+):
+    return import_progress(session, get_user_import(import_id, session))
+
+
+@users_router.post(
+    '/imports/{import_id}/resume',
+    dependencies=[Depends(admit(plan_user_import))]
+)
+def resume_user_import(
+    import_id: int,
+    session: Session = Depends(get_db_session)
+):
+    '''
+    Queue the chunks of an import that have no checkpoint yet
+    '''
+    user_import = get_user_import(import_id, session)
+    plan_user_import.delay(user_import.id)
+    return import_progress(session, user_import)
+
+
+@users_router.get('/export')
+def export_users(format: str = 'ndjson'):
+    return export_response('users', format)
+
+
+@users_router.post(
+    '/export',
+    dependencies=[Depends(admit(export_table))]
+)
+def queue_users_export(format: str = 'ndjson'):
+    return queue_export('users', format)
+
+
+@users_router.get('/username_cache/')
+def username_cache_stats():
+    return username_cache.stats()
+
+
 @users_router.get('/transaction_celery/')
 def transaction_celery(session: Session = Depends(get_db_session)):
     try:
@@ -79,9 +253,11 @@ def form_example_get(request: Request):
     return templates.TemplateResponse('form.html', {'request': request})
 
 
-@users_router.post('/form/')
+@users_router.post('/form/', dependencies=[Depends(admit(sample_task))])
 def form_example_post(user_body: UserBody):
-    task = sample_task.delay(user_body.email)
+    # no point running it once the client has stopped waiting
+    task = sample_task.apply_async(
+        (user_body.email,), headers=deadline_in(settings.USERS_FORM_DEADLINE))
     return JSONResponse({'task_id': task.task_id})
 
 
@@ -99,7 +275,10 @@ def webhook_test_sync():
     return 'pong'
 
 
-@users_router.post('/webhook_test_async/')
+@users_router.post(
+    '/webhook_test_async/',
+    dependencies=[Depends(admit(task_process_notification))]
+)
 def webhook_test_async():
     task = task_process_notification.delay()
     logger.debug('Task id: %s', task.id)
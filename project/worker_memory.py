@@ -0,0 +1,96 @@
+import os
+import random
+import logging
+import resource
+import tracemalloc
+from collections import Counter, defaultdict
+
+from celery.signals import task_postrun, task_prerun
+
+from project.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+_stats = defaultdict(lambda: {'count': 0, 'rss_delta': 0, 'max_rss_delta': 0})
+_allocators = defaultdict(Counter)
+_inflight = {}
+_tasks_seen = 0
+
+
+def get_rss():
+    '''
+    Current resident set size in bytes
+    '''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # no procfs (macOS), fall back to the peak which only grows
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_memory_stats():
+    return {
+        name: dict(stats, top_allocators=_allocators[name].most_common(
+            settings.WORKER_MEMORY_TOP_ALLOCATORS))
+        for name, stats in _stats.items()
+    }
+
+
+def report():
+    by_growth = sorted(
+        _stats.items(), key=lambda item: item[1]['rss_delta'], reverse=True)
+    for name, stats in by_growth[:settings.WORKER_MEMORY_REPORT_TASKS]:
+        logger.info(
+            'Memory pid=%s task=%s count=%s rss_delta=%s max_rss_delta=%s '
+            'top_allocators=%s',
+            os.getpid(), name, stats['count'], stats['rss_delta'],
+            stats['max_rss_delta'],
+            _allocators[name].most_common(settings.WORKER_MEMORY_TOP_ALLOCATORS)
+        )
+
+
+@task_prerun.connect
+def start_memory_accounting(task_id=None, task=None, **kwargs):
+    snapshot = None
+    if settings.WORKER_TRACEMALLOC_SAMPLE_RATE and \
+            not tracemalloc.is_tracing() and \
+            random.random() < settings.WORKER_TRACEMALLOC_SAMPLE_RATE:
+        tracemalloc.start(settings.WORKER_TRACEMALLOC_FRAMES)
+        snapshot = tracemalloc.take_snapshot()
+    _inflight[task_id] = (get_rss(), snapshot)
+
+
+@task_postrun.connect
+def finish_memory_accounting(task_id=None, task=None, **kwargs):
+    global _tasks_seen
+
+    started = _inflight.pop(task_id, None)
+    if started is None:
+        return
+    rss_before, snapshot = started
+    rss_delta = get_rss() - rss_before
+
+    stats = _stats[task.name]
+    stats['count'] += 1
+    stats['rss_delta'] += rss_delta
+    stats['max_rss_delta'] = max(stats['max_rss_delta'], rss_delta)
+
+    if snapshot is not None:
+        # what the task allocated and still holds on to
+        diff = tracemalloc.take_snapshot().compare_to(snapshot, 'lineno')
+        tracemalloc.stop()
+        for stat in diff[:settings.WORKER_MEMORY_TOP_ALLOCATORS]:
+            if stat.size_diff > 0:
+                frame = stat.traceback[0]
+                _allocators[task.name][f'{frame.filename}:{frame.lineno}'] += \
+                    stat.size_diff
+
+    if rss_delta > settings.WORKER_MEMORY_LOG_THRESHOLD:
+        logger.warning('Task %s[%s] grew RSS by %s bytes',
+                       task.name, task_id, rss_delta)
+
+    _tasks_seen += 1
+    if _tasks_seen % settings.WORKER_MEMORY_REPORT_EVERY == 0:
+        report()
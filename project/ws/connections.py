@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+
+from starlette.websockets import WebSocketState
+
+
+logger = logging.getLogger(__name__)
+
+PING = {'type': 'ping'}
+
+# coalesced: statuses replaced by a newer one before they were sent
+# dropped: statuses still queued when the connection closed
+# closed_idle / closed_slow: connections closed as dead
+stats = Counter()
+
+
+class StatusConnection:
+    '''
+    Outbound side of one task status websocket
+
+    Statuses go through a queue of at most `max_queue` messages drained by
+    a single sender, when it is full only the newest status is kept. The
+    client has to answer the `{"type": "ping"}` sent every `ping_interval`
+    seconds (any message will do), a connection silent for `idle_timeout`
+    seconds, or slower than `send_timeout` to take a message, is closed
+    '''
+
+    def __init__(self, websocket, max_queue, ping_interval, idle_timeout,
+                 send_timeout):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.send_timeout = send_timeout
+        self.last_seen = time.monotonic()
+        self._queue = deque()
+        self._ping_pending = False
+        self._ready = asyncio.Event()
+
+    def put(self, message):
+        if len(self._queue) >= self.max_queue:
+            stats['coalesced'] += len(self._queue)
+            self._queue.clear()
+        self._queue.append(message)
+        self._ready.set()
+
+    async def _send(self, message):
+        await asyncio.wait_for(
+            self.websocket.send_json(message), self.send_timeout)
+
+    async def _sender(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            if self._ping_pending:
+                self._ping_pending = False
+                await self._send(PING)
+            while self._queue:
+                await self._send(self._queue.popleft())
+
+    async def _receiver(self):
+        while True:
+            message = await self.websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            self.last_seen = time.monotonic()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            if time.monotonic() - self.last_seen > self.idle_timeout:
+                stats['closed_idle'] += 1
+                return 'idle'
+            self._ping_pending = True
+            self._ready.set()
+
+    async def serve(self, relay):
+        '''
+        Run until `relay` (the coroutine feeding `put`) ends, the client
+        leaves, or the connection is found dead
+        '''
+        tasks = [
+            asyncio.ensure_future(coro) for coro in
+            (relay, self._sender(), self._receiver(), self._heartbeat())
+        ]
+        try:
+            done, _ = await asyncio.wait(
+                tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if isinstance(task.exception(), asyncio.TimeoutError):
+                    stats['closed_slow'] += 1
+                elif task.exception() is not None:
+                    logger.warning('Status websocket failed: %r',
+                                   task.exception())
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            stats['dropped'] += len(self._queue)
+            self._queue.clear()
+            await self.close()
+
+    async def close(self):
+        if self.websocket.client_state != WebSocketState.DISCONNECTED:
+            try:
+                await self.websocket.close(code=1001)
+            except Exception:
+                pass  # already gone
@@ -1,12 +1,21 @@
 import json
+import asyncio
 import socketio
+from celery import states
 from fastapi import WebSocket, FastAPI
 from socketio.asyncio_namespace import AsyncNamespace
 
-from project import broadcast
-from project.ws import ws_router
+from project import broadcast, shard_broadcasts
+from project.ws import connections, ws_router
+from project.ws.connections import StatusConnection
 from project.config import settings
 from project.celery_utils import get_task_info
+from project.sharding import shard_for
+
+
+def get_broadcast(task_id):
+    url = shard_for(task_id)
+    return shard_broadcasts[url] if url else broadcast
 
 
 @ws_router.websocket('/ws/task_status/{task_id}')
@@ -14,33 +23,82 @@ async def ws_task_status(websocket: WebSocket):
     await websocket.accept()
 
     task_id = websocket.scope['path_params']['task_id']
+    connection = StatusConnection(
+        websocket,
+        max_queue=settings.WS_SEND_QUEUE_SIZE,
+        ping_interval=settings.WS_PING_INTERVAL,
+        idle_timeout=settings.WS_IDLE_TIMEOUT,
+        send_timeout=settings.WS_SEND_TIMEOUT
+    )
+
+    async with get_broadcast(task_id).subscribe(channel=task_id) as subscriber:
+        connection.put(get_task_info(task_id))
+
+        async def relay():
+            async for event in subscriber:
+                connection.put(json.loads(event.message))
 
-    async with broadcast.subscribe(channel=task_id) as subscriber:
-        data = get_task_info(task_id)
-        await websocket.send(data)
+        await connection.serve(relay())
 
-        async for event in subscriber:
-            response = json.loads(event.message)
-            await websocket.send_json(response)
+
+@ws_router.get('/ws/stats')
+def ws_stats():
+    return dict(connections.stats)
 
 
 async def update_celery_task_status(task_id: str):
-    await broadcast.connect()
-    await broadcast.publish(
+    task_broadcast = get_broadcast(task_id)
+    await task_broadcast.connect()
+    await task_broadcast.publish(
         channel=task_id,
         message=json.dumps(get_task_info(task_id))
     )
-    await broadcast.disconnect()
+    await task_broadcast.disconnect()
 
 
 class TaskStatusNameSpace(AsyncNamespace):
+    '''
+    In IN_PROCESS_MODE workers do not emit to Socket.IO themselves, the
+    status updates of a joined task are relayed from `broadcast`
+    '''
+
+    def __init__(self, namespace=None):
+        super().__init__(namespace)
+        self._relays = {}  # task id -> relay task
+
     async def on_join(self, sid, data):
-        self.enter_room(sid=sid, room=data['task_id'])
-        await self.emit('status', get_task_info(data['task_id']), room=data['task_id'])
+        task_id = data['task_id']
+        self.enter_room(sid=sid, room=task_id)
+        if settings.IN_PROCESS_MODE and task_id not in self._relays:
+            # subscribed before the current status is read, so no update
+            # published in between is missed
+            subscribed = asyncio.Event()
+            self._relays[task_id] = asyncio.create_task(
+                self.relay(task_id, subscribed))
+            await subscribed.wait()
+
+        info = get_task_info(task_id)
+        await self.emit('status', info, room=task_id)
+        if info['state'] in states.READY_STATES and task_id in self._relays:
+            self._relays.pop(task_id).cancel()
+
+    async def relay(self, task_id, subscribed):
+        try:
+            async with broadcast.subscribe(channel=task_id) as subscriber:
+                subscribed.set()
+                async for event in subscriber:
+                    info = json.loads(event.message)
+                    await self.emit('status', info, room=task_id)
+                    if info['state'] in states.READY_STATES:
+                        break
+        finally:
+            self._relays.pop(task_id, None)
 
 
 def register_socketio_app(app: FastAPI):
-    mgr = socketio.AsyncRedisManager(settings.WS_MESSAGE_QUEUE)
+    # the default manager keeps the rooms in this process
+    mgr = None if settings.IN_PROCESS_MODE else \
+        socketio.AsyncRedisManager(settings.WS_MESSAGE_QUEUE)
     sio = socketio.AsyncServer(
         async_mode='asgi',
         client_manager=mgr,
@@ -53,6 +111,8 @@ def register_socketio_app(app: FastAPI):
 
 
 def update_celery_task_status_socketio(task_id):
+    if settings.IN_PROCESS_MODE:
+        return  # relayed by TaskStatusNameSpace
     external_sio = socketio.RedisManager(
         settings.WS_MESSAGE_QUEUE, write_only=True)
     external_sio.emit('status', get_task_info(task_id),
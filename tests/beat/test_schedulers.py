@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
+
+from project.beat.models import PeriodicTask
+from project.beat.schedulers import DatabaseScheduler
+
+
+@pytest.fixture
+def scheduler(db_session, app, monkeypatch):
+    # only the entry these tests were written against, `release-delayed-
+    # tasks` runs every second and would be sent by every tick
+    monkeypatch.setitem(app.celery_app.conf, 'CELERY_BEAT_SCHEDULE', {
+        'task-schedule-work': {'task': 'task_schedule_work', 'schedule': 200.0}
+    })
+    scheduler = DatabaseScheduler(app=app.celery_app)
+    scheduler.send_task = mock.MagicMock(name='send_task')
+    scheduler.producer = mock.MagicMock(name='producer')
+    return scheduler
+
+
+def add_schedule(session, name, next_run_at, interval=60.0, **kwargs):
+    periodic_task = PeriodicTask(
+        name=name,
+        task=name,
+        interval=interval,
+        next_run_at=next_run_at,
+        **kwargs
+    )
+    session.add(periodic_task)
+    session.commit()
+    return periodic_task
+
+
+def sent_names(scheduler):
+    return [call.args[0] for call in scheduler.send_task.call_args_list]
+
+
+def test_static_schedule_is_seeded(scheduler, db_session):
+    periodic_task = db_session.query(PeriodicTask).filter_by(
+        name='task-schedule-work').one()
+    assert periodic_task.task == 'task_schedule_work'
+    assert periodic_task.interval == 200.0
+
+
+def test_tick_sends_only_due_entries(scheduler, db_session):
+    now = datetime.utcnow()
+    due = add_schedule(db_session, 'due', now - timedelta(seconds=1),
+                       args=[1], queue='low_priority')
+    add_schedule(db_session, 'later', now + timedelta(hours=1))
+    add_schedule(db_session, 'disabled', now - timedelta(seconds=1),
+                 enabled=False)
+
+    scheduler.tick()
+
+    scheduler.send_task.assert_any_call(
+        'due', [1], {},
+        producer=scheduler.producer, queue='low_priority')
+    assert 'later' not in [entry.name for entry in scheduler._entries.values()]
+    assert scheduler.send_task.call_count == 2  # `due` and the seeded entry
+
+    db_session.expire_all()
+    due = db_session.query(PeriodicTask).get(due.id)
+    assert due.last_run_at is not None
+    assert due.next_run_at > now + timedelta(seconds=50)
+
+
+def test_changes_are_picked_up_incrementally(scheduler, db_session):
+    now = datetime.utcnow()
+    periodic_task = add_schedule(
+        db_session, 'edited', now + timedelta(hours=1))
+    scheduler.tick()
+    scheduler.send_task.reset_mock()
+
+    periodic_task.next_run_at = now - timedelta(seconds=1)
+    db_session.commit()
+    add_schedule(db_session, 'created', now - timedelta(seconds=1))
+
+    with mock.patch.object(scheduler, '_load_window') as load_window:
+        scheduler.tick()
+        load_window.assert_not_called()
+
+    assert sorted(sent_names(scheduler)) == ['created', 'edited']
+
+
+def test_disabled_entry_is_dropped(scheduler, db_session):
+    now = datetime.utcnow()
+    periodic_task = add_schedule(
+        db_session, 'soon', now + timedelta(seconds=2))
+    scheduler.tick()
+    scheduler.send_task.reset_mock()
+
+    periodic_task.enabled = False
+    db_session.commit()
+
+    with mock.patch('time.time', return_value=scheduler._horizon - 1):
+        scheduler.tick()
+
+    scheduler.send_task.assert_not_called()
+
+
+def test_full_batch_of_equal_run_times_is_sent(scheduler, db_session):
+    scheduler.batch_size = 5
+    run_at = datetime.utcnow() - timedelta(seconds=10)
+    names = [f'tied-{number}' for number in range(10)]
+    for name in names:
+        add_schedule(db_session, name, run_at)
+
+    scheduler.tick()
+    assert sent_names(scheduler) == names[:5]
+
+    scheduler.tick()
+    assert sent_names(scheduler)[:10] == names
@@ -3,6 +3,8 @@ import pytest
 
 
 os.environ['FASTAPI_CONFIG'] = 'testing'  # noqa
+# no Redis or broker needed, see project.in_process
+os.environ['IN_PROCESS_MODE'] = '1'  # noqa
 
 
 from pytest_factoryboy import register
@@ -37,7 +39,33 @@ def db_session(app):
     Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture
+def redis_client(settings, monkeypatch):
+    import fakeredis
+    from project import redis_utils
+
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(
+        redis_utils, '_clients', {settings.REDIS_URL: client})
+    return client
+
+
 @pytest.fixture()
 def client(app):
     from fastapi.testclient import TestClient
     yield TestClient(app)
+
+
+@pytest.fixture
+def delayed_delivery(settings, monkeypatch):
+    # parks in Redis, so off in IN_PROCESS_MODE
+    monkeypatch.setattr(settings, 'DELAYED_DELIVERY_ENABLED', True)
+
+
+@pytest.fixture
+def in_process_worker(app):
+    from project.in_process import InProcessWorker
+    worker = InProcessWorker(app.celery_app, concurrency=2)
+    worker.start()
+    yield worker
+    worker.stop()
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from project.task_events.models import TaskRecord
+from project.task_events.recorder import QUEUED, TaskEventRecorder
+
+
+@pytest.fixture
+def recorder():
+    recorder = TaskEventRecorder(flush_every=100, flush_interval=60)
+    yield recorder
+    recorder._pending.clear()  # nothing left for the flush at exit
+
+
+def test_events_are_merged_per_task(recorder):
+    recorder.record('id-1', QUEUED, name='task_a', queue='default')
+    recorder.record('id-1', 'STARTED', started_at=datetime.utcnow())
+    recorder.record('id-2', QUEUED, name='task_b')
+
+    assert len(recorder._pending) == 2
+    event = recorder._pending['id-1']
+    assert event['state'] == 'STARTED'
+    assert event['name'] == 'task_a'
+    assert event['queue'] == 'default'
+
+
+def test_flush_upserts_out_of_order_batches(db_session, recorder):
+    queued_at = datetime.utcnow() - timedelta(seconds=5)
+    started_at = queued_at + timedelta(seconds=2)
+
+    # the worker batch lands before the publisher one
+    recorder.record('id-1', 'SUCCESS', name='task_a',
+                    started_at=started_at, finished_at=datetime.utcnow())
+    assert recorder.flush() == 1
+
+    recorder._pending['id-1'] = {
+        'name': 'task_a', 'queue': 'default', 'state': QUEUED, 'retries': 0,
+        'queued_at': queued_at, 'started_at': None, 'finished_at': None,
+        'updated_at': queued_at,
+    }
+    assert recorder.flush() == 1
+
+    record = db_session.query(TaskRecord).filter_by(task_id='id-1').one()
+    assert record.state == 'SUCCESS'
+    assert record.queue == 'default'
+    assert record.queued_at == queued_at
+    assert record.started_at == started_at
+    assert record.finished_at is not None
+
+
+def test_signals_record_lifecycle(settings, monkeypatch, recorder):
+    from project.task_events import recorder as module
+    from project.users.tasks import divide
+
+    monkeypatch.setattr(module, 'recorder', recorder)
+    monkeypatch.setattr(settings, 'TASK_EVENTS_ENABLED', True)
+
+    module.record_queued(sender=divide.name, routing_key='default',
+                         headers={'id': 'id-1', 'retries': 0})
+    divide.push_request(id='id-1', retries=0,
+                        delivery_info={'routing_key': 'default'})
+    try:
+        module.record_started(task_id='id-1', task=divide)
+        module.record_finished(task_id='id-1', task=divide, state='FAILURE')
+    finally:
+        divide.pop_request()
+
+    event = recorder._pending['id-1']
+    assert event['state'] == 'FAILURE'
+    assert event['name'] == divide.name
+    assert event['queue'] == 'default'
+    assert event['queued_at'] <= event['started_at'] <= event['finished_at']
@@ -0,0 +1,21 @@
+from datetime import datetime, timedelta
+
+from project.task_events.models import TaskRecord
+from project.task_events.tasks import purge_task_records
+
+
+def test_purge_deletes_old_records_in_batches(db_session, settings,
+                                              monkeypatch):
+    monkeypatch.setattr(settings, 'TASK_EVENTS_PURGE_BATCH_SIZE', 2)
+    now = datetime.utcnow()
+    old = now - timedelta(days=settings.TASK_EVENTS_RETENTION_DAYS, hours=1)
+    db_session.add_all([
+        TaskRecord(task_id=f'old-{i}', state='SUCCESS', updated_at=old)
+        for i in range(3)
+    ] + [TaskRecord(task_id='recent', state='STARTED', updated_at=now)])
+    db_session.commit()
+
+    assert purge_task_records() == 3
+    db_session.expire_all()
+    assert [record.task_id for record in db_session.query(TaskRecord)] == \
+        ['recent']
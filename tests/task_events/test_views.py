@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+
+from project.task_events.models import TaskRecord
+from project.task_events.views import percentiles
+
+
+def add_task(db_session, task_id, name, state, queued_at, wait=None, run=None):
+    started_at = queued_at + timedelta(seconds=wait) if wait is not None \
+        else None
+    finished_at = started_at + timedelta(seconds=run) if run is not None \
+        else None
+    db_session.add(TaskRecord(
+        task_id=task_id, name=name, queue='default', state=state, retries=0,
+        queued_at=queued_at, started_at=started_at, finished_at=finished_at,
+        updated_at=finished_at or started_at or queued_at
+    ))
+
+
+def test_percentiles():
+    assert percentiles(range(1, 101)) == \
+        {'p50': 50, 'p90': 90, 'p95': 95, 'p99': 99}
+    assert percentiles([]) == \
+        {'p50': None, 'p90': None, 'p95': None, 'p99': None}
+
+
+def test_list_tasks(client, db_session):
+    now = datetime.utcnow()
+    for number in range(5):
+        add_task(db_session, f'id-{number}', 'task_a', 'SUCCESS',
+                 now - timedelta(minutes=number), wait=1, run=1)
+    add_task(db_session, 'id-started', 'task_a', 'STARTED', now, wait=0)
+    add_task(db_session, 'id-other', 'task_b', 'FAILURE', now, wait=0, run=0)
+    db_session.commit()
+
+    response = client.get('/tasks/', params={'state': 'started'})
+    assert [task['task_id'] for task in response.json()['results']] == \
+        ['id-started']
+
+    since = (now - timedelta(minutes=2, seconds=30)).isoformat()
+    response = client.get('/tasks/', params={
+        'name': 'task_a', 'state': 'SUCCESS', 'since': since, 'limit': 2})
+    page = response.json()
+    assert [task['task_id'] for task in page['results']] == ['id-0', 'id-1']
+
+    response = client.get('/tasks/', params={
+        'name': 'task_a', 'state': 'SUCCESS', 'since': since,
+        'cursor': page['next_cursor']})
+    page = response.json()
+    assert [task['task_id'] for task in page['results']] == ['id-2']
+    assert page['next_cursor'] is None
+
+
+def test_task_latency(client, db_session):
+    now = datetime.utcnow()
+    for number in range(10):
+        add_task(db_session, f'id-{number}', 'task_a', 'SUCCESS', now,
+                 wait=number + 1, run=(number + 1) * 10)
+    add_task(db_session, 'id-running', 'task_a', 'STARTED', now, wait=100)
+    db_session.commit()
+
+    response = client.get('/tasks/latency', params={'name': 'task_a'})
+    assert response.status_code == 200
+    latency = response.json()
+    assert latency['count'] == 10
+    assert latency['queue_wait']['p50'] == 5
+    assert latency['queue_wait']['p99'] == 10
+    assert latency['run_time']['p90'] == 90
+
+
+def test_dead_letter_api(client, redis_client):
+    from project.dead_letter import record_dead_letter
+
+    for number in range(3):
+        record_dead_letter(f'id-{number}', 'task_a', [number], {},
+                           {'queue': 'default'}, ValueError('boom'))
+
+    response = client.get('/tasks/dead_letters/', params={'name': 'task_a'})
+    assert response.status_code == 200
+    assert [entry['id'] for entry in response.json()['results']] == \
+        ['id-0', 'id-1', 'id-2']
+
+    response = client.post('/tasks/dead_letters/replay',
+                           json={'ids': ['id-0', 'id-2'], 'rate': 4})
+    assert response.json() == {'replayed': 2, 'seconds': 0.5}
+
+    response = client.get('/tasks/dead_letters/')
+    assert [entry['id'] for entry in response.json()['results']] == ['id-1']
+
+
+def test_expired_tasks_api(client, redis_client):
+    from project.deadline import count_expired
+
+    count_expired('task_a')
+    count_expired('task_a')
+    count_expired('task_b')
+
+    response = client.get('/tasks/expired')
+    assert response.json() == {'task_a': 2, 'task_b': 1}
+
+
+def test_shed_requests_api(client, redis_client):
+    from project.backpressure import record_shed
+
+    record_shed('default')
+    record_shed('default')
+
+    response = client.get('/tasks/shed')
+    assert response.json() == {'default': 2}
+
+
+def test_prefetch_api(client, redis_client):
+    from project.prefetch import RUNTIME_KEY, WORKERS_KEY
+
+    redis_client.hset(RUNTIME_KEY, 'default', '0.25')
+    redis_client.hset(WORKERS_KEY, 'worker@host', '{"prefetch": 4}')
+
+    response = client.get('/tasks/prefetch')
+    assert response.json() == {
+        'queues': {'default': 0.25},
+        'workers': {'worker@host': {'prefetch': 4}}
+    }
+
+
+def test_backfill_api(client, redis_client, monkeypatch):
+    from project.celery_utils import backfill_step
+
+    monkeypatch.setattr(backfill_step, 'apply_async', lambda *a, **kw: None)
+
+    assert client.get('/tasks/backfills/unknown').status_code == 404
+    assert client.get('/tasks/backfills/avatar_thumbnails').json() == {
+        'name': 'avatar_thumbnails', 'status': 'new', 'in_flight': 0}
+
+    response = client.post('/tasks/backfills/avatar_thumbnails/start')
+    assert response.json()['status'] == 'running'
+    response = client.post('/tasks/backfills/avatar_thumbnails/pause')
+    assert response.json()['status'] == 'paused'
@@ -0,0 +1,66 @@
+import io
+import threading
+from unittest import mock
+
+from PIL import Image
+
+from project.tdd import images
+from project.tdd.images import AvatarVariants, DiskLRUCache
+
+
+def test_disk_lru_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=25)
+    cache.put('a', b'x' * 10)
+    cache.put('b', b'x' * 10)
+    assert cache.get('a')
+
+    cache.put('c', b'x' * 10)
+
+    assert cache.get('a')
+    assert cache.get('b') is None
+    assert cache.get('c')
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['a', 'c']
+
+
+def test_disk_lru_cache_index_survives_restart(tmp_path):
+    DiskLRUCache(str(tmp_path), max_bytes=100).put('a', b'x' * 60)
+
+    cache = DiskLRUCache(str(tmp_path), max_bytes=100)
+    cache.put('b', b'x' * 60)
+
+    assert cache.get('a') is None
+    assert cache.get('b')
+
+
+def test_variants_are_generated_once(tmp_path, monkeypatch):
+    source_path = str(tmp_path / 'avatar.jpg')
+    Image.new('RGB', (300, 200), 'red').save(source_path)
+    variants = AvatarVariants(DiskLRUCache(str(tmp_path / 'cache'), 10 ** 6))
+
+    release = threading.Event()
+    resize_image = images.resize_image
+
+    def slow_resize(*args):
+        release.wait(5)
+        return resize_image(*args)
+
+    mock_resize = mock.MagicMock(side_effect=slow_resize)
+    monkeypatch.setattr(images, 'resize_image', mock_resize)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(
+            variants.get_or_create(source_path, 64, 'png')))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(set(results)) == 1
+    assert mock_resize.call_count == 1
+    with Image.open(io.BytesIO(results[0][0])) as image:
+        assert image.format == 'PNG'
+        assert image.size == (64, 43)
@@ -1,6 +1,9 @@
 import os
+import time
 from PIL import Image
 
+from project import backpressure
+from project.celery_utils import backfills
 from project.tdd.models import Member
 from project.tdd.tasks import generate_avatar_thumbnail
 
@@ -23,3 +26,27 @@ def test_task_generate_avatar_thumbnail(db_session, settings, member):
 
     assert image.height == 100
     assert image.width == 100
+
+
+def test_avatar_thumbnails_backfill(db_session, member_factory, redis_client,
+                                    in_process_worker, settings, monkeypatch):
+    members = member_factory.create_batch(5)
+    generate_avatar_thumbnail(members[0].id)
+    monkeypatch.setattr(settings, 'BACKFILL_POLL_INTERVAL', 0.05)
+    monkeypatch.setattr(backpressure.monitor, 'depth', lambda queue: 0)
+    backfill = backfills['avatar_thumbnails']
+    monkeypatch.setattr(backfill, 'batch_size', 2)
+    monkeypatch.setattr(backfill, 'concurrency', 3)
+
+    backfill.start(restart=True)
+    deadline = time.monotonic() + 10
+    while backfill.status()['status'] != 'done' and \
+            time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    status = backfill.status()
+    assert (status['status'], status['sent'], status['succeeded']) == \
+        ('done', 4, 4)
+    db_session.expire_all()
+    assert all(db_session.query(Member).get(member.id).avatar_thumbnail
+               for member in members)
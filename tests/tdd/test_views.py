@@ -1,7 +1,8 @@
 import os
+import json
 from unittest import mock
 
-from project.tdd import tasks
+from project.tdd import tasks, tdd_router
 from project.tdd.models import Member
 
 
@@ -44,3 +45,57 @@ def test_post(client, db_session, settings, member_factory, monkeypatch):
     mock_generate_avatar_thumbnail_delay.assert_called_with(
         member.id
     )
+
+
+def test_list_members(client, db_session, member_factory):
+    members = member_factory.create_batch(3)
+
+    response = client.get(
+        tdd_router.url_path_for('list_members'), params={'limit': 2})
+    page = response.json()
+    assert response.status_code == 200
+    assert [m['id'] for m in page['results']] == [members[0].id, members[1].id]
+    assert page['next_cursor'] == members[1].id
+
+    response = client.get(
+        tdd_router.url_path_for('list_members'),
+        params={'cursor': page['next_cursor'], 'username': members[2].username})
+    assert [m['id'] for m in response.json()['results']] == [members[2].id]
+    assert response.json()['next_cursor'] is None
+
+
+def test_export_members(client, db_session, member_factory):
+    members = member_factory.create_batch(2)
+
+    response = client.get(tdd_router.url_path_for('export_members'))
+
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert [row['id'] for row in map(json.loads, response.text.splitlines())] \
+        == [member.id for member in members]
+
+
+def test_member_avatar_variants(client, db_session, member, tmp_path, monkeypatch):
+    from project.tdd import images
+    from project.tdd.images import DiskLRUCache, avatar_variants
+    monkeypatch.setattr(
+        avatar_variants, 'cache', DiskLRUCache(str(tmp_path), 10 ** 6))
+    url = tdd_router.url_path_for('member_avatar', member_id=member.id)
+
+    response = client.get(url, params={'size': 64, 'format': 'webp'})
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'image/webp'
+    assert response.headers['cache-control'] == 'public, max-age=31536000'
+    etag = response.headers['etag']
+
+    # revalidation is answered from the source mtime, nothing is generated
+    monkeypatch.setattr(
+        avatar_variants, 'cache', DiskLRUCache(str(tmp_path / 'empty'), 10 ** 6))
+    monkeypatch.setattr(images, 'resize_image', mock.Mock(side_effect=AssertionError))
+    response = client.get(
+        url, params={'size': 64, 'format': 'webp'},
+        headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    response = client.get(url, params={'size': 65})
+    assert response.status_code == 400
@@ -0,0 +1,83 @@
+import time
+from unittest import mock
+
+import pytest
+from kombu import Connection, Queue
+
+from project import backpressure
+from project.backpressure import QueueDepthMonitor, get_shed_counts
+from project.users import users_router
+
+
+@pytest.fixture
+def memory_broker(monkeypatch):
+    connection = Connection('memory://')
+    monkeypatch.setattr(
+        backpressure.current_celery_app, 'connection_for_read',
+        lambda url=None: Connection('memory://'))
+    yield connection
+    for queue in ('default', 'high_priority'):
+        Queue(queue, channel=connection.default_channel).purge()
+    connection.release()
+
+
+@pytest.fixture
+def overloaded(settings, monkeypatch):
+    monkeypatch.setattr(settings, 'BACKPRESSURE_ENABLED', True)
+    monkeypatch.setattr(backpressure, 'monitor', QueueDepthMonitor(60))
+    backpressure.monitor._depths = {'default': 10 ** 6, 'high_priority': 0}
+    backpressure.monitor._sampled_at = time.monotonic()
+
+
+def test_monitor_reads_queue_depths(memory_broker):
+    with memory_broker.Producer() as producer:
+        for i in range(3):
+            producer.publish({'i': i}, routing_key='default',
+                             declare=[Queue('default')])
+
+    monitor = QueueDepthMonitor(interval=60)
+    assert monitor.depth('default') == 3
+    assert monitor.depth('low_priority') == 0
+
+
+def test_monitor_samples_once_per_interval():
+    monitor = QueueDepthMonitor(interval=60)
+    with mock.patch.object(
+            monitor, '_read_depths', return_value={'default': 5}) as read:
+        assert [monitor.depth('default') for _ in range(10)] == [5] * 10
+    read.assert_called_once()
+
+
+def test_monitor_fails_open():
+    monitor = QueueDepthMonitor(interval=0)
+    monitor._depths = {'default': 10 ** 6}
+    with mock.patch.object(monitor, '_read_depths', side_effect=OSError):
+        assert monitor.depth('default') == 0
+
+
+def test_overloaded_queue_sheds(client, redis_client, overloaded):
+    response = client.post(
+        users_router.url_path_for('form_example_post'),
+        json={'username': 'test', 'email': 'test@example.com'})
+
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == '30'
+    assert get_shed_counts() == {'default': 1}
+
+
+def test_queue_under_threshold_is_admitted(client, redis_client, overloaded,
+                                           settings, monkeypatch):
+    monkeypatch.setitem(
+        settings.BACKPRESSURE_QUEUE_THRESHOLDS, 'default', 10 ** 7)
+    mock_apply_async = mock.MagicMock(
+        return_value=mock.MagicMock(task_id='id'))
+    monkeypatch.setattr(
+        'project.users.views.sample_task.apply_async', mock_apply_async)
+
+    response = client.post(
+        users_router.url_path_for('form_example_post'),
+        json={'username': 'test', 'email': 'test@example.com'})
+
+    assert response.status_code == 200
+    assert get_shed_counts() == {}
+    mock_apply_async.assert_called_once()
@@ -1,9 +1,22 @@
+import time
+import asyncio
 import pytest
 from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from celery.contrib.testing.mocks import TaskMessage
+from celery import states
+from celery.app.trace import TraceInfo
+from celery.signals import task_postrun, task_prerun
 
-from project.database import db_context
+from project.database import db_context, last_write_time
+from project.users.tasks import task_postrun_handler
 from project.users.models import User
-from project.celery_utils import custom_celery_task
+from project import backpressure, celery_utils
+from project.tdd.models import Member
+from project.celery_utils import (
+    Backfill, BatchRequest, EventLoopThread, apply_batch, backfill_step,
+    batch_celery_task, batch_strategy, custom_celery_task, event_loop_thread
+)
 
 
 @custom_celery_task()
@@ -44,6 +57,18 @@ def test_throwing_no_retry_task(settings, monkeypatch):
         mock_retry.assert_not_called()
 
 
+def test_memoized_divide_by_zero_fails_at_once(redis_client, monkeypatch):
+    from project.users import tasks
+
+    monkeypatch.setattr(tasks.time, 'sleep', lambda seconds: None)
+
+    with mock.patch('celery.app.task.Task.retry') as mock_retry:
+        with pytest.raises(ZeroDivisionError):
+            tasks.divide.apply((1, 0), throw=True)
+
+        mock_retry.assert_not_called()
+
+
 def test_throwing_retry_task(settings, monkeypatch):
     '''
     If the exception is not in EXCEPTION_BLOCK_LIST, should retry the task
@@ -58,3 +83,295 @@ def test_throwing_retry_task(settings, monkeypatch):
         mock_retry.assert_called()
         assert 'countdown' in mock_retry.call_args[1]
         # equivalent to `assert 'countdown' in mock_retry.call_args.kwargs`
+
+
+@batch_celery_task(flush_every=3)
+def double_batch(batch):
+    return [request.args[0] * 2 for request in batch]
+
+
+@pytest.fixture
+def mock_backend(monkeypatch):
+    backend = mock.MagicMock(name='backend')
+    monkeypatch.setattr(double_batch, 'backend', backend)
+    # the websocket status relay needs a live Redis
+    task_postrun.disconnect(task_postrun_handler)
+    yield backend
+    task_postrun.connect(task_postrun_handler)
+
+
+def test_batch_task_called_directly():
+    assert double_batch(3) == 6
+
+
+def test_apply_batch_stores_each_result(mock_backend):
+    apply_batch(double_batch.name, [
+        BatchRequest('id-1', double_batch.name, (1,), {}),
+        BatchRequest('id-2', double_batch.name, (2,), {}),
+    ])
+
+    assert mock_backend.mark_as_done.call_args_list == [
+        mock.call('id-1', 2), mock.call('id-2', 4)
+    ]
+
+
+def test_apply_batch_failure_fails_each_request(mock_backend):
+    apply_batch(double_batch.name, [
+        BatchRequest('id-1', double_batch.name, (None,), {}),
+        BatchRequest('id-2', double_batch.name, (2,), {}),
+    ])
+
+    assert [c.args[0] for c in mock_backend.mark_as_failure.call_args_list] \
+        == ['id-1', 'id-2']
+
+
+def test_apply_batch_sends_signals_per_request(mock_backend):
+    seen = []
+
+    def on_prerun(task_id=None, task=None, **kwargs):
+        seen.append(('prerun', task_id, task.request.retries,
+                     task.request.delivery_info['routing_key'],
+                     last_write_time()))
+
+    def on_postrun(task_id=None, task=None, retval=None, state=None, **kwargs):
+        seen.append(('postrun', task_id, retval, state))
+
+    task_prerun.connect(on_prerun)
+    task_postrun.connect(on_postrun)
+    try:
+        apply_batch(double_batch.name, [
+            BatchRequest('id-1', double_batch.name, (1,), {},
+                         {'routing_key': 'default'}, 0, 10.0),
+            BatchRequest('id-2', double_batch.name, (2,), {},
+                         {'routing_key': 'default'}, 1, 20.0),
+        ])
+    finally:
+        task_prerun.disconnect(on_prerun)
+        task_postrun.disconnect(on_postrun)
+
+    assert seen == [
+        ('prerun', 'id-1', 0, 'default', 10.0),
+        ('prerun', 'id-2', 1, 'default', 20.0),
+        ('postrun', 'id-1', 2, 'SUCCESS'),
+        ('postrun', 'id-2', 4, 'SUCCESS'),
+    ]
+    assert last_write_time() == 0.0
+
+
+def test_batch_strategy_flushes_by_size_and_time():
+    consumer = mock.MagicMock(name='consumer')
+    consumer.controller.state.revoked = set()
+    handler = batch_strategy(double_batch, double_batch.app, consumer)
+    [(interval, flush), _] = consumer.timer.call_repeatedly.call_args
+
+    messages = [TaskMessage(double_batch.name, args=(i,)) for i in range(4)]
+    acks = [mock.MagicMock(name='ack') for _ in messages]
+    for message, ack in zip(messages, acks):
+        handler(message, None, ack, mock.MagicMock(), [])
+
+    assert interval == 1.0
+    assert consumer.qos.increment_eventually.call_count == 4
+    consumer.pool.apply_async.assert_called_once()
+    target, = consumer.pool.apply_async.call_args.args
+    options = consumer.pool.apply_async.call_args.kwargs
+    assert target is apply_batch
+    assert [r.args for r in options['args'][1]] == [(0,), (1,), (2,)]
+
+    # acked once the pool reports the batch done
+    options['callback'](None)
+    assert [ack.called for ack in acks] == [True, True, True, False]
+    assert consumer.qos.decrement_eventually.call_count == 3
+
+    flush()
+    assert consumer.pool.apply_async.call_count == 2
+    assert [r.args for r in
+            consumer.pool.apply_async.call_args.kwargs['args'][1]] == [(3,)]
+
+
+@custom_celery_task()
+async def async_sleep_task(seconds):
+    await asyncio.sleep(seconds)
+    return asyncio.get_running_loop()
+
+
+def test_async_task_runs_on_persistent_loop():
+    first_loop = async_sleep_task(0)
+    second_loop = async_sleep_task(0)
+
+    assert first_loop is second_loop is event_loop_thread.loop
+    assert first_loop.is_running()
+
+
+def test_async_tasks_share_loop_concurrently():
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        started = time.monotonic()
+        list(executor.map(async_sleep_task, [0.2] * 10))
+        elapsed = time.monotonic() - started
+
+    assert elapsed < 1
+
+
+def test_event_loop_thread_concurrency_limit():
+    runner = EventLoopThread(concurrency=2)
+    running = []
+    peak = []
+
+    async def track():
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.05)
+        running.pop()
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(lambda _: runner.run(track()), range(6)))
+
+    assert max(peak) == 2
+
+
+@custom_celery_task(name='test_async_sleep')
+async def async_sleep(seconds):
+    await asyncio.sleep(seconds)
+    return seconds
+
+
+@custom_celery_task(name='test_async_fails')
+async def async_fails(value):
+    raise ValueError(value)
+
+
+async_calls = []
+
+
+@custom_celery_task(name='test_async_flaky', retry_backoff_max=0)
+async def async_flaky():
+    async_calls.append(async_flaky.async_request.retries)
+    if len(async_calls) == 1:
+        raise RuntimeError('first call')
+    return async_flaky.async_request.retries
+
+
+def test_async_tasks_do_not_hold_pool_slots(in_process_worker):
+    # six sleeping calls on a pool of two run together
+    started = time.monotonic()
+    results = [async_sleep.delay(0.5) for _ in range(6)]
+
+    assert [result.get(timeout=5) for result in results] == [0.5] * 6
+    assert time.monotonic() - started < 1.5
+
+
+def test_async_task_failure_is_stored(in_process_worker, monkeypatch):
+    # billiard 3.6 tracebacks cannot be formatted by the logging of
+    # Python 3.11, whichever pool runs the task
+    monkeypatch.setattr(TraceInfo, '_log_error', mock.Mock())
+    result = async_fails.delay('failed')
+
+    with pytest.raises(ValueError):
+        result.get(timeout=5)
+    assert result.state == states.FAILURE
+
+
+def test_async_task_is_retried(in_process_worker):
+    async_calls.clear()
+
+    assert async_flaky.delay().get(timeout=5) == 1
+    assert async_calls == [0, 1]
+
+
+@pytest.fixture
+def backfill(db_session, redis_client, monkeypatch):
+    db_session.add_all([
+        Member(username=f'member{i}', email=f'member{i}@example.com',
+               avatar=f'member{i}.jpg')
+        for i in range(5)
+    ])
+    db_session.commit()
+    monkeypatch.setattr(backpressure.monitor, 'depth', lambda queue: 0)
+    task = mock.Mock()
+    task.name = 'low_priority:backfill_member'
+    task.delay.side_effect = lambda key: mock.Mock(id=f'task-{key}')
+    return Backfill('members', lambda session: session.query(Member.id),
+                    Member.id, task, batch_size=2, concurrency=3)
+
+
+def sent_keys(backfill):
+    return [call.args[0] for call in backfill.task.delay.call_args_list]
+
+
+def test_backfill_keeps_concurrency_bound(backfill, redis_client,
+                                          monkeypatch, settings):
+    monkeypatch.setattr(celery_utils, 'finished_tasks', lambda ids: {})
+
+    assert backfill.step(redis_client) == settings.BACKFILL_POLL_INTERVAL
+    assert sent_keys(backfill) == [1, 2, 3]
+    # nothing finished, nothing more is sent
+    backfill.step(redis_client)
+    assert sent_keys(backfill) == [1, 2, 3]
+    assert backfill.status()['cursor'] == 3
+    assert backfill.status()['in_flight'] == 3
+
+
+def test_backfill_resumes_from_checkpoint(backfill, redis_client,
+                                          monkeypatch):
+    monkeypatch.setattr(celery_utils, 'finished_tasks', lambda ids: {})
+    backfill.step(redis_client)
+
+    # a new process with nothing but the checkpoint
+    resumed = Backfill(backfill.name, backfill.query, backfill.key,
+                       backfill.task, batch_size=2, concurrency=3)
+    monkeypatch.setattr(celery_utils, 'finished_tasks', lambda ids: {
+        'task-1': 'SUCCESS', 'task-2': 'FAILURE'})
+    resumed.step(redis_client)
+
+    assert sent_keys(backfill) == [1, 2, 3, 4, 5]
+    status = resumed.status()
+    assert (status['sent'], status['succeeded'], status['failed']) == (5, 1, 1)
+
+    monkeypatch.setattr(celery_utils, 'finished_tasks',
+                        lambda ids: dict.fromkeys(ids, 'SUCCESS'))
+    assert resumed.step(redis_client) is None
+    assert resumed.status()['status'] == 'done'
+    assert resumed.status()['in_flight'] == 0
+
+
+def test_backfill_waits_for_loaded_queue(backfill, redis_client,
+                                         monkeypatch, settings):
+    monkeypatch.setattr(backpressure.monitor, 'depth', lambda queue: 10 ** 6)
+
+    assert backfill.step(redis_client) == settings.BACKFILL_THROTTLE_INTERVAL
+    backfill.task.delay.assert_not_called()
+    assert backfill.status()['throttled'] == \
+        'queue low_priority holds 1000000 tasks'
+
+
+def test_backfill_slows_down_after_slow_query(backfill, redis_client,
+                                              monkeypatch, settings):
+    monkeypatch.setattr(settings, 'BACKFILL_MAX_QUERY_SECONDS', 0)
+
+    assert backfill.step(redis_client) == settings.BACKFILL_THROTTLE_INTERVAL
+    assert sent_keys(backfill) == [1, 2, 3]
+
+
+def test_backfill_step_chain(backfill, redis_client, monkeypatch):
+    monkeypatch.setitem(celery_utils.backfills, backfill.name, backfill)
+    apply_async = mock.Mock()
+    monkeypatch.setattr(backfill_step, 'apply_async', apply_async)
+
+    backfill.start()
+    [start] = apply_async.call_args_list
+    assert start.args == ((backfill.name,),)
+
+    # a step sent by an earlier start ends there
+    backfill_step.apply(args=(backfill.name,), task_id='earlier-step')
+    backfill.task.delay.assert_not_called()
+
+    with mock.patch.object(backfill, 'step', return_value=5) as step:
+        backfill_step.apply(args=(backfill.name,),
+                            task_id=start.kwargs['task_id'])
+    step.assert_called_once()
+    assert apply_async.call_args.kwargs['countdown'] == 5
+
+    backfill.pause()
+    with mock.patch.object(backfill, 'step') as step:
+        backfill_step.apply(args=(backfill.name,),
+                            task_id=apply_async.call_args.kwargs['task_id'])
+    step.assert_not_called()
@@ -0,0 +1,108 @@
+import time
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from project import database
+from project.database import ReplicaSet, read_db_context
+from project.users.models import User
+
+
+@pytest.fixture
+def replica_set(tmp_path, monkeypatch):
+    replica_set = ReplicaSet([
+        f'sqlite:///{tmp_path}/replica_1.db',
+        f'sqlite:///{tmp_path}/replica_2.db',
+    ], connect_args={'check_same_thread': False})
+    for i, replica in enumerate(replica_set.engines, start=1):
+        with replica.begin() as connection:
+            connection.execute(text('CREATE TABLE replica (name TEXT)'))
+            connection.execute(
+                text('INSERT INTO replica VALUES (:name)'),
+                {'name': f'replica_{i}'})
+
+    monkeypatch.setattr(database, 'replicas', replica_set)
+    yield replica_set
+    database.end_write_scope()
+
+
+def replica_name():
+    with read_db_context() as session:
+        return session.execute(text('SELECT name FROM replica')).scalar()
+
+
+def test_round_robin(replica_set):
+    assert [replica_name() for _ in range(4)] == \
+        ['replica_1', 'replica_2', 'replica_1', 'replica_2']
+
+
+def test_failed_replica_is_skipped(tmp_path, replica_set):
+    broken = ReplicaSet([f'sqlite:///{tmp_path}/missing/broken.db']).engines[0]
+    replica_set.engines.insert(0, broken)
+
+    assert [replica_name() for _ in range(3)] == \
+        ['replica_1', 'replica_2', 'replica_1']
+    assert replica_set.choose() is not broken
+
+
+def test_no_replica_available_uses_primary(db_session, replica_set):
+    for replica in replica_set.engines:
+        replica_set.mark_down(replica)
+
+    with read_db_context() as session:
+        assert session.get_bind() is database.engine
+
+
+def test_read_your_writes(db_session, replica_set, settings, monkeypatch):
+    database.start_write_scope()
+    db_session.add(User(username='test', email='test@example.com'))
+    db_session.commit()
+
+    with read_db_context() as session:
+        assert session.get_bind() is database.engine
+        assert session.query(User).filter_by(username='test').first()
+
+    monkeypatch.setattr(settings, 'DATABASE_READ_YOUR_WRITES_WINDOW', 0)
+    assert replica_name() == 'replica_1'
+
+
+def test_task_last_write_pins_primary(replica_set):
+    database.start_write_scope(time.time())
+    with read_db_context() as session:
+        assert session.get_bind() is database.engine
+
+
+def test_write_outside_the_scope_does_not_pin(db_session, replica_set):
+    db_session.add(User(username='test', email='test@example.com'))
+    db_session.commit()  # another request or task of the process
+
+    database.start_write_scope()
+    assert replica_name() == 'replica_1'
+
+
+def test_read_your_writes_cookie(db_session, replica_set):
+    app = FastAPI()
+    app.add_middleware(database.ReadYourWritesMiddleware)
+
+    @app.post('/write')
+    def write(session: Session = Depends(database.get_db_session)):
+        session.add(User(username='test', email='test@example.com'))
+        session.commit()
+
+    @app.get('/read')
+    def read(session: Session = Depends(database.get_read_db_session)):
+        return {'primary': session.get_bind() is database.engine}
+
+    writer, reader = TestClient(app), TestClient(app)
+    assert writer.get('/read').json() == {'primary': False}
+
+    response = writer.post('/write')
+    assert float(response.cookies['db_last_write']) == \
+        pytest.approx(time.time(), abs=5)
+    # the client that wrote reads its write, the others stay on replicas
+    assert writer.get('/read').json() == {'primary': True}
+    assert reader.get('/read').json() == {'primary': False}
+    assert 'db_last_write' not in writer.get('/read').headers.get(
+        'set-cookie', '')
@@ -0,0 +1,111 @@
+import time
+
+import pytest
+from kombu.utils.json import loads
+
+from project.dead_letter import (
+    DEAD_LETTER_INDEX, DEAD_LETTER_KEY, dead_letter_failed_task,
+    list_dead_letters, record_dead_letter, replay_dead_letters
+)
+from project.delayed import DELAYED_KEY
+from project.users.tasks import divide
+
+
+@pytest.fixture(autouse=True)
+def dead_letters_enabled(settings, monkeypatch):
+    monkeypatch.setattr(settings, 'DEAD_LETTER_ENABLED', True)
+
+
+def add_dead_letters(count, name='task_a', start=1000.0):
+    for number in range(count):
+        record_dead_letter(f'{name}-{number}', name, [number], {}, {},
+                           ValueError('boom'), failed_at=start + number)
+
+
+def test_failed_task_is_dead_lettered(redis_client):
+    divide.push_request(id='task-id', retries=5, root_id='root-id',
+                        delivery_info={'routing_key': 'default'})
+    try:
+        dead_letter_failed_task(sender=divide, task_id='task-id',
+                                exception=ZeroDivisionError('division by zero'),
+                                args=[1, 0], kwargs={})
+    finally:
+        divide.pop_request()
+
+    [entry], _ = list_dead_letters()
+    assert entry['id'] == 'task-id'
+    assert entry['task'] == divide.name
+    assert entry['args'] == [1, 0]
+    assert entry['headers'] == {'retries': 5, 'root_id': 'root-id',
+                                'parent_id': None, 'queue': 'default'}
+    assert entry['exception'] == 'ZeroDivisionError: division by zero'
+
+
+def test_eager_failures_are_ignored(redis_client):
+    divide.push_request(id='task-id', is_eager=True)
+    try:
+        dead_letter_failed_task(sender=divide, task_id='task-id',
+                                exception=ZeroDivisionError(), args=[1, 0])
+    finally:
+        divide.pop_request()
+
+    assert not redis_client.exists(DEAD_LETTER_KEY)
+
+
+def test_list_by_name_with_cursor(redis_client):
+    add_dead_letters(3, 'task_a')
+    add_dead_letters(2, 'task_b', start=2000.0)
+
+    page, cursor = list_dead_letters('task_a', limit=2)
+    assert [entry['id'] for entry in page] == ['task_a-0', 'task_a-1']
+
+    page, cursor = list_dead_letters('task_a', after=cursor, limit=2)
+    assert [entry['id'] for entry in page] == ['task_a-2']
+    assert cursor is None
+
+    page, _ = list_dead_letters(limit=10)
+    assert len(page) == 5
+
+
+def test_cursor_keeps_entries_failed_at_the_same_time(redis_client):
+    for number in range(5):
+        record_dead_letter(f'same-{number}', 'task_a', [], {}, {},
+                           ValueError('boom'), failed_at=1000.0)
+
+    ids, cursor = [], None
+    while True:
+        page, cursor = list_dead_letters(after=cursor, limit=2)
+        ids += [entry['id'] for entry in page]
+        if cursor is None:
+            break
+        # the entry the cursor points at is replayed between pages
+        replay_dead_letters(task_ids=[ids[-1].encode()])
+    assert ids == [f'same-{number}' for number in range(5)]
+
+
+def test_store_is_bounded(redis_client, settings, monkeypatch):
+    monkeypatch.setattr(settings, 'DEAD_LETTER_MAX_ENTRIES', 3)
+    add_dead_letters(5)
+
+    page, _ = list_dead_letters('task_a')
+    assert [entry['id'] for entry in page] == ['task_a-2', 'task_a-3', 'task_a-4']
+    assert redis_client.hlen(DEAD_LETTER_KEY) == 3
+
+
+def test_replay_is_spread_at_rate(redis_client):
+    add_dead_letters(4, 'task_a')
+    add_dead_letters(1, 'task_b')
+
+    now = time.time()
+    assert replay_dead_letters('task_a', limit=3, rate=2) == 3
+
+    parked = redis_client.zrange(DELAYED_KEY, 0, -1, withscores=True)
+    assert [loads(payload)['id'] for payload, _ in parked] == \
+        ['task_a-0', 'task_a-1', 'task_a-2']
+    assert [due - now for _, due in parked] == \
+        [pytest.approx(offset, abs=0.5) for offset in (0, 0.5, 1)]
+    assert loads(parked[0][0])['options'] == {'retries': 0}
+
+    remaining, _ = list_dead_letters()
+    assert [entry['id'] for entry in remaining] == ['task_b-0', 'task_a-3']
+    assert redis_client.zcard(DEAD_LETTER_INDEX) == 2
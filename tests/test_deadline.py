@@ -0,0 +1,118 @@
+import time
+
+import pytest
+from celery.exceptions import Ignore, TaskRevokedError
+from kombu.utils.json import loads
+
+from project import deadline
+from project.celery_utils import custom_celery_task, get_task_info
+from project.delayed import DELAYED_KEY
+from project.deadline import (
+    DEADLINE_HEADER, budget, deadline_in, deadline_scope, get_expired_counts,
+    propagate_deadline, remaining
+)
+
+
+calls = []
+
+
+@custom_celery_task(name='deadline_task')
+def deadline_task(value):
+    calls.append((value, remaining()))
+    return value
+
+
+@custom_celery_task(name='budgeted_task', deadline=60)
+def budgeted_task():
+    pass
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    calls.clear()
+
+
+def test_remaining_and_budget(settings):
+    assert remaining() is None
+    assert budget(30) == 30
+
+    with deadline_scope(time.time() + 5):
+        assert remaining() == pytest.approx(5, abs=0.1)
+        assert budget(30) == pytest.approx(5, abs=0.1)
+        assert budget(2) == 2
+    with deadline_scope(time.time() - 1):
+        assert remaining() == 0
+        assert budget(30) == settings.TASK_DEADLINE_MIN_TIMEOUT
+
+    assert remaining() is None
+
+
+def test_propagate_deadline():
+    explicit = {DEADLINE_HEADER: 123.0}
+    assert propagate_deadline(dict(explicit), 'budgeted_task') == explicit
+
+    # the deadline of the running task wins over the budget of the new one
+    with deadline_scope(456.0):
+        assert propagate_deadline({}, 'budgeted_task') == {DEADLINE_HEADER: 456.0}
+
+    headers = propagate_deadline({}, 'budgeted_task')
+    assert headers[DEADLINE_HEADER] == pytest.approx(time.time() + 60, abs=1)
+    assert propagate_deadline({}, 'deadline_task') == {}
+
+
+def call_with_headers(task, headers, *args):
+    # as the worker does, custom headers become request attributes
+    task.push_request(id='task-id', retries=0, **headers)
+    try:
+        return task(*args)
+    finally:
+        task.pop_request()
+
+
+def test_task_runs_with_its_deadline(redis_client):
+    assert call_with_headers(deadline_task, deadline_in(10), 'a') == 'a'
+
+    [(value, left)] = calls
+    assert left == pytest.approx(10, abs=0.5)
+    assert remaining() is None
+    assert get_expired_counts() == {}
+
+
+def test_eager_headers_are_honoured(app, redis_client):
+    with pytest.raises(Ignore):
+        call_with_headers(deadline_task, {'headers': deadline_in(-1)}, 'a')
+
+
+def test_expired_task_is_skipped_and_counted(app, redis_client):
+    for _ in range(2):
+        with pytest.raises(Ignore):
+            call_with_headers(deadline_task, deadline_in(-1), 'a')
+
+    assert calls == []
+    assert get_expired_counts() == {'deadline_task': 2}
+    assert get_task_info('task-id') == {'state': 'REVOKED'}
+    deadline_task.AsyncResult('task-id').forget()
+
+
+def test_expired_task_reaches_final_state(redis_client, in_process_worker):
+    result = deadline_task.apply_async(('a',), headers=deadline_in(-1))
+
+    with pytest.raises(TaskRevokedError):
+        result.get(timeout=5, interval=0.01)
+    assert calls == []
+
+
+def test_parked_retry_keeps_deadline(redis_client, delayed_delivery):
+    with deadline_scope(789.0):
+        deadline_task.apply_async(('a',), countdown=60)
+
+    [(payload, _)] = redis_client.zrange(DELAYED_KEY, 0, -1, withscores=True)
+    assert loads(payload)['options']['headers'] == {DEADLINE_HEADER: 789.0}
+
+
+def test_count_expired_fails_open(monkeypatch):
+    def broken():
+        raise ConnectionError
+
+    monkeypatch.setattr(deadline, 'get_redis_client', broken)
+    deadline.count_expired('deadline_task')
@@ -0,0 +1,107 @@
+import time
+from unittest import mock
+
+import pytest
+from celery import Task
+from celery.exceptions import Retry
+from kombu.utils.json import loads
+
+from project.delayed import (
+    DELAYED_KEY, RELEASING_KEY, park_task, release_due_tasks
+)
+from project.celery_utils import custom_celery_task
+from project.users.tasks import task_add_subscription
+
+
+pytestmark = pytest.mark.usefixtures('delayed_delivery')
+
+
+@custom_celery_task(name='flaky_task', retry_jitter=False)
+def flaky_task(value):
+    raise ConnectionError('try again later')
+
+
+@pytest.fixture
+def mock_super_apply_async(monkeypatch):
+    mock_apply_async = mock.MagicMock(name='apply_async')
+    monkeypatch.setattr(Task, 'apply_async', mock_apply_async)
+    return mock_apply_async
+
+
+def test_countdown_is_parked(redis_client, mock_super_apply_async):
+    result = task_add_subscription.apply_async((1,), countdown=300)
+
+    mock_super_apply_async.assert_not_called()
+    [(member, due)] = redis_client.zrange(DELAYED_KEY, 0, -1, withscores=True)
+    assert due == pytest.approx(time.time() + 300, abs=5)
+    assert result.id.encode() in member
+
+
+def test_short_countdown_is_sent_directly(redis_client, mock_super_apply_async):
+    task_add_subscription.apply_async((1,), countdown=0.1)
+
+    mock_super_apply_async.assert_called_once()
+    assert not redis_client.exists(DELAYED_KEY)
+
+
+def test_eager_mode_is_not_parked(redis_client, app, monkeypatch,
+                                  mock_super_apply_async):
+    monkeypatch.setattr(app.celery_app.conf, 'task_always_eager', True)
+    task_add_subscription.apply_async((1,), countdown=300)
+
+    mock_super_apply_async.assert_called_once()
+    assert not redis_client.exists(DELAYED_KEY)
+
+
+def test_custom_task_retry_is_parked(redis_client, mock_super_apply_async):
+    flaky_task.push_request(
+        id='task-id', args=['a'], kwargs={}, retries=2, called_directly=False,
+        delivery_info={'exchange': '', 'routing_key': 'default'}
+    )
+    try:
+        # as the worker runs it, under the request it pushed
+        with pytest.raises(Retry):
+            flaky_task.run('a')
+    finally:
+        flaky_task.pop_request()
+
+    mock_super_apply_async.assert_not_called()
+    [(member, due)] = redis_client.zrange(DELAYED_KEY, 0, -1, withscores=True)
+    payload = loads(member)
+    assert payload['id'] == 'task-id'
+    assert payload['args'] == ['a']
+    assert payload['options']['retries'] == 3
+    # exponential backoff without jitter, 2 ** 2 seconds
+    assert due == pytest.approx(time.time() + 4, abs=1)
+
+
+def test_release_due_tasks(redis_client, app):
+    now = time.time()
+    park_task('task_a', [1], {}, 'id-1', now - 1, {'retries': 2})
+    park_task('task_b', [2], {}, 'id-2', now - 1, {})
+    park_task('task_c', [3], {}, 'id-3', now + 60, {})
+
+    with mock.patch.object(app.celery_app, 'send_task') as mock_send_task:
+        released = release_due_tasks(app.celery_app, batch_size=1, now=now)
+
+    assert released == 2
+    assert sorted(c.kwargs['task_id'] for c in mock_send_task.call_args_list) == \
+        ['id-1', 'id-2']
+    mock_send_task.assert_any_call(
+        'task_a', [1], {}, task_id='id-1', producer=mock.ANY, retries=2)
+    assert redis_client.zcard(DELAYED_KEY) == 1
+    assert redis_client.zcard(RELEASING_KEY) == 0
+
+
+def test_expired_lease_is_recovered(redis_client, app, settings):
+    now = time.time()
+    redis_client.zadd(
+        RELEASING_KEY,
+        {b'{"id": "id-1", "task": "task_a", "args": [], "kwargs": {}, "options": {}}':
+         now - settings.DELAYED_DELIVERY_LEASE - 1})
+
+    with mock.patch.object(app.celery_app, 'send_task') as mock_send_task:
+        assert release_due_tasks(app.celery_app, now=now) == 1
+
+    mock_send_task.assert_called_once()
+    assert redis_client.zcard(RELEASING_KEY) == 0
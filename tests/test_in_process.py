@@ -0,0 +1,79 @@
+import json
+import time
+import asyncio
+import threading
+from unittest import mock
+
+from celery.utils import uuid
+
+from project import broadcast
+from project.celery_utils import custom_celery_task, get_task_info
+from project.in_process import InProcessBroadcast
+from project.ws.views import TaskStatusNameSpace
+
+
+@custom_celery_task(name='in_process_add')
+def in_process_add(x, y):
+    return x + y
+
+
+def test_publish_from_another_thread_reaches_subscriber():
+    pubsub = InProcessBroadcast()
+
+    async def main():
+        async with pubsub.subscribe(channel='a') as subscriber:
+            thread = threading.Thread(target=asyncio.run, args=(
+                pubsub.publish(channel='a', message='done'),))
+            thread.start()
+            event = await asyncio.wait_for(subscriber.get(), 1)
+            thread.join()
+        return event
+
+    event = asyncio.run(main())
+    assert (event.channel, event.message) == ('a', 'done')
+    assert not pubsub._subscribers
+
+
+def test_task_runs_without_redis(in_process_worker):
+    result = in_process_add.delay(1, 2)
+
+    assert result.get(timeout=5) == 3
+    assert get_task_info(result.id) == {'state': 'SUCCESS'}
+
+
+def test_tasks_past_the_prefetch_limit_do_not_stall(in_process_worker):
+    # acks are sent from the worker loop, it must not sit in a long poll
+    started = time.monotonic()
+    results = [in_process_add.delay(i, i) for i in range(6)]
+
+    assert [result.get(timeout=5, interval=0.01) for result in results] == \
+        [0, 2, 4, 6, 8, 10]
+    assert time.monotonic() - started < 1
+
+
+def test_ws_task_status_is_pushed(client, in_process_worker):
+    task_id = uuid()
+    with client.websocket_connect(f'/ws/task_status/{task_id}') as websocket:
+        assert websocket.receive_json() == {'state': 'PENDING'}
+
+        in_process_add.apply_async((1, 2), task_id=task_id)
+
+        assert websocket.receive_json() == {'state': 'SUCCESS'}
+
+
+def test_socketio_namespace_relays_status():
+    namespace = TaskStatusNameSpace('/task_status')
+    namespace.enter_room = mock.Mock()
+    namespace.emit = mock.AsyncMock()
+
+    async def main():
+        await namespace.on_join('sid', {'task_id': 'task-id'})
+        await broadcast.publish(
+            channel='task-id', message=json.dumps({'state': 'SUCCESS'}))
+        await asyncio.wait_for(
+            asyncio.gather(*namespace._relays.values()), 1)
+
+    asyncio.run(main())
+    assert [call.args[1] for call in namespace.emit.call_args_list] == \
+        [{'state': 'PENDING'}, {'state': 'SUCCESS'}]
+    assert namespace._relays == {}
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from project.lookup_cache import MISSING, LookupCache
+
+
+def make_cache(**kwargs):
+    options = dict(ttl=60, negative_ttl=1, max_entries=100)
+    options.update(kwargs)
+    return LookupCache('test', **options)
+
+
+def test_get_or_load_caches_value():
+    cache = make_cache()
+    loads = []
+
+    for _ in range(3):
+        assert cache.get_or_load('alice', lambda: loads.append(1) or 7) == 7
+
+    assert len(loads) == 1
+    assert cache.stats() == {
+        'hits': 2, 'misses': 1, 'hit_ratio': pytest.approx(2 / 3), 'size': 1}
+
+
+def test_entries_expire(monkeypatch):
+    cache = make_cache(ttl=10)
+    cache.set('alice', 7)
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 11)
+    assert cache.get('alice') is MISSING
+
+
+def test_negative_ttl_is_capped(monkeypatch):
+    cache = make_cache(ttl=60, negative_ttl=1)
+    assert cache.get_or_load('bob', lambda: None) is None
+    assert cache.get('bob') is None
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 2)
+    assert cache.get('bob') is MISSING
+
+    assert make_cache(ttl=0.5, negative_ttl=5).negative_ttl == 0.5
+
+
+def test_least_recently_used_is_evicted():
+    cache = make_cache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_redis_tier_is_shared(redis_client):
+    filler = make_cache(use_redis=True)
+    reader = make_cache(use_redis=True)
+
+    filler.set('alice', 7)
+    filler.set('bob', None)
+
+    assert reader.get('alice') == 7
+    assert reader.get('bob') is None
+    assert redis_client.pttl('test:alice') > 50 * 1000
+    assert 0 < redis_client.pttl('test:bob') <= 1000
+
+
+def test_delete_drops_both_tiers(redis_client):
+    cache = make_cache(use_redis=True)
+    cache.set('alice', 7)
+
+    cache.delete('alice')
+
+    assert cache.get('alice') is MISSING
+    assert not redis_client.exists('test:alice')
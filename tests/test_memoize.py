@@ -0,0 +1,88 @@
+import threading
+from unittest import mock
+
+from project.memoize import TaskMemoizer, make_cache_key
+
+
+def add(x, y=1):
+    return x + y
+
+
+def test_make_cache_key_normalizes_arguments():
+    key = make_cache_key('add', add, (1, 2), {})
+
+    assert key == make_cache_key('add', add, (1,), {'y': 2})
+    assert key == make_cache_key('add', add, (), {'x': 1, 'y': 2})
+    assert key != make_cache_key('add', add, (2, 1), {})
+    assert make_cache_key('add', add, (1,), {}) == \
+        make_cache_key('add', add, (1, 1), {})
+
+
+def test_get_or_compute_runs_once(redis_client):
+    memoizer = TaskMemoizer()
+    func = mock.MagicMock(return_value=0.5)
+
+    assert memoizer.get_or_compute('memo:divide:1', func, 1, 2) == 0.5
+    assert memoizer.get_or_compute('memo:divide:1', func, 1, 2) == 0.5
+    func.assert_called_once_with(1, 2)
+
+
+def test_none_result_is_cached(redis_client):
+    memoizer = TaskMemoizer()
+    func = mock.MagicMock(return_value=None)
+
+    memoizer.get_or_compute('memo:noop:1', func)
+    memoizer.get_or_compute('memo:noop:1', func)
+    func.assert_called_once()
+
+
+def test_size_bounded_eviction(redis_client):
+    memoizer = TaskMemoizer(max_entries=3)
+    for i in range(5):
+        memoizer.set(f'memo:add:{i}', i)
+
+    assert redis_client.zcard(TaskMemoizer.INDEX_KEY) == 3
+    assert not redis_client.exists('memo:add:0', 'memo:add:1')
+    assert redis_client.exists('memo:add:2', 'memo:add:3', 'memo:add:4') == 3
+
+
+def test_concurrent_calls_coalesce(redis_client):
+    memoizer = TaskMemoizer(poll_interval=0.01)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_divide(x, y):
+        calls.append((x, y))
+        started.set()
+        release.wait(5)
+        return x / y
+
+    results = []
+    leader = threading.Thread(
+        target=lambda: results.append(
+            memoizer.get_or_compute('memo:divide:2', slow_divide, 1, 4)))
+    leader.start()
+    started.wait(5)
+
+    follower = threading.Thread(
+        target=lambda: results.append(
+            memoizer.get_or_compute('memo:divide:2', slow_divide, 1, 4)))
+    follower.start()
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert results == [0.25, 0.25]
+    assert calls == [(1, 4)]
+
+
+def test_follower_computes_when_leader_fails(redis_client):
+    memoizer = TaskMemoizer(poll_interval=0.01)
+    redis_client.set('memo:divide:3:lock', 'other-worker', ex=60)
+    timer = threading.Timer(
+        0.05, redis_client.delete, args=('memo:divide:3:lock',))
+    timer.start()
+
+    assert memoizer.get_or_compute('memo:divide:3', lambda: 42) == 42
+    timer.join()
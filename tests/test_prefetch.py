@@ -0,0 +1,90 @@
+import json
+from unittest import mock
+
+import pytest
+
+from project import prefetch
+from project.prefetch import (
+    RUNTIME_KEY, WORKERS_KEY, PrefetchTuner, RuntimeRecorder,
+    get_queue_runtimes, prefetch_multiplier
+)
+
+
+def test_prefetch_multiplier_follows_slowest_queue(settings):
+    assert prefetch_multiplier({}) == settings.CELERY_WORKER_PREFETCH_MULTIPLIER
+    assert prefetch_multiplier({'fast': 0.001}) == 50
+    assert prefetch_multiplier({'fast': 0.001, 'slow': 0.01}) == 5
+    assert prefetch_multiplier({'fast': 0}) == settings.PREFETCH_MAX_MULTIPLIER
+    assert prefetch_multiplier({'slow': 30}) == settings.PREFETCH_MIN_MULTIPLIER
+
+
+def test_recorder_moves_average_by_batch(settings, redis_client):
+    recorder = RuntimeRecorder(flush_interval=60)
+    recorder.record('default', 1.0)
+    recorder.record('default', 3.0)
+    assert redis_client.hgetall(RUNTIME_KEY) == {}
+
+    recorder.flush()
+    assert get_queue_runtimes() == {'default': 2.0}
+
+    recorder.record('default', 0.0)
+    recorder.flush()
+    assert get_queue_runtimes()['default'] == pytest.approx(
+        2.0 * (1 - settings.PREFETCH_RUNTIME_ALPHA))
+    assert get_queue_runtimes(queues=['other']) == {}
+
+
+def test_recorder_fails_open(monkeypatch):
+    def broken():
+        raise ConnectionError
+
+    monkeypatch.setattr(prefetch, 'get_redis_client', broken)
+    recorder = RuntimeRecorder(flush_interval=0)
+    recorder.record('default', 1.0)
+    assert recorder._totals == {}
+
+
+def make_consumer(multiplier=1, processes=4):
+    consumer = mock.Mock(hostname='worker@host', prefetch_multiplier=multiplier,
+                         initial_prefetch_count=processes * multiplier)
+    consumer.pool.num_processes = processes
+    queue = mock.Mock()
+    queue.name = 'default'
+    consumer.task_consumer.queues = [queue]
+    return consumer
+
+
+def test_tuner_grows_and_shrinks_prefetch(redis_client):
+    tuner = PrefetchTuner(mock.Mock())
+    consumer = make_consumer()
+
+    redis_client.hset(RUNTIME_KEY, 'default', '0.005')
+    tuner.tune(consumer)
+    consumer.qos.increment_eventually.assert_called_once_with(36)
+    assert (consumer.prefetch_multiplier, consumer.initial_prefetch_count) == \
+        (10, 40)
+    assert json.loads(redis_client.hget(WORKERS_KEY, 'worker@host')) == {
+        'prefetch': 40, 'multiplier': 10, 'queues': ['default'],
+        'updated_at': mock.ANY
+    }
+
+    redis_client.hset(RUNTIME_KEY, 'default', '2')
+    tuner.tune(consumer)
+    consumer.qos.decrement_eventually.assert_called_once_with(36)
+    assert consumer.initial_prefetch_count == 4
+
+
+def test_tuner_keeps_prefetch_without_runtimes(redis_client):
+    consumer = make_consumer(multiplier=1)
+
+    PrefetchTuner(mock.Mock()).tune(consumer)
+    consumer.qos.increment_eventually.assert_not_called()
+    consumer.qos.decrement_eventually.assert_not_called()
+
+
+def test_tuner_leaves_disabled_prefetch_alone(redis_client):
+    consumer = make_consumer(multiplier=0)
+
+    PrefetchTuner(mock.Mock()).tune(consumer)
+    assert consumer.initial_prefetch_count == 0
+    assert redis_client.hgetall(WORKERS_KEY) == {}
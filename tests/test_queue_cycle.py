@@ -0,0 +1,102 @@
+from collections import deque
+from statistics import mean
+
+from kombu.utils.scheduling import cycle_by_name, round_robin_cycle
+
+from project.queue_cycle import weighted_fair_cycle
+
+
+QUEUES = ['high_priority', 'default', 'low_priority']
+WEIGHTS = {'high_priority': 6, 'default': 3, 'low_priority': 1}
+
+
+def simulate(cycle, arrivals, ticks):
+    '''
+    One worker slot taking one message per tick the way the Redis transport
+    does, BRPOP on the queues in the order the cycle gives and the first
+    non-empty one wins
+
+    Returns the waits (in ticks) of the served messages of each queue
+    '''
+    cycle.update(QUEUES)
+    backlog = {queue: deque() for queue in QUEUES}
+    waits = {queue: [] for queue in QUEUES}
+    for tick in range(ticks):
+        for queue in arrivals(tick):
+            backlog[queue].append(tick)
+        for queue in cycle.consume(len(QUEUES)):
+            if backlog[queue]:
+                waits[queue].append(tick - backlog[queue].popleft())
+                cycle.rotate(queue)
+                break
+    return waits
+
+
+def saturated_arrivals(tick):
+    # every queue always has work waiting
+    return QUEUES
+
+
+def mixed_arrivals(tick):
+    # a bulk low priority job on top of steady interactive traffic
+    queues = ['low_priority'] * 1000 if tick == 0 else []
+    if tick % 2 == 0:
+        queues.append('high_priority')
+    if tick % 4 == 0:
+        queues.append('default')
+    return queues
+
+
+def test_strategy_is_loadable_by_kombu():
+    assert cycle_by_name('project.queue_cycle:weighted_fair_cycle') is \
+        weighted_fair_cycle
+
+
+def test_backlogged_queues_are_served_by_weight():
+    waits = simulate(weighted_fair_cycle(weights=WEIGHTS),
+                     saturated_arrivals, 1000)
+
+    assert {queue: len(served) for queue, served in waits.items()} == \
+        {'high_priority': 600, 'default': 300, 'low_priority': 100}
+
+
+def test_mixed_load_latency():
+    weighted = simulate(weighted_fair_cycle(weights=WEIGHTS),
+                        mixed_arrivals, 5000)
+    round_robin = simulate(round_robin_cycle(), mixed_arrivals, 5000)
+
+    # round robin gives the bulk job a third of the slots, interactive
+    # traffic queues up behind it, weighted keeps up with it
+    assert max(weighted['high_priority']) <= 2
+    assert max(weighted['default']) <= 4
+    assert mean(round_robin['high_priority']) > \
+        10 * mean(weighted['high_priority'])
+
+    # and the bulk job still drains with the capacity left over
+    assert len(weighted['low_priority']) == 1000
+
+
+def test_starvation_bound():
+    cycle = weighted_fair_cycle(
+        weights={'high_priority': 1000, 'default': 1000, 'low_priority': 1},
+        starvation_bound=5
+    )
+    cycle.update(QUEUES)
+
+    firsts = [cycle.consume(len(QUEUES))[0] for _ in range(60)]
+
+    positions = [index for index, queue in enumerate(firsts)
+                 if queue == 'low_priority']
+    gaps = [later - earlier for earlier, later in zip(positions, positions[1:])]
+    assert positions[0] <= 5
+    assert max(gaps) <= 6
+
+
+def test_empty_turn_goes_to_next_heaviest():
+    cycle = weighted_fair_cycle(weights=WEIGHTS)
+    cycle.update(['low_priority', 'default', 'high_priority'])
+
+    for _ in range(10):
+        order = cycle.consume(3)
+        rest = [queue for queue in QUEUES if queue != order[0]]
+        assert order[1:] == rest
@@ -0,0 +1,52 @@
+import pytest
+from celery.exceptions import Retry
+
+from project.delayed import DELAYED_KEY
+from project.rate_limit import BUCKET_KEY, acquire, get_host, throttle
+from project.users.tasks import task_add_subscription
+
+
+@pytest.fixture
+def slow_host(settings, monkeypatch):
+    monkeypatch.setitem(settings.OUTBOUND_RATE_LIMITS, 'slow.example.com',
+                        {'rate': 0.1, 'burst': 2})
+    return 'slow.example.com'
+
+
+def test_get_host():
+    assert get_host('https://httpbin.org/delay/5') == 'httpbin.org'
+
+
+def test_acquire_takes_burst_then_waits(redis_client, slow_host):
+    assert acquire(slow_host) == 0
+    assert acquire(slow_host) == 0
+
+    wait = acquire(slow_host)
+    assert wait == pytest.approx(10, abs=0.5)
+    assert redis_client.ttl(BUCKET_KEY.format(slow_host)) > 0
+
+
+def test_acquire_unlisted_host_is_unlimited(redis_client):
+    for _ in range(100):
+        assert acquire('unlisted.example.com') == 0
+    assert not redis_client.keys()
+
+
+def test_throttle_reschedules_task(redis_client, slow_host,
+                                   delayed_delivery):
+    task_add_subscription.push_request(
+        id='task-id', args=[1], kwargs={}, retries=2, called_directly=False,
+        delivery_info={'exchange': '', 'routing_key': 'default'}
+    )
+    try:
+        throttle(task_add_subscription, slow_host)
+        throttle(task_add_subscription, slow_host)
+        with pytest.raises(Retry):
+            throttle(task_add_subscription, slow_host)
+    finally:
+        task_add_subscription.pop_request()
+
+    # parked by delayed delivery, retries are not used up
+    [member] = redis_client.zrange(DELAYED_KEY, 0, -1)
+    assert b'task-id' in member
+    assert b'"retries": 2' in member
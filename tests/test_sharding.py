@@ -0,0 +1,120 @@
+import asyncio
+from collections import Counter
+from unittest import mock
+
+import fakeredis
+import pytest
+from celery import states
+from kombu import Connection
+
+from project.sharding import HashRing, ShardedAMQP, ShardedRedisBackend
+
+
+NODES = ['redis://shard-0:6379/0', 'redis://shard-1:6379/0',
+         'redis://shard-2:6379/0']
+
+
+@pytest.fixture
+def backend(app):
+    backend = ShardedRedisBackend(app=app.celery_app, urls=NODES)
+    for node in backend.nodes.values():
+        node.client = fakeredis.FakeRedis()
+    return backend
+
+
+@pytest.fixture
+def sharded(app, backend, monkeypatch):
+    from project import sharding
+    monkeypatch.setattr(sharding, 'ring', HashRing(NODES))
+    monkeypatch.setattr(app.celery_app._local, 'backend', backend,
+                        raising=False)
+    return backend
+
+
+def test_ring_spreads_keys_evenly():
+    ring = HashRing(NODES)
+    counts = Counter(ring.get_node(f'task-{number}') for number in range(9000))
+
+    assert set(counts) == set(NODES)
+    assert all(2400 < count < 3600 for count in counts.values())
+
+
+def test_ring_only_moves_keys_of_removed_node():
+    before = HashRing(NODES)
+    after = HashRing(NODES[:2])
+
+    for number in range(3000):
+        node = before.get_node(f'task-{number}')
+        if node != NODES[2]:
+            assert after.get_node(f'task-{number}') == node
+
+
+def test_ring_without_nodes():
+    assert HashRing([]).get_node('task-id') is None
+
+
+def test_results_live_on_their_shard(backend):
+    task_ids = [f'task-{number}' for number in range(30)]
+    for task_id in task_ids:
+        backend.store_result(task_id, task_id.upper(), states.SUCCESS)
+
+    for task_id in task_ids:
+        key = backend.get_key_for_task(task_id)
+        holders = [url for url, node in backend.nodes.items()
+                   if node.client.exists(key)]
+        assert holders == [backend.ring.get_node(task_id)]
+        assert backend.get_task_meta(task_id)['result'] == task_id.upper()
+
+    keys = [backend.get_key_for_task(task_id) for task_id in task_ids]
+    assert [value is not None for value in backend.mget(keys)] == \
+        [True] * len(task_ids)
+
+
+def test_get_task_info_routes_to_shard(sharded):
+    from project.celery_utils import get_task_info
+
+    sharded.store_result('task-ok', 1, states.SUCCESS)
+    sharded.store_result('task-failed', ValueError('boom'), states.FAILURE)
+
+    assert get_task_info('task-ok') == {'state': 'SUCCESS'}
+    assert get_task_info('task-failed') == {'state': 'FAILURE', 'error': 'boom'}
+
+
+def test_status_is_published_on_task_shard(sharded, monkeypatch):
+    from project import shard_broadcasts
+    from project.ws import views
+
+    broadcasts = {url: mock.AsyncMock() for url in NODES}
+    monkeypatch.setattr(views, 'shard_broadcasts', broadcasts)
+    monkeypatch.setattr(views, 'broadcast', mock.AsyncMock())
+    sharded.store_result('task-ok', 1, states.SUCCESS)
+
+    asyncio.run(views.update_celery_task_status('task-ok'))
+
+    node = sharded.ring.get_node('task-ok')
+    broadcasts[node].publish.assert_awaited_once_with(
+        channel='task-ok', message='{"state": "SUCCESS"}')
+    for url, other in broadcasts.items():
+        if url != node:
+            other.publish.assert_not_awaited()
+    views.broadcast.publish.assert_not_awaited()
+    assert shard_broadcasts == {}  # sharding is off in the settings
+
+
+def test_mapped_queue_is_published_to_its_node(app, settings, monkeypatch):
+    monkeypatch.setitem(settings.QUEUE_REDIS_NODES, 'low_priority',
+                        'memory://')
+    amqp = ShardedAMQP(app.celery_app)
+    default_producer = mock.MagicMock()
+
+    message = amqp.as_task_v2('task-id', 'low_priority:example', args=(1,))
+    amqp.send_task_message(default_producer, 'low_priority:example', message,
+                           queue='low_priority')
+
+    default_producer.publish.assert_not_called()
+    with Connection('memory://') as connection:
+        queue = connection.SimpleQueue('low_priority')
+        received = queue.get(timeout=1)
+        assert received.headers['id'] == 'task-id'
+        received.ack()
+        queue.close()
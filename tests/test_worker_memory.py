@@ -0,0 +1,75 @@
+from unittest import mock
+from collections import Counter, defaultdict
+
+import pytest
+
+from project import worker_memory
+
+
+leaked = []
+
+
+@pytest.fixture(autouse=True)
+def reset_stats(monkeypatch):
+    monkeypatch.setattr(worker_memory, '_stats', defaultdict(
+        worker_memory._stats.default_factory))
+    monkeypatch.setattr(worker_memory, '_allocators', defaultdict(Counter))
+
+
+def run_task(name, task_id, func):
+    task = mock.MagicMock()
+    task.name = name
+    worker_memory.start_memory_accounting(task_id=task_id, task=task)
+    func()
+    worker_memory.finish_memory_accounting(task_id=task_id, task=task)
+
+
+def test_rss_delta_is_recorded_per_task(monkeypatch):
+    rss = iter([100, 150, 150, 400])
+    monkeypatch.setattr(worker_memory, 'get_rss', lambda: next(rss))
+
+    run_task('thumbnail', 'id-1', lambda: None)
+    run_task('thumbnail', 'id-2', lambda: None)
+
+    assert worker_memory.get_memory_stats()['thumbnail'] == {
+        'count': 2, 'rss_delta': 300, 'max_rss_delta': 250,
+        'top_allocators': []
+    }
+
+
+def test_sampled_tasks_report_top_allocators(settings, monkeypatch):
+    monkeypatch.setattr(settings, 'WORKER_TRACEMALLOC_SAMPLE_RATE', 1.0)
+
+    run_task('leaky', 'id-1', lambda: leaked.append(bytearray(1024 * 1024)))
+
+    [(location, size)] = worker_memory.get_memory_stats()['leaky'][
+        'top_allocators'][:1]
+    assert location.startswith(__file__)
+    assert size >= 1024 * 1024
+
+
+def test_report_is_logged_periodically(settings, monkeypatch):
+    monkeypatch.setattr(settings, 'WORKER_MEMORY_REPORT_EVERY', 1)
+    with mock.patch.object(worker_memory, 'logger') as mock_logger:
+        run_task('task_schedule_work', 'id-1', lambda: None)
+
+    assert mock_logger.info.call_args.args[2] == 'task_schedule_work'
+
+
+def test_report_logs_the_tasks_that_grew_most(settings, monkeypatch):
+    monkeypatch.setattr(settings, 'WORKER_MEMORY_REPORT_TASKS', 2)
+    monkeypatch.setattr(settings, 'WORKER_MEMORY_TOP_ALLOCATORS', 1)
+    rss = iter([0, 10, 0, 30, 0, 20])
+    monkeypatch.setattr(worker_memory, 'get_rss', lambda: next(rss))
+    for name in ('small', 'large', 'medium'):
+        run_task(name, 'id', lambda: None)
+
+    with mock.patch.object(worker_memory, 'logger') as mock_logger:
+        worker_memory.report()
+
+    assert [call.args[2] for call in mock_logger.info.call_args_list] == \
+        ['large', 'medium']
+
+
+def test_get_rss():
+    assert worker_memory.get_rss() > 0
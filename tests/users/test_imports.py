@@ -0,0 +1,111 @@
+import pytest
+
+from project.users.imports import (
+    import_chunk, import_progress, plan_chunks, read_chunk, validate_rows
+)
+from project.users.models import User, UserImport, UserImportChunk
+
+
+CSV = (
+    'email,username\n'
+    'alice@example.com,alice\n'
+    'bob@example.com,bob\n'
+    'not-an-email,carol\n'
+    'dave@example.com,dave\n'
+    'alice@example.com,alice\n'
+)
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'users.csv'
+    path.write_text(CSV)
+    return str(path)
+
+
+@pytest.fixture
+def user_import(db_session, csv_path):
+    columns, chunks = plan_chunks(csv_path, chunk_size=2)
+    user_import = UserImport(filename='users.csv', path=csv_path,
+                             columns=columns, chunk_size=2,
+                             total_chunks=len(chunks))
+    db_session.add(user_import)
+    db_session.commit()
+    return user_import, chunks
+
+
+def test_plan_chunks(csv_path):
+    columns, chunks = plan_chunks(csv_path, chunk_size=2)
+
+    assert columns == ['email', 'username']
+    assert len(chunks) == 3
+    rows = [row for start, end in chunks
+            for row in read_chunk(csv_path, start, end, columns)]
+    assert [row['username'] for row in rows] == \
+        ['alice', 'bob', 'carol', 'dave', 'alice']
+
+
+def test_validate_rows():
+    users, errors = validate_rows([
+        {'username': 'alice', 'email': 'alice@example.com'},
+        {'username': 'bob', 'email': 'nope'},
+        {'username': 'carol', 'email': None},
+        {'username': 'dave', 'email': 'dave@example.com', None: ['extra']},
+    ])
+
+    assert [user['username'] for user in users] == ['alice', 'dave']
+    assert [error['row'] for error in errors] == [1, 2]
+
+
+def test_import_chunks_with_checkpoints(db_session, user_import):
+    user_import, chunks = user_import
+
+    for chunk, (start, end) in enumerate(chunks):
+        import_chunk(db_session, user_import, chunk, start, end)
+    # running a chunk again is a no-op
+    start, end = chunks[0]
+    import_chunk(db_session, user_import, 0, start, end)
+
+    assert sorted(u.username for u in db_session.query(User)) == \
+        ['alice', 'bob', 'dave']
+    assert db_session.query(UserImportChunk).count() == 3
+    assert import_progress(db_session, user_import) == {
+        'import_id': user_import.id,
+        'status': 'done',
+        'total_chunks': 3,
+        'done_chunks': 3,
+        'rows': 5,
+        'inserted': 3,
+        'skipped': 1,
+        'invalid': 1,
+    }
+
+
+def test_plan_task_resumes_pending_chunks(db_session, user_import, monkeypatch):
+    from unittest import mock
+    from project.users import tasks
+
+    user_import, chunks = user_import
+    start, end = chunks[1]
+    import_chunk(db_session, user_import, 1, start, end)
+
+    mock_group = mock.MagicMock(name='group')
+    monkeypatch.setattr(tasks, 'group', mock_group)
+
+    assert tasks.plan_user_import(user_import.id) == 2
+    [signatures], _ = mock_group.call_args
+    assert [signature.args[1] for signature in signatures] == [0, 2]
+    mock_group.return_value.apply_async.assert_called_once()
+
+
+def test_import_chunk_task(db_session, user_import):
+    from project.users.tasks import import_user_chunk
+
+    user_import, chunks = user_import
+    start, end = chunks[0]
+
+    assert import_user_chunk(user_import.id, 0, start, end) == \
+        {'rows': 2, 'inserted': 2, 'invalid': 0}
+    assert import_user_chunk(user_import.id, 0, start, end) == \
+        {'rows': 2, 'inserted': 2, 'invalid': 0}
+    assert db_session.query(User).count() == 2
@@ -3,11 +3,12 @@ import requests
 from unittest import mock
 from celery.exceptions import Retry
 
+from project.celery_utils import BatchRequest
 from project.users.factories import UserFactory
-from project.users.tasks import task_add_subscription
+from project.users.tasks import task_add_subscription, task_send_welcome_email
 
 
-def test_post_succeed(db_session, monkeypatch, user):
+def test_post_succeed(db_session, settings, monkeypatch, user):
     mock_requests_post = mock.MagicMock()
     monkeypatch.setattr(requests, 'post', mock_requests_post)
 
@@ -15,7 +16,8 @@ def test_post_succeed(db_session, monkeypatch, user):
 
     mock_requests_post.assert_called_with(
         'https://httpbin.org/delay/5',
-        data={'email': user.email}
+        data={'email': user.email},
+        timeout=settings.OUTBOUND_HTTP_TIMEOUT
     )
 
 
@@ -39,3 +41,17 @@ def test_exception(db_session, monkeypatch, user):
 
     with pytest.raises(Retry):
         task_add_subscription(user.id)
+
+
+def test_send_welcome_email_batch(db_session, user_factory):
+    users = user_factory.create_batch(3)
+    requests = [
+        BatchRequest(f'id-{user.id}', task_send_welcome_email.name, (user.id,), {})
+        for user in users
+    ]
+
+    with mock.patch('project.users.tasks.logger') as mock_logger:
+        task_send_welcome_email.run(requests)
+
+    assert sorted(c.args[1:] for c in mock_logger.info.call_args_list) == \
+        sorted((user.email, user.id) for user in users)
@@ -1,10 +1,22 @@
+import time
+import pytest
 import requests
 from unittest import mock
 from fastapi.testclient import TestClient
 
+from project import exports
+from project.deadline import DEADLINE_HEADER
 from project.users.models import User
 from project.users import users_router, tasks
 from project.users.factories import UserFactory
+from project.lookup_cache import MISSING
+from project.users.views import username_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_username_cache():
+    # ids are only valid for the database of one test
+    username_cache.clear()
 
 
 def test_pytest_setup(client: TestClient, db_session):
@@ -43,7 +55,8 @@ def test_view_with_eager_mode(client, db_session, settings, monkeypatch):
 
     mock_requests_post.assert_called_with(
         'https://httpbin.org/delay/5',
-        data={'email': user_email}
+        data={'email': user_email},
+        timeout=settings.OUTBOUND_HTTP_TIMEOUT
     )
 
 
@@ -68,3 +81,179 @@ def test_user_subscribtion_view(client, db_session, settings, monkeypatch, user_
     # query from the db again
     user = db_session.query(User).filter_by(username=user.username).first()
     task_add_subscription.assert_called_with(user.id)
+
+
+def test_repeat_subscription_uses_username_cache(client, db_session,
+                                                 monkeypatch, user_factory):
+    user = user_factory.build()
+    task_add_subscription = mock.MagicMock(name='task_add_subscription')
+    monkeypatch.setattr(tasks.task_add_subscription,
+                        'delay', task_add_subscription)
+
+    for _ in range(3):
+        response = client.post(
+            users_router.url_path_for('user_subscription'),
+            json={'email': user.email, 'username': user.username}
+        )
+        assert response.status_code == 200
+
+    user_id = db_session.query(User.id).filter_by(
+        username=user.username).scalar()
+    assert [c.args for c in task_add_subscription.call_args_list] == \
+        [(user_id,)] * 3
+
+    response = client.get(users_router.url_path_for('username_cache_stats'))
+    assert response.json() == {
+        'hits': 2, 'misses': 1, 'hit_ratio': 2 / 3, 'size': 1}
+
+
+def test_username_cache_hit_opens_no_read_session(client, db_session,
+                                                  monkeypatch, user_factory):
+    user = user_factory.create()
+    monkeypatch.setattr(tasks.task_add_subscription, 'delay', mock.MagicMock())
+    username_cache.set(user.username, user.id)
+    monkeypatch.setattr(
+        'project.users.views.read_db_context',
+        mock.MagicMock(side_effect=AssertionError))
+
+    response = client.post(
+        users_router.url_path_for('user_subscription'),
+        json={'email': user.email, 'username': user.username}
+    )
+    assert response.status_code == 200
+
+
+def test_username_cache_is_invalidated_on_write(db_session):
+    renamed = User(username='renamed', email='renamed@example.com')
+    deleted = User(username='deleted', email='deleted@example.com')
+    db_session.add_all([renamed, deleted])
+    db_session.commit()
+    old_username = renamed.username
+    username_cache.set(old_username, renamed.id)
+    username_cache.set('new-name', None)
+    username_cache.set(deleted.username, deleted.id)
+
+    renamed.username = 'new-name'
+    db_session.commit()
+    assert username_cache.get(old_username) is MISSING
+    assert username_cache.get('new-name') is MISSING
+    assert username_cache.get(deleted.username) == deleted.id
+
+    db_session.delete(deleted)
+    db_session.commit()
+    assert username_cache.get(deleted.username) is MISSING
+
+
+def test_list_users_keyset_pagination(client, db_session, user_factory):
+    users = user_factory.create_batch(5)
+    url = users_router.url_path_for('list_users')
+
+    response = client.get(url, params={'limit': 2})
+    page = response.json()
+    assert response.status_code == 200
+    assert [u['id'] for u in page['results']] == [users[0].id, users[1].id]
+
+    seen = [u['id'] for u in page['results']]
+    while page['next_cursor']:
+        page = client.get(
+            url, params={'limit': 2, 'cursor': page['next_cursor']}).json()
+        seen += [u['id'] for u in page['results']]
+    assert seen == sorted(user.id for user in users)
+
+
+def test_list_users_prefix_filter(client, db_session, user_factory):
+    user_factory(username='alice', email='alice@example.com')
+    user_factory(username='alina', email='lina@example.com')
+    user_factory(username='al%ce', email='other@example.com')
+    url = users_router.url_path_for('list_users')
+
+    response = client.get(url, params={'username': 'ali'})
+    assert [u['username'] for u in response.json()['results']] == \
+        ['alice', 'alina']
+
+    response = client.get(url, params={'username': 'al%'})
+    assert [u['username'] for u in response.json()['results']] == ['al%ce']
+
+    response = client.get(url, params={'email': 'lina@'})
+    assert [u['username'] for u in response.json()['results']] == ['alina']
+
+
+def test_user_import_upload(client, db_session, settings, monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, 'USER_IMPORT_DIR', str(tmp_path))
+    plan_user_import = mock.MagicMock(name='plan_user_import')
+    monkeypatch.setattr(tasks.plan_user_import, 'delay', plan_user_import)
+
+    response = client.post(
+        users_router.url_path_for('create_user_import'),
+        files={'upload_file': ('users.csv', b'username,email\nbob,bob@example.com\n')}
+    )
+
+    assert response.status_code == 200
+    progress = response.json()
+    assert progress['status'] == 'planning'
+    plan_user_import.assert_called_once_with(progress['import_id'])
+    [path] = tmp_path.iterdir()
+    assert path.read_bytes() == b'username,email\nbob,bob@example.com\n'
+
+    response = client.get(users_router.url_path_for(
+        'user_import_progress', import_id=progress['import_id']))
+    assert response.json() == progress
+
+
+def test_user_import_upload_needs_columns(client, db_session, settings,
+                                          monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, 'USER_IMPORT_DIR', str(tmp_path))
+
+    response = client.post(
+        users_router.url_path_for('create_user_import'),
+        files={'upload_file': ('users.csv', b'name\nbob\n')}
+    )
+
+    assert response.status_code == 400
+    assert not list(tmp_path.iterdir())
+
+
+def test_export_users(client, db_session, user_factory):
+    users = user_factory.create_batch(3)
+
+    response = client.get(
+        users_router.url_path_for('export_users'), params={'format': 'csv'})
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/csv')
+    assert response.text.splitlines() == ['id,username,email'] + [
+        f'{u.id},{u.username},{u.email}' for u in users
+    ]
+
+    response = client.get(
+        users_router.url_path_for('export_users'), params={'format': 'xml'})
+    assert response.status_code == 400
+
+
+def test_queue_users_export(client, db_session, monkeypatch):
+    export_table = mock.MagicMock(name='export_table')
+    export_table.return_value.task_id = 'task-id'
+    monkeypatch.setattr(exports.export_table, 'delay', export_table)
+
+    response = client.post(users_router.url_path_for('queue_users_export'))
+
+    filename = response.json()['filename']
+    assert response.json()['task_id'] == 'task-id'
+    assert filename.startswith('users-') and filename.endswith('.ndjson')
+    export_table.assert_called_once_with('users', 'ndjson', filename)
+
+
+def test_form_task_gets_a_deadline(client, settings, monkeypatch):
+    apply_async = mock.MagicMock(name='apply_async')
+    apply_async.return_value.task_id = 'task-id'
+    monkeypatch.setattr(tasks.sample_task, 'apply_async', apply_async)
+
+    response = client.post(
+        users_router.url_path_for('form_example_post'),
+        json={'username': 'bob', 'email': 'bob@example.com'})
+
+    assert response.json() == {'task_id': 'task-id'}
+    args, options = apply_async.call_args
+    assert args == (('bob@example.com',),)
+    assert options['headers'][DEADLINE_HEADER] == pytest.approx(
+        time.time() + settings.USERS_FORM_DEADLINE, abs=1)
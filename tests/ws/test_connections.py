@@ -0,0 +1,132 @@
+import asyncio
+import contextlib
+from unittest import mock
+
+import pytest
+from starlette.websockets import WebSocketState
+
+from project.ws import connections
+from project.ws.connections import PING, StatusConnection
+
+
+class FakeWebSocket:
+
+    def __init__(self, send_delay=0, answer_pings=False):
+        self.sent = []
+        self.closed_with = None
+        self.client_state = WebSocketState.CONNECTED
+        self.send_delay = send_delay
+        self.answer_pings = answer_pings
+        self.incoming = asyncio.Queue()
+
+    async def send_json(self, message):
+        await asyncio.sleep(self.send_delay)
+        self.sent.append(message)
+        if message == PING and self.answer_pings:
+            self.incoming.put_nowait({'type': 'websocket.receive',
+                                      'text': 'pong'})
+
+    async def receive(self):
+        return await self.incoming.get()
+
+    async def close(self, code=1000):
+        self.closed_with = code
+        self.client_state = WebSocketState.DISCONNECTED
+
+
+@pytest.fixture(autouse=True)
+def stats(monkeypatch):
+    stats = connections.stats.__class__()
+    monkeypatch.setattr(connections, 'stats', stats)
+    return stats
+
+
+def make_connection(websocket, **kwargs):
+    options = dict(max_queue=2, ping_interval=10, idle_timeout=30,
+                   send_timeout=1)
+    options.update(kwargs)
+    return StatusConnection(websocket, **options)
+
+
+async def relay_for(connection, messages, seconds):
+    for message in messages:
+        connection.put(message)
+        await asyncio.sleep(0)
+    await asyncio.sleep(seconds)
+
+
+def test_full_queue_coalesces_to_latest(stats):
+    connection = make_connection(FakeWebSocket())
+    for state in ('PENDING', 'STARTED', 'RETRY', 'SUCCESS'):
+        connection.put({'state': state})
+
+    assert list(connection._queue) == [{'state': 'RETRY'}, {'state': 'SUCCESS'}]
+    assert stats['coalesced'] == 2
+
+
+def test_statuses_are_sent_in_order(stats):
+    websocket = FakeWebSocket()
+    connection = make_connection(websocket)
+    messages = [{'state': 'STARTED'}, {'state': 'SUCCESS'}]
+
+    asyncio.run(connection.serve(relay_for(connection, messages, 0.05)))
+
+    assert websocket.sent == messages
+    assert websocket.closed_with == 1001
+    assert stats['closed_idle'] == stats['closed_slow'] == 0
+
+
+def test_silent_client_is_closed(stats):
+    websocket = FakeWebSocket()
+    connection = make_connection(websocket, ping_interval=0.01,
+                                 idle_timeout=0.05)
+
+    asyncio.run(connection.serve(relay_for(connection, [], 5)))
+
+    assert PING in websocket.sent
+    assert websocket.closed_with == 1001
+    assert stats['closed_idle'] == 1
+
+
+def test_answered_pings_keep_connection_open(stats):
+    websocket = FakeWebSocket(answer_pings=True)
+    connection = make_connection(websocket, ping_interval=0.01,
+                                 idle_timeout=0.05)
+
+    asyncio.run(connection.serve(relay_for(connection, [], 0.2)))
+
+    assert websocket.sent.count(PING) > 5
+    assert stats['closed_idle'] == 0
+
+
+def test_slow_client_is_closed(stats):
+    websocket = FakeWebSocket(send_delay=1)
+    connection = make_connection(websocket, send_timeout=0.05)
+    messages = [{'state': 'STARTED'}, {'state': 'RETRY'}, {'state': 'SUCCESS'}]
+
+    asyncio.run(connection.serve(relay_for(connection, messages, 5)))
+
+    assert websocket.closed_with == 1001
+    assert stats['closed_slow'] == 1
+    assert stats['dropped'] + stats['coalesced'] >= 1
+
+
+def test_ws_task_status(client, monkeypatch):
+    from project.ws import views
+
+    @contextlib.asynccontextmanager
+    async def subscribe(channel):
+        async def events():
+            yield mock.Mock(message='{"state": "SUCCESS"}')
+            await asyncio.sleep(60)
+        yield events()
+
+    monkeypatch.setattr(views, 'broadcast', mock.Mock(subscribe=subscribe))
+    monkeypatch.setattr(views, 'get_task_info',
+                        lambda task_id: {'state': 'PENDING'})
+
+    with client.websocket_connect('/ws/task_status/task-id') as websocket:
+        assert websocket.receive_json() == {'state': 'PENDING'}
+        assert websocket.receive_json() == {'state': 'SUCCESS'}
+
+    assert client.get('/ws/stats').status_code == 200